@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""A local stand in for the GitLab REST API, used by the benchmarks. It only implements the endpoints the tool uses.
+Every response is delayed by `latency` seconds, to simulate a real (busy) GitLab instance.
+
+"""
+import collections
+import gzip
+import hashlib
+import json
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+ROUTES = (
+    ("GET", "user", re.compile(r"^/api/v4/user$")),
+    ("GET", "project", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)$")),
+    ("GET", "release", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases/(?P<tag>[^/]+)$")),
+    ("GET", "releases", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases$")),
+    ("POST", "create_release", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases$")),
+    ("PUT", "update_release", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases/(?P<tag>[^/]+)$")),
+    ("POST", "create_link", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases/(?P<tag>[^/]+)/assets/links$")),
+    (
+        "PUT",
+        "update_link",
+        re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases/(?P<tag>[^/]+)/assets/links/(?P<link>\d+)$"),
+    ),
+    (
+        "DELETE",
+        "delete_link",
+        re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/releases/(?P<tag>[^/]+)/assets/links/(?P<link>\d+)$"),
+    ),
+    ("GET", "tags", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/repository/tags$")),
+    ("GET", "commits", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/repository/commits$")),
+    ("GET", "compare", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/repository/compare$")),
+    ("GET", "merge_requests", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/merge_requests$")),
+    ("GET", "pipeline", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/pipelines/(?P<pipeline>\d+)$")),
+    ("GET", "jobs", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/pipelines/(?P<pipeline>\d+)/jobs$")),
+    ("GET", "job", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/jobs/(?P<job>\d+)$")),
+    ("GET", "bridges", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/pipelines/(?P<pipeline>\d+)/bridges$")),
+    ("GET", "packages", re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/packages$")),
+    (
+        "GET",
+        "package_files",
+        re.compile(r"^/api/v4/projects/(?P<project>[^/]+)/packages/(?P<package>\d+)/package_files$"),
+    ),
+    (
+        "HEAD",
+        "download",
+        re.compile(
+            r"^/api/v4/projects/(?P<project>[^/]+)/packages/generic/(?P<package>[^/]+)/(?P<version>[^/]+)/(?P<file>[^/]+)$"
+        ),
+    ),
+    (
+        "GET",
+        "file",
+        re.compile(
+            r"^/api/v4/projects/(?P<project>[^/]+)/packages/generic/(?P<package>[^/]+)/(?P<version>[^/]+)/(?P<file>[^/]+)$"
+        ),
+    ),
+    (
+        "PUT",
+        "upload",
+        re.compile(
+            r"^/api/v4/projects/(?P<project>[^/]+)/packages/generic/(?P<package>[^/]+)/(?P<version>[^/]+)/(?P<file>[^/]+)$"
+        ),
+    ),
+)
+CHILD_PIPELINES = 10**9
+CHUNK_SIZE = 1024 * 1024
+# Uploads up to this size are kept, so they can be downloaded again, i.e. the files of the package index.
+MAX_KEPT_SIZE = 64 * 1024
+
+
+def get_sha(tag, commit):
+    return f"{tag:08x}{commit:032x}"
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockGitlab:
+    """The mock GitLab server, runs in a background thread.
+
+    Args:
+        latency (float): How long to wait before each response, in seconds.
+        jobs (int): How many jobs each pipeline has.
+        tags (int): How many tags each project has.
+        max_per_page (int): The most items GitLab returns in a page.
+        children (int): How many child pipelines each pipeline triggers, the jobs in child pipeline `n` are named
+            child-n-job-0 etc.
+        running_polls (int): How many times each job has to be fetched before it succeeds, until then it's running.
+        commits (int): How many commits there are between each tag and the one before it, every other commit was
+            merged by a merge request.
+        gzip (bool): Gzip responses for clients which accept it, like GitLab does.
+
+    """
+
+    def __init__(
+        self, latency=0.0, jobs=100, tags=100, max_per_page=100, children=0, running_polls=0, commits=10, gzip=False
+    ):
+        self.latency = latency
+        self.gzip = gzip
+        self.commits = commits
+        self.jobs = jobs
+        self.children = children
+        self.running_polls = running_polls
+        self.job_polls = collections.Counter()
+        self.tags = tags
+        self.max_per_page = max_per_page
+        self.requests = collections.Counter()
+        self.connections = 0
+        self._link_ids = 0
+        self.releases = {}
+        self.packages = {}
+        self.package_files = collections.defaultdict(dict)
+        self.contents = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.connections = 0
+            self.releases.clear()
+            self.packages.clear()
+            self.package_files.clear()
+            self.contents.clear()
+            self.job_polls.clear()
+
+    def handle(self, method, path, query, body, etag=None):
+        """Gets the response for a request, `etag` is the `If-None-Match` header which only jobs support.
+
+        Returns
+            tuple: The status code, JSON body and extra headers.
+
+        """
+        for route_method, name, pattern in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                with self._lock:
+                    self.requests[name] += 1
+                params = match.groupdict()
+                if name == "job":
+                    params["etag"] = etag
+                return getattr(self, f"_{name}")(query, body, **params)
+
+        with self._lock:
+            self.requests["not_found"] += 1
+        return 404, {"message": "404 Not Found"}, {}
+
+    def _user(self, query, body):
+        return 200, {"id": 1, "username": "release-bot"}, {}
+
+    def _project(self, query, body, project):
+        return 200, {"id": int(project), "path_with_namespace": f"group/project-{project}"}, {}
+
+    def _release(self, query, body, project, tag):
+        tag = urllib.parse.unquote(tag)
+        if (project, tag) in self.releases:
+            return 200, self.releases[project, tag], {}
+        return 404, {"message": "404 Not Found"}, {}
+
+    def _releases(self, query, body, project):
+        releases = [{"tag_name": tag} for release_project, tag in sorted(self.releases) if release_project == project]
+        return self._paginate(query, releases)
+
+    def _create_release(self, query, body, project):
+        release = json.loads(body)
+        with self._lock:
+            if (project, release["tag_name"]) in self.releases:
+                return 409, {"message": "Release already exists"}, {}
+            links = (release.get("assets") or {}).get("links") or []
+            release["assets"] = {"links": [dict(link, id=self._next_id()) for link in links]}
+            self.releases[project, release["tag_name"]] = release
+        return 201, release, {}
+
+    def _update_release(self, query, body, project, tag):
+        release = self.releases.get((project, urllib.parse.unquote(tag)))
+        if release is None:
+            return 404, {"message": "404 Not Found"}, {}
+        with self._lock:
+            release.update(json.loads(body))
+        return 200, release, {}
+
+    def _create_link(self, query, body, project, tag):
+        release = self.releases.get((project, urllib.parse.unquote(tag)))
+        if release is None:
+            return 404, {"message": "404 Not Found"}, {}
+        link = json.loads(body)
+        with self._lock:
+            links = release["assets"]["links"]
+            if any(other["name"] == link["name"] or other["url"] == link["url"] for other in links):
+                return 400, {"message": "has already been taken"}, {}
+            link["id"] = self._next_id()
+            links.append(link)
+        return 201, link, {}
+
+    def _update_link(self, query, body, project, tag, link):
+        release = self.releases.get((project, urllib.parse.unquote(tag))) or {"assets": {"links": []}}
+        for current in release["assets"]["links"]:
+            if current["id"] == int(link):
+                with self._lock:
+                    current.update(json.loads(body))
+                return 200, current, {}
+        return 404, {"message": "404 Not Found"}, {}
+
+    def _delete_link(self, query, body, project, tag, link):
+        release = self.releases.get((project, urllib.parse.unquote(tag))) or {"assets": {"links": []}}
+        links = release["assets"]["links"]
+        for current in list(links):
+            if current["id"] == int(link):
+                with self._lock:
+                    links.remove(current)
+                return 200, current, {}
+        return 404, {"message": "404 Not Found"}, {}
+
+    def _next_id(self):
+        self._link_ids += 1
+        return self._link_ids
+
+    def _tags(self, query, body, project):
+        tags = [
+            {
+                "name": f"release/{tag}.0.0",
+                "commit": {"id": get_sha(tag, 0), "committed_date": f"2020-01-01T00:{tag % 60:02}:00Z"},
+            }
+            for tag in range(self.tags, 0, -1)
+        ]
+        return self._paginate(query, tags)
+
+    def _compare(self, query, body, project):
+        """The commits between two tags, tag `n` is the first commit of range `n`, oldest first."""
+        start, end = int(query["from"][0][:8], 16), int(query["to"][0][:8], 16)
+        commits = []
+        for tag in range(end, start, -1):
+            for commit in range(self.commits - 1, -1, -1):
+                parent = get_sha(tag, commit + 1) if commit + 1 < self.commits else get_sha(tag - 1, 0)
+                commits.append(
+                    {
+                        "id": get_sha(tag, commit),
+                        "short_id": get_sha(tag, commit)[:8],
+                        "title": f"{('feat', 'fix', 'docs', 'Update')[commit % 4]}: change {commit}",
+                        "message": "",
+                        "parent_ids": [parent],
+                    }
+                )
+        return 200, {"commit": {"id": get_sha(end, 0)}, "commits": commits, "diffs": []}, {}
+
+    def _commits(self, query, body, project):
+        """The commits up to the first tag, the only tag without a previous tag to compare with."""
+        _, compare, _ = self._compare({"from": [get_sha(0, 0)], "to": [get_sha(1, 0)]}, body, project)
+        return self._paginate(query, list(reversed(compare["commits"])))
+
+    def _merge_requests(self, query, body, project):
+        merge_requests = [
+            {
+                "iid": self.tags * self.commits + commit,
+                "title": f"feat: merge request {commit}",
+                "labels": ["feature"],
+                "squash_commit_sha": get_sha(self.tags, commit),
+                "sha": get_sha(self.tags, commit),
+                "merge_commit_sha": None,
+            }
+            for commit in range(0, self.commits, 2)
+        ]
+        return self._paginate(query, merge_requests)
+
+    def _pipeline(self, query, body, project, pipeline):
+        return 200, {"id": int(pipeline), "status": "success"}, {}
+
+    def _jobs(self, query, body, project, pipeline):
+        pipeline = int(pipeline)
+        prefix = f"child-{pipeline % 100}-" if pipeline >= CHILD_PIPELINES else ""
+        jobs = [
+            {
+                "id": pipeline % CHILD_PIPELINES * 100000 + job,
+                "name": f"{prefix}job-{job}",
+                "status": self._job_status(pipeline % CHILD_PIPELINES * 100000 + job),
+                "web_url": f"{self.url}/group/project-{project}/-/jobs/{pipeline * 100000 + job}",
+            }
+            for job in range(self.jobs - 1, -1, -1)
+        ]
+        return self._paginate(query, jobs)
+
+    def _job(self, query, body, project, job, etag=None):
+        job = int(job)
+        with self._lock:
+            self.job_polls[job] += 1
+        data = {"id": job, "status": self._job_status(job)}
+        tag = f'W/"{job}-{data["status"]}"'
+        if etag == tag:
+            return 304, None, {"ETag": tag}
+        return 200, data, {"ETag": tag}
+
+    def _job_status(self, job):
+        return "success" if self.job_polls[job] >= self.running_polls else "running"
+
+    def _bridges(self, query, body, project, pipeline):
+        if int(pipeline) >= CHILD_PIPELINES:
+            return self._paginate(query, [])
+        bridges = [
+            {
+                "id": int(pipeline) * 100000 + self.jobs + child,
+                "name": f"trigger-{child}",
+                "downstream_pipeline": {
+                    "id": CHILD_PIPELINES + int(pipeline) * 100 + child,
+                    "project_id": int(project),
+                },
+            }
+            for child in range(1, self.children + 1)
+        ]
+        return self._paginate(query, bridges)
+
+    def _packages(self, query, body, project):
+        name = query.get("package_name", [None])[0]
+        package_version = query.get("package_version", [None])[0]
+        packages = [
+            {"id": package_id, "name": package, "version": version, "package_type": "generic"}
+            for (package_project, package, version), package_id in sorted(self.packages.items())
+            if package_project == project and name in (None, package) and package_version in (None, version)
+        ]
+        return self._paginate(query, packages)
+
+    def _package_files(self, query, body, project, package):
+        return self._paginate(query, list(self.package_files[int(package)].values()))
+
+    def _download(self, query, body, project, package, version, file):
+        package_id = self.packages.get((project, urllib.parse.unquote(package), urllib.parse.unquote(version)))
+        if package_id and urllib.parse.unquote(file) in self.package_files[package_id]:
+            return 200, None, {}
+        return 404, {"message": "404 Not Found"}, {}
+
+    def _file(self, query, body, project, package, version, file):
+        package_id = self.packages.get((project, urllib.parse.unquote(package), urllib.parse.unquote(version)))
+        content = self.contents.get((package_id, urllib.parse.unquote(file)))
+        if content is None:
+            return 404, {"message": "404 Not Found"}, {}
+        return 200, json.loads(content), {}
+
+    def _upload(self, query, body, project, package, version, file):
+        """The body of an upload is hashed as it is received instead of being stored (unless it's small), see
+        `Handler._read_body`."""
+        sha256, size, content = body
+        key = (project, urllib.parse.unquote(package), urllib.parse.unquote(version))
+        file_name = urllib.parse.unquote(file)
+        with self._lock:
+            package_id = self.packages.setdefault(key, len(self.packages) + 1)
+            package_file = {"id": len(self.package_files[package_id]) + 1, "file_name": file_name, "size": size}
+            package_file["file_sha256"] = sha256
+            self.package_files[package_id][file_name] = package_file
+            if content is not None:
+                self.contents[package_id, file_name] = content
+        return 201, package_file if query.get("select") == ["package_file"] else {"message": "201 Created"}, {}
+
+    def _paginate(self, query, items):
+        page = int(query.get("page", ["1"])[0])
+        per_page = min(int(query.get("per_page", ["20"])[0]), self.max_per_page)
+        total_pages = max((len(items) + per_page - 1) // per_page, 1)
+        headers = {"X-Page": str(page), "X-Per-Page": str(per_page), "X-Total": str(len(items))}
+        headers["X-Total-Pages"] = str(total_pages)
+        if page < total_pages:
+            headers["X-Next-Page"] = str(page + 1)
+        return 200, items[(page - 1) * per_page : page * per_page], headers
+
+    def _get_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._respond()
+
+            def do_POST(self):
+                self._respond()
+
+            def do_PUT(self):
+                self._respond()
+
+            def do_DELETE(self):
+                self._respond()
+
+            def do_HEAD(self):
+                self._respond()
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with mock._lock:
+                    mock.connections += 1
+
+            def _respond(self):
+                url = urllib.parse.urlsplit(self.path)
+                body = self._read_body()
+                time.sleep(mock.latency)
+
+                query = urllib.parse.parse_qs(url.query)
+                etag = self.headers.get("If-None-Match")
+                status, data, headers = mock.handle(self.command, url.path, query, body, etag)
+                content = json.dumps(data).encode("utf-8") if status != 304 else b""
+                if mock.gzip and content and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    content = gzip.compress(content)
+                    headers = dict(headers, **{"Content-Encoding": "gzip"})
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if "X-Next-Page" in headers:
+                    query = urllib.parse.parse_qs(url.query)
+                    query["page"] = [headers["X-Next-Page"]]
+                    next_url = f"{mock.url}{url.path}?{urllib.parse.urlencode(query, doseq=True)}"
+                    self.send_header("Link", f'<{next_url}>; rel="next"')
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(content)
+
+            def _read_body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if self.command != "PUT" or "/packages/generic/" not in self.path:
+                    return self.rfile.read(length) if length else b""
+
+                sha256 = hashlib.sha256()
+                kept = [] if length <= MAX_KEPT_SIZE else None
+                remaining = length
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    sha256.update(chunk)
+                    if kept is not None:
+                        kept.append(chunk)
+                    remaining -= len(chunk)
+                return sha256.hexdigest(), length - remaining, b"".join(kept) if kept is not None else None
+
+        return Handler
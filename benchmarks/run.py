@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+r"""Benchmarks for the hot paths of the tool, run against a local mock GitLab server (see `mock_gitlab.py`).
+
+Each scenario runs in its own process, so the peak RSS reported is for that scenario alone. The mock server runs in
+this process and counts the requests made to each endpoint.
+
+Example:
+    ::
+        $ python -m benchmarks.run --latency 0.05 --jobs 1000 --output results.json
+        $ python -m benchmarks.run --scenario changelog --changelog-size 50
+
+"""
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.mock_gitlab import MockGitlab
+
+SCENARIOS = ("cli", "cli_lite", "add_artifacts", "changelog", "batch")
+PIPELINE_ID = "79790"
+PRIVATE_TOKEN = "ATOKEN1234"
+
+
+@click.command()
+@click.option("--scenario", "-s", "scenarios", multiple=True, type=click.Choice(SCENARIOS), help="Defaults to all.")
+@click.option("--iterations", "-n", default=5, type=click.IntRange(min=1), help="How many times to run each scenario.")
+@click.option("--latency", default=0.02, type=float, help="How long the mock GitLab takes to respond, in seconds.")
+@click.option("--jobs", default=1000, type=int, help="How many jobs the pipeline has.")
+@click.option("--projects", default=500, type=int, help="How many releases the batch scenario creates.")
+@click.option("--changelog-size", default=50, type=int, help="The size of the changelog in MB.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Write the results to this file as JSON.")
+def benchmark(scenarios, iterations, latency, jobs, projects, changelog_size, output):
+    """Benchmarks gitlab-auto-release against a local mock GitLab server."""
+    config = {"iterations": iterations, "jobs": jobs, "projects": projects, "changelog_size": changelog_size}
+    results = {}
+    context = multiprocessing.get_context("spawn")
+
+    with MockGitlab(latency=latency, jobs=jobs) as server:
+        for scenario in scenarios or SCENARIOS:
+            server.reset()
+            with context.Pool(1) as pool:
+                timings, peak_rss = pool.apply(run_scenario, (scenario, server.url, config))
+
+            results[scenario] = {
+                "latency": get_percentiles(timings),
+                "requests": dict(server.requests),
+                "total_requests": sum(server.requests.values()) // iterations,
+                "peak_rss_kb": peak_rss,
+            }
+            print_result(scenario, results[scenario])
+
+    if output:
+        with open(output, "w") as output_file:
+            json.dump({"config": config, "latency": latency, "results": results}, output_file, indent=2)
+
+
+def run_scenario(scenario, url, config):
+    """Runs a scenario, in a child process.
+
+    Returns
+        tuple: The time each iteration took in seconds and the peak RSS of the process in KB.
+
+    """
+    os.environ["CI_PIPELINE_ID"] = PIPELINE_ID
+    run = globals()[f"run_{scenario}"]
+    setup = globals().get(f"setup_{scenario}")
+    state = setup(url, config) if setup else None
+
+    timings = []
+    for iteration in range(config["iterations"]):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(url, config, iteration, state)
+        timings.append(time.perf_counter() - start)
+
+    return timings, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_cli(url, config, iteration, state, lite=False):
+    from gitlab_auto_release.cli import cli
+
+    last_job = "job-0"
+    args = ["--private-token", PRIVATE_TOKEN, "--gitlab-url", url, "--project-id", "1"]
+    args += ["--tag-name", f"release/{iteration}.0.0", "--release-name", f"release/{iteration}.0.0"]
+    args += ["--artifacts", last_job, "--lite" if lite else "--no-lite"]
+    invoke(cli, args)
+
+
+def run_cli_lite(url, config, iteration, state):
+    run_cli(url, config, iteration, state, lite=True)
+
+
+def setup_add_artifacts(url, config):
+    from gitlab_auto_release.session import get_gitlab
+
+    return get_gitlab(url, PRIVATE_TOKEN).projects.get(1)
+
+
+def run_add_artifacts(url, config, iteration, state):
+    from gitlab_auto_release.cli import add_artifacts
+
+    add_artifacts(state, ["job-0", f"job-{config['jobs'] // 2}"], url, pipeline_id=PIPELINE_ID)
+
+
+def setup_changelog(url, config):
+    """Writes a keepachangelog file of `changelog_size` MB, the newest version first."""
+    section = "### Added\n" + "- A change which was made in this version, with a link to the merge request.\n" * 6
+    path = os.path.join(tempfile.mkdtemp(), "CHANGELOG.md")
+    versions = []
+    with open(path, "w") as changelog:
+        changelog.write("# Changelog\n\n## [Unreleased]\n")
+        version = 0
+        while changelog.tell() < config["changelog_size"] * 1024 * 1024:
+            versions.append(f"{version // 10000}.{version // 100 % 100}.{version % 100}")
+            changelog.write(f"## [{versions[-1]}] - 2020-01-01\n{section}\n")
+            version += 1
+    return path, list(reversed(versions))
+
+
+def run_changelog(url, config, iteration, state):
+    from gitlab_auto_release.changelog import get_changelog
+
+    path, versions = state
+    for version in (versions[0], versions[len(versions) // 2], versions[-1]):
+        get_changelog(path, f"release/{version}")
+
+
+def setup_batch(url, config):
+    path = os.path.join(tempfile.mkdtemp(), "releases.jsonl")
+    with open(path, "w") as manifest:
+        for iteration in range(config["iterations"]):
+            for project in range(1, config["projects"] + 1):
+                manifest.write(json.dumps({"project_id": project, "tag_name": f"release/{iteration}.0.0"}) + "\n")
+    return path
+
+
+def run_batch(url, config, iteration, state):
+    from gitlab_auto_release.batch import batch
+
+    path = os.path.join(os.path.dirname(state), f"releases-{iteration}.jsonl")
+    with open(state, "r") as manifest, open(path, "w") as iteration_manifest:
+        for line in manifest:
+            if json.loads(line)["tag_name"] == f"release/{iteration}.0.0":
+                iteration_manifest.write(line)
+    invoke(batch, ["--private-token", PRIVATE_TOKEN, "--gitlab-url", url, "--workers", "16", path])
+
+
+def invoke(command, args):
+    try:
+        command.main(args, standalone_mode=False)
+    except SystemExit as e:
+        if e.code:
+            raise RuntimeError(f"{command.name} exited with {e.code}") from None
+
+
+def get_percentiles(timings):
+    timings = sorted(timings)
+
+    def percentile(value):
+        return timings[min(int(round(value / 100 * len(timings) + 0.5)) - 1, len(timings) - 1)]
+
+    return {"p50": percentile(50), "p90": percentile(90), "p99": percentile(99), "max": timings[-1]}
+
+
+def print_result(scenario, result):
+    latency = result["latency"]
+    print(
+        f"{scenario:<15} p50 {latency['p50'] * 1000:8.1f}ms  p90 {latency['p90'] * 1000:8.1f}ms  "
+        f"p99 {latency['p99'] * 1000:8.1f}ms  requests {result['total_requests']:6d}  "
+        f"peak RSS {result['peak_rss_kb'] / 1024:7.1f}MB",
+        file=sys.stdout,
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -18,7 +18,15 @@ setup(
     zip_safe=False,
     include_package_data=True,
     install_requires=["click>=7.0", "python-gitlab>=1.8.0"],
-    entry_points={"console_scripts": ["gitlab_auto_release = gitlab_auto_release.cli:cli"]},
+    extras_require={"http2": ["httpx[http2]"], "ijson": ["ijson>=3.1"], "yaml": ["PyYAML"]},
+    entry_points={
+        "console_scripts": [
+            "gitlab_auto_release = gitlab_auto_release.cli:cli",
+            "gitlab_auto_release_batch = gitlab_auto_release.batch:batch",
+            "gitlab_auto_release_backfill = gitlab_auto_release.backfill:backfill",
+            "gitlab_auto_release_server = gitlab_auto_release.server:server",
+        ]
+    },
     classifiers=[
         "Programming Language :: Python",
         "Intended Audience :: Developers",
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+r"""This module creates releases for all the tags in a project which don't have a release yet.
+
+All the tags and releases are listed in bulk (a page at a time), the missing releases are worked out locally and then
+created by a pool of workers. The description for each release is taken from the changelog, which is only read once.
+
+Example:
+    ::
+        $ gitlab_auto_release_backfill --private-token xxxx --gitlab-url https://gitlab.com --project-id 8593636 \
+        --changelog CHANGELOG.md --tag-pattern "^release/"
+
+"""
+import functools
+import os
+import re
+import sys
+import urllib.parse
+
+import click
+import gitlab
+
+from gitlab_auto_release.batch import print_stats
+from gitlab_auto_release.batch import run_bounded
+from gitlab_auto_release.changelog import CHANGELOG_FORMATS
+from gitlab_auto_release.changelog import SEMVER
+from gitlab_auto_release.changelog import ChangelogIndexes
+from gitlab_auto_release.cli import get_gitlab_project
+from gitlab_auto_release.options import connection_options
+from gitlab_auto_release.pager import iter_list
+from gitlab_auto_release.session import create_session
+from gitlab_auto_release.session import get_cache
+from gitlab_auto_release.session import get_gitlab
+from gitlab_auto_release.session import get_scheduler
+from gitlab_auto_release.transport import get_transport
+
+DEFAULT_WORKERS = 4
+PER_PAGE = 100
+
+
+@click.command()
+@click.option(
+    "--private-token",
+    envvar="GITLAB_PRIVATE_TOKEN",
+    required=True,
+    help="Private GITLAB token, used to authenticate when calling the Release API.",
+)
+@click.option("--gitlab-url", envvar="CI_SERVER_URL", required=True, help="The GitLab URL i.e. gitlab.com.")
+@click.option(
+    "--project-id",
+    envvar="CI_PROJECT_ID",
+    required=True,
+    type=int,
+    help="The project ID on GitLab to create the Releases for.",
+)
+@click.option(
+    "--changelog",
+    "-c",
+    help="Path to file to changelog file, the section matching each tag is used as the description. Can be Markdown (i.e. keepachangelog), reStructuredText or AsciiDoc.",
+)
+@click.option(
+    "--changelog-format",
+    envvar="GITLAB_AUTO_RELEASE_CHANGELOG_FORMAT",
+    default="auto",
+    type=click.Choice(("auto",) + tuple(CHANGELOG_FORMATS)),
+    help="The format of the changelog, auto picks it from the file extension.",
+)
+@click.option("--tag-pattern", help="Only create releases for tags matching this regex, i.e. ^release/.")
+@click.option(
+    "--workers", default=DEFAULT_WORKERS, type=click.IntRange(min=1), help="How many releases to create at once."
+)
+@connection_options
+def backfill(
+    private_token,
+    gitlab_url,
+    project_id,
+    changelog,
+    changelog_format,
+    tag_pattern,
+    workers,
+    cache,
+    cache_dir,
+    max_retries,
+    rate_limit,
+    pool_size,
+    keep_alive,
+    http2,
+    gzip,
+    dns_cache_ttl,
+):
+    """Gitlab Auto Release Tool, creates releases for all tags which don't have one."""
+    response_cache = get_cache(cache, cache_dir)
+    scheduler = get_scheduler(max_retries, rate_limit, max_concurrency=workers)
+    transport = get_transport(pool_size, keep_alive, http2, gzip, dns_cache_ttl, workers=workers)
+    session = create_session(transport=transport, cache=response_cache, scheduler=scheduler)
+    gl = get_gitlab(gitlab_url, private_token, session=session, scheduler=scheduler)
+    project = get_gitlab_project(gl, project_id, gitlab_url)
+
+    missing = get_missing_releases(project, tag_pattern)
+    print(f"Found {len(missing)} tag(s) without a release.")
+
+    changelogs = ChangelogIndexes(
+        os.path.join(response_cache.path, "changelogs") if response_cache else None, changelog_format=changelog_format
+    )
+    worker = functools.partial(release_tag, project, changelog=changelog, changelogs=changelogs)
+
+    failed = 0
+    for tag_name, status, message in run_bounded(worker, missing, workers):
+        print(f"[{status}] tag {tag_name}: {message}")
+        if status == "failed":
+            failed += 1
+
+    print_stats(scheduler)
+    if failed:
+        print(f"Failed to create {failed} release(s).")
+        sys.exit(1)
+
+
+def get_missing_releases(project, tag_pattern=None):
+    """Gets the tags which don't have a release, using a few list requests instead of one request per tag. The tags
+    are streamed, so only the releases' tag names and the tags without a release are kept in memory.
+
+    Args:
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        tag_pattern (str): Only include tags matching this regex.
+
+    Returns
+        list: The names of tags without a release, in the order GitLab returns them (newest first).
+
+    """
+    gl = project.manager.gitlab
+    path = f"/projects/{quote(project.id)}"
+    pattern = re.compile(tag_pattern) if tag_pattern else None
+    releases = {release["tag_name"] for release in iter_list(gl, f"{path}/releases", per_page=PER_PAGE)}
+    tags = (tag["name"] for tag in iter_list(gl, f"{path}/repository/tags", per_page=PER_PAGE))
+    return [tag for tag in tags if tag not in releases and (pattern is None or pattern.search(tag))]
+
+
+def release_tag(project, tag_name, changelog, changelogs):
+    """Creates the release for a tag, errors are returned so one release failing doesn't stop the others. How often
+    releases are created is limited by the session's scheduler, see `--rate-limit`.
+
+    Args:
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        tag_name (str): The tag to create the release for.
+        changelog (str): Path to changelog file.
+        changelogs (ChangelogIndexes): Used to get the section of the changelog for the tag.
+
+    Returns
+        tuple: The tag name, the status (created or failed) and a message.
+
+    """
+    description = ""
+    if changelog and SEMVER.search(tag_name):
+        try:
+            description = changelogs.get_changelog(changelog, tag_name)
+        except OSError:
+            return tag_name, "failed", f"Unable to open changelog file at {changelog}."
+        except UnicodeDecodeError:
+            return tag_name, "failed", f"Unable to decode changelog file at {changelog}, it isn't UTF-8."
+
+    try:
+        project.releases.create(
+            {
+                "name": tag_name,
+                "tag_name": tag_name,
+                "description": description or f"Release for {tag_name}",
+                "assets": {"links": []},
+            }
+        )
+    except gitlab.exceptions.GitlabCreateError as e:
+        return tag_name, "failed", e.error_message
+    except Exception as e:  # noqa: B902 - i.e. connection errors, one release shouldn't stop the backfill.
+        return tag_name, "failed", str(e) or type(e).__name__
+
+    return tag_name, "created", "Created release."
+
+
+def quote(value):
+    return urllib.parse.quote(str(value), safe="")
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+r"""This module creates releases for many projects/tags in a single invocation. The releases are read from a manifest
+file and created by a pool of workers, which all share the same GitLab session.
+
+The manifest can be a CSV file, a JSON lines file (one JSON object per line) or a YAML file (requires PyYAML).
+Each entry has the following fields, only `project_id` and `tag_name` are required. In a CSV file fields which are
+lists are separated by `;`.
+
+* project_id: The project ID on GitLab to create the Release for.
+* tag_name: The tag the release should be created from.
+* release_name: The name of the release, defaults to the tag name.
+* changelog: Path to the changelog file.
+* description: String to use as the description for the release.
+* assets: Assets to include in the release, i.e. name=link_to_asset.
+* artifacts: Jobs to link artifacts from.
+* pipeline_id: The pipeline the artifact jobs are in, defaults to `CI_PIPELINE_ID`.
+* notes: If true and there's no changelog, generate release notes from the git history.
+* previous_tag: The tag to generate release notes from, defaults to the tag before `tag_name`.
+
+Example:
+    ::
+        $ gitlab_auto_release_batch --private-token xxxx --gitlab-url https://gitlab.com releases.csv
+
+"""
+import collections
+import contextlib
+import contextvars
+import csv
+import functools
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import click
+
+from gitlab_auto_release.changelog import ChangelogIndexes
+from gitlab_auto_release.cli import create_gitlab_release
+from gitlab_auto_release.cli import create_release
+from gitlab_auto_release.cli import get_gitlab_project
+from gitlab_auto_release.notes import get_notes_cache
+from gitlab_auto_release.options import connection_options
+from gitlab_auto_release.session import create_session
+from gitlab_auto_release.session import get_cache
+from gitlab_auto_release.session import get_gitlab
+from gitlab_auto_release.session import get_scheduler
+from gitlab_auto_release.state import PENDING
+from gitlab_auto_release.state import RESOLVED
+from gitlab_auto_release.state import ReleaseState
+from gitlab_auto_release.transport import get_transport
+
+DEFAULT_WORKERS = 8
+LIST_FIELDS = ("assets", "artifacts")
+MANIFEST_FORMATS = ("csv", "jsonl", "yaml")
+
+
+@click.command()
+@click.option(
+    "--private-token",
+    envvar="GITLAB_PRIVATE_TOKEN",
+    required=True,
+    help="Private GITLAB token, used to authenticate when calling the Release API.",
+)
+@click.option("--gitlab-url", envvar="CI_SERVER_URL", required=True, help="The GitLab URL i.e. gitlab.com.")
+@click.option(
+    "--workers", default=DEFAULT_WORKERS, type=click.IntRange(min=1), help="How many releases to create at once."
+)
+@click.option(
+    "--format",
+    "manifest_format",
+    type=click.Choice(MANIFEST_FORMATS),
+    help="The format of the manifest, defaults to using the file extension.",
+)
+@click.option(
+    "--optimistic/--no-optimistic",
+    envvar="GITLAB_AUTO_RELEASE_OPTIMISTIC",
+    default=False,
+    help="Don't check if the releases exist first, create them and treat a conflict as the release already existing.",
+)
+@click.option(
+    "--state-file",
+    envvar="GITLAB_AUTO_RELEASE_STATE_FILE",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Record the state of each release in this file, so an interrupted batch can be resumed where it left off.",
+)
+@connection_options
+@click.argument("manifest", type=click.Path(exists=True, dir_okay=False))
+def batch(
+    private_token,
+    gitlab_url,
+    workers,
+    manifest_format,
+    optimistic,
+    state_file,
+    cache,
+    cache_dir,
+    max_retries,
+    rate_limit,
+    pool_size,
+    keep_alive,
+    http2,
+    gzip,
+    dns_cache_ttl,
+    manifest,
+):
+    """Gitlab Auto Release Tool, creates all the releases in the MANIFEST file."""
+    manifest_format = manifest_format or get_manifest_format(manifest)
+    response_cache = get_cache(cache, cache_dir)
+    scheduler = get_scheduler(max_retries, rate_limit, max_concurrency=workers)
+    transport = get_transport(pool_size, keep_alive, http2, gzip, dns_cache_ttl, workers=workers)
+    session = create_session(transport=transport, cache=response_cache, scheduler=scheduler)
+    gl = get_gitlab(gitlab_url, private_token, session=session, scheduler=scheduler)
+    projects = ProjectCache()
+    changelogs = ChangelogIndexes(os.path.join(response_cache.path, "changelogs") if response_cache else None)
+    state = ReleaseState(state_file) if state_file else None
+    skipped = collections.Counter()
+
+    failed = 0
+    output = sys.stdout = EntryOutput(sys.stdout)
+    try:
+        with open(manifest, "r", newline="") as manifest_file:
+            entries = read_manifest(manifest_file, manifest_format)
+            if state:
+                entries = skip_completed(entries, state, skipped)
+            worker = functools.partial(
+                release_entry,
+                gl,
+                gitlab_url,
+                projects=projects,
+                changelogs=changelogs,
+                optimistic=optimistic,
+                notes_cache=get_notes_cache(cache, cache_dir),
+                state=state,
+                output=output,
+            )
+            for entry, status, message in run_bounded(worker, entries, workers):
+                print(f"[{status}] project {entry.get('project_id')} tag {entry.get('tag_name')}: {message}")
+                if status == "failed":
+                    failed += 1
+    finally:
+        sys.stdout = output.stream
+
+    if skipped:
+        print(f"Skipped {skipped['completed']} release(s) completed by a previous run.")
+    print_stats(scheduler)
+    if failed:
+        print(f"Failed to create {failed} release(s).")
+        sys.exit(1)
+
+
+def get_manifest_format(manifest):
+    """Gets the format of the manifest from its file extension.
+
+    Args:
+        manifest (str): Path to the manifest file.
+
+    Returns
+        str: The manifest format.
+
+    """
+    extension = os.path.splitext(manifest)[1].lower()
+    if extension in (".yaml", ".yml"):
+        return "yaml"
+    elif extension in (".json", ".jsonl", ".ndjson"):
+        return "jsonl"
+    return "csv"
+
+
+def read_manifest(manifest_file, manifest_format):
+    """Reads the entries in the manifest one at a time, so large manifests don't need to be loaded into memory.
+    YAML manifests are the exception, they are parsed in one go.
+
+    Args:
+        manifest_file (file): The open manifest file.
+        manifest_format (str): The format of the manifest, one of `MANIFEST_FORMATS`.
+
+    Yields
+        dict: A single entry in the manifest.
+
+    """
+    if manifest_format == "csv":
+        for row in csv.DictReader(manifest_file):
+            yield {key: split_list_field(key, value) for key, value in row.items() if value}
+    elif manifest_format == "jsonl":
+        for line in manifest_file:
+            if line.strip():
+                yield json.loads(line)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            print("PyYAML is required to read YAML manifests, pip install pyyaml.")
+            sys.exit(1)
+
+        for entry in yaml.safe_load(manifest_file) or []:
+            yield entry
+
+
+def split_list_field(key, value):
+    """CSV fields can only contain strings, fields which are lists are separated by `;`."""
+    return [item for item in value.split(";") if item] if key in LIST_FIELDS else value
+
+
+def skip_completed(entries, state, skipped):
+    """Skips the entries which were created (or already existed) in a previous run, without any requests.
+
+    Args:
+        entries (iterable): The entries in the manifest.
+        state (ReleaseState): The state of the releases.
+        skipped (collections.Counter): The number of skipped entries is counted in it, as `completed`.
+
+    Yields
+        dict: The entries which haven't been completed.
+
+    """
+    for entry in entries:
+        if state.is_completed(entry.get("project_id"), entry.get("tag_name")):
+            skipped["completed"] += 1
+        else:
+            yield entry
+
+
+def is_true(value):
+    """Checks if a field is true, in a CSV file it's a string i.e. `true`."""
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def run_bounded(worker, items, workers):
+    """Runs the `worker` on each item using a pool of threads. Only a bounded number of items are read from `items`
+    at a time, so it can be a (long) generator.
+
+    Args:
+        worker (function): Called with each item.
+        items (iterable): The items to process.
+        workers (int): How many items to process at the same time.
+
+    Yields
+        object: What `worker` returned, in the order they finish.
+
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(worker, item))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def release_entry(
+    gl, gitlab_url, entry, projects, changelogs, optimistic=False, notes_cache=None, state=None, output=None
+):
+    """Creates the release for a single entry in the manifest, errors are returned so one release failing doesn't
+    stop the others. With `state`, how far the release got is recorded, and a release which was resolved by a
+    previous run is created from the stored release without resolving it again.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        gitlab_url (str): The FQDN of the GitLab instance.
+        entry (dict): The entry from the manifest.
+        projects (ProjectCache): Projects which have already been fetched.
+        changelogs (ChangelogIndexes): Changelogs which have already been indexed.
+        optimistic (bool): Don't check if the release exists before creating it.
+        notes_cache (NotesCache): If set, generated release notes are cached in it.
+        state (ReleaseState): If set, the state of the release is recorded in it.
+        output (EntryOutput): If set, what's printed while creating the release is captured, so if it fails the
+            message is the reason it failed.
+
+    Returns
+        tuple: The entry, the status (created, exists or failed) and a message.
+
+    """
+    result = create_entry(gl, gitlab_url, entry, projects, changelogs, optimistic, notes_cache, state, output)
+    if state and "project_id" in entry and "tag_name" in entry:
+        _, status, message = result
+        state.put(entry["project_id"], entry["tag_name"], status, message=message)
+    return result
+
+
+def create_entry(
+    gl, gitlab_url, entry, projects, changelogs, optimistic=False, notes_cache=None, state=None, output=None
+):
+    """Creates the release for an entry, see `release_entry`."""
+    printed = []
+    with output.capture(printed) if output else contextlib.nullcontext():
+        try:
+            tag_name = entry["tag_name"]
+            project_id = int(entry["project_id"])
+            resolved = on_resolved = None
+            if state:
+                previous = state.get(project_id, tag_name)
+                if previous is None:
+                    state.put(project_id, tag_name, PENDING)
+                resolved = previous[1] if previous else None
+                on_resolved = functools.partial(state.put, project_id, tag_name, RESOLVED)
+
+            if resolved:
+                create_gitlab_release(projects.get(gl, project_id, gitlab_url), resolved, optimistic=True)
+                print(f"Created a release for tag {tag_name}.")
+                return entry, "created", "Created release."
+
+            create_release(
+                gl,
+                project_id,
+                gitlab_url,
+                tag_name,
+                entry.get("release_name") or tag_name,
+                changelog=entry.get("changelog"),
+                description=entry.get("description") or "",
+                asset=entry.get("assets") or (),
+                artifacts=entry.get("artifacts") or (),
+                pipeline_id=entry.get("pipeline_id"),
+                get_project=projects.get,
+                get_section=changelogs.get_changelog,
+                optimistic=optimistic,
+                notes=is_true(entry.get("notes")),
+                previous_tag=entry.get("previous_tag"),
+                notes_cache=notes_cache,
+                on_resolved=on_resolved,
+            )
+        except SystemExit as e:
+            if e.code == 0:
+                return entry, "exists", "Release already exists."
+            # The cli prints why it failed before exiting.
+            return entry, "failed", get_last_line(printed) or f"Exited with code {e.code}."
+        except KeyError as e:
+            return entry, "failed", f"Missing field {e}."
+        except Exception as e:  # noqa: B902
+            return entry, "failed", str(e) or type(e).__name__
+
+        return entry, "created", "Created release."
+
+
+def get_last_line(printed):
+    lines = [line.strip() for line in "".join(printed).splitlines() if line.strip()]
+    return lines[-1] if lines else None
+
+
+class EntryOutput:
+    """Stands in for `sys.stdout` while the releases are created. What's printed in the context of a release being
+    created (and the threads it starts with a copy of it) is captured, instead of being interleaved with the output
+    of the other releases.
+
+    Args:
+        stream (file): Where everything else is written, the real stdout.
+
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._printed = contextvars.ContextVar("printed", default=None)
+
+    @contextlib.contextmanager
+    def capture(self, printed):
+        """Appends what's printed in the with block to `printed`."""
+        token = self._printed.set(printed)
+        try:
+            yield printed
+        finally:
+            self._printed.reset(token)
+
+    def write(self, text):
+        printed = self._printed.get()
+        if printed is None:
+            return self.stream.write(text)
+        printed.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class ProjectCache:
+    """Fetches each project once, however many releases are created for it."""
+
+    def __init__(self):
+        self._projects = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, gl, project_id, gitlab_url):
+        """Gets the project, see `get_gitlab_project`."""
+        with self._lock:
+            project_lock = self._locks.setdefault(project_id, threading.Lock())
+
+        with project_lock:
+            if project_id not in self._projects:
+                self._projects[project_id] = get_gitlab_project(gl, project_id, gitlab_url)
+        return self._projects[project_id]
+
+
+def print_stats(scheduler):
+    """Prints how many requests were made to GitLab and how many of them were retried or rate limited."""
+    stats = scheduler.stats()
+    print(
+        f"Made {stats.get('requests', 0)} request(s), retried {stats.get('retries', 0)}, "
+        f"rate limited {stats.get('throttled', 0)} time(s), waited {stats.get('waited', 0):.1f}s."
+    )
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""This module is an opt-in, on disk cache of GitLab API responses. It is used so that release jobs which run many
+times in the same pipeline i.e. retries, mostly hit the cache instead of the API.
+
+Only GET requests for the object types in `DEFAULT_TTLS` are cached, each with its own time to live. Once an entry
+is older than its TTL it is revalidated with the `If-None-Match` header, so if it hasn't changed GitLab responds
+with a `304` and an empty body. The cache is stored in a SQLite database and the least recently used entries are
+removed when it grows bigger than `max_size` bytes. While `wait.wait_for_jobs` is polling every entry is
+revalidated, however fresh it is.
+
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from gitlab_auto_release.wait import is_polling
+
+CACHE_HEADER = "X-Gitlab-Auto-Release-Cache"
+DEFAULT_MAX_SIZE = 50 * 1024 * 1024
+DEFAULT_TTLS = (
+    ("project", re.compile(r"/api/v4/projects/[^/]+$"), 3600),
+    ("pipeline", re.compile(r"/api/v4/projects/[^/]+/pipelines/\d+$"), 30),
+    ("jobs", re.compile(r"/api/v4/projects/[^/]+/pipelines/\d+/jobs$"), 30),
+    ("release", re.compile(r"/api/v4/projects/[^/]+/releases/[^/]+$"), 0),
+)
+SKIP_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+def get_cache_dir():
+    """Gets the default directory to store the cache in, `$XDG_CACHE_HOME/gitlab-auto-release`.
+
+    Returns
+        str: Path to the cache directory.
+
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "gitlab-auto-release")
+
+
+def get_ttl(url, ttls=DEFAULT_TTLS):
+    """Gets how long (in seconds) a response from this url can be used for, without revalidating it.
+
+    Args:
+        url (str): The url of the request.
+        ttls (tuple): Of (object type, url pattern, ttl).
+
+    Returns
+        int: The TTL or None if responses from this url shouldn't be cached.
+
+    """
+    path = requests.utils.urlparse(url).path
+    for _, pattern, ttl in ttls:
+        if pattern.search(path):
+            return ttl
+    return None
+
+
+class ResponseCache:
+    """Stores responses in a SQLite database, can be shared between threads.
+
+    Args:
+        path (str): Path to the cache directory.
+        max_size (int): Maximum size of the cached response bodies in bytes.
+
+    """
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "responses.sqlite"), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, status INTEGER, headers TEXT, "
+                "body BLOB, etag TEXT, stored_at REAL, used_at REAL, size INTEGER)"
+            )
+
+    def get(self, key):
+        """Gets a cached response and marks it as recently used.
+
+        Args:
+            key (str): The cache key, see `get_cache_key`.
+
+        Returns
+            tuple: (status, headers, body, etag, stored_at) or None if it's not in the cache.
+
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT status, headers, body, etag, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._connection.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+
+        if row is None:
+            return None
+        status, headers, body, etag, stored_at = row
+        return status, json.loads(headers), body, etag, stored_at
+
+    def put(self, key, response):
+        """Adds a response to the cache, then removes the least recently used responses if the cache is too big.
+
+        Args:
+            key (str): The cache key, see `get_cache_key`.
+            response (requests.Response): The response to cache.
+
+        """
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in SKIP_HEADERS}
+        body = response.content
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    response.status_code,
+                    json.dumps(headers),
+                    body,
+                    response.headers.get("ETag"),
+                    now,
+                    now,
+                    len(body),
+                ),
+            )
+            self._evict()
+
+    def touch(self, key):
+        """Marks a response as fresh again, after it was revalidated."""
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE responses SET stored_at = ?, used_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self):
+        size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if size <= self.max_size:
+            return
+
+        rows = self._connection.execute("SELECT key, size FROM responses ORDER BY used_at DESC").fetchall()
+        kept = 0
+        for key, entry_size in rows:
+            kept += entry_size
+            if kept > self.max_size:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def close(self):
+        self._connection.close()
+
+
+class CachingAdapter(BaseAdapter):
+    """A transport adapter which answers GET requests from the `ResponseCache`, other requests are passed straight to
+    the wrapped adapter.
+
+    Args:
+        adapter (requests.adapters.BaseAdapter): The adapter which actually sends the requests.
+        cache (ResponseCache): Where to store the responses.
+        ttls (tuple): Of (object type, url pattern, ttl), which responses to cache and for how long.
+
+    """
+
+    def __init__(self, adapter, cache, ttls=DEFAULT_TTLS):
+        super().__init__()
+        self.adapter = adapter
+        self.cache = cache
+        self.ttls = ttls
+
+    def send(self, request, **kwargs):
+        ttl = get_ttl(request.url, self.ttls) if request.method == "GET" else None
+        if ttl is None:
+            return self.adapter.send(request, **kwargs)
+
+        key = get_cache_key(request)
+        entry = self.cache.get(key)
+        if entry:
+            status, headers, body, etag, stored_at = entry
+            if time.time() - stored_at < ttl and not is_polling():
+                return self.build_response(request, entry, "hit")
+            if etag:
+                request.headers["If-None-Match"] = etag
+
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            self.cache.touch(key)
+            return self.build_response(request, entry, "revalidated")
+
+        if response.status_code == 200:
+            self.cache.put(key, response)
+        response.headers[CACHE_HEADER] = "miss"
+        return response
+
+    def build_response(self, request, entry, state):
+        """Builds a response from a cache entry, as if it had come from GitLab."""
+        status, headers, body, _, _ = entry
+        response = requests.Response()
+        response.status_code = status
+        response.reason = "OK"
+        response.headers = CaseInsensitiveDict(headers)
+        response.headers[CACHE_HEADER] = state
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def get_cache_key(request):
+    """The cache key is a hash of the url and credentials, so users with different access don't share responses."""
+    token = request.headers.get("PRIVATE-TOKEN") or request.headers.get("Authorization") or ""
+    return hashlib.sha256(f"{request.url}\n{token}".encode("utf-8")).hexdigest()
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+"""This module gets the section for a version from a changelog. Markdown (keepachangelog and the changelogs
+conventional-changelog generates), reStructuredText and AsciiDoc changelogs are supported.
+
+Each format has a parser with a precompiled multiline regex which matches the lines it cares about, i.e. headings and
+code fences. The changelog is read in chunks and each chunk is scanned by the regex, so only those lines are handled
+in Python. A heading is a version heading if its title contains a semantic version (or is "Unreleased"), the section
+for a version runs from its heading to the next version heading or the next heading above it. The format is picked
+from the file extension, for other files every parser scans the same chunks until one of them finds a version
+heading, so the file is still only read once.
+
+`get_changelog` streams the file and is the best choice when we only need one section. When we need many sections
+from the same changelog, i.e. batch releases, `ChangelogIndexes` reads the file once and records the byte offsets
+of every section. After that each section is a seek and a bounded read. The index can also be saved to a sidecar
+file, so the next run doesn't have to read the changelog again.
+
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+SEMVER = re.compile(
+    r"((([0-9]+)\.([0-9]+)\.([0-9]+)(?:-([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?)(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?)"
+)
+VERSION = re.compile(SEMVER.pattern.encode("utf-8"))
+UNRELEASED = re.compile(rb"\bunreleased\b", re.IGNORECASE)
+CHUNK_SIZE = 256 * 1024
+LOOKBEHIND_LINES = 2
+SIDECAR_VERSION = 2
+
+
+class ChangelogParser:
+    """The base for the changelog parsers. Formats whose headings start with a marker, i.e. `##`, only have to set
+    `HEADING`, `TOKEN` and `BLOCKS`. `HEADING` matches a heading, `TOKEN` matches a heading or the delimiter of a
+    block (i.e. a code block) whose contents aren't parsed. Most changelogs have no such blocks, so unless a chunk has
+    one of `BLOCKS` in it we only look for headings. The regexes start with a newline, see `iter_headings`.
+
+    """
+
+    name = None
+    HEADING = None
+    TOKEN = None
+    BLOCKS = ()
+
+    def __init__(self):
+        self._block = None
+        self._needle = None
+
+    def skip_to(self, needle):
+        """Headings which don't contain `needle` may be skipped, until one which does is found (whichever path of
+        `scan` finds it). Used when we only need the section for one version, the parser's state is still kept up to
+        date.
+
+        Args:
+            needle (bytes): The version.
+
+        """
+        self._needle = needle
+
+    def scan(self, buffer, pos, end, base):
+        """Finds the headings in part of a chunk of the changelog.
+
+        Args:
+            buffer (bytes): The chunk, the lines before `pos` can be looked at but have already been scanned.
+            pos (int): Where to start scanning, always the newline before a line.
+            end (int): Where to stop scanning, always the end of a line.
+            base (int): The byte offset of the start of `buffer` in the changelog.
+
+        Yields
+            tuple: The byte offset each heading starts at in the changelog, its level and title.
+
+        """
+        if self._block is None and not self._has_block(buffer, pos, end):
+            if self._needle:
+                pos = self._find_heading(buffer, pos, end)
+                if pos == -1:
+                    return
+                self._needle = None
+            for heading in self.HEADING.finditer(buffer, pos, end):
+                yield base + heading.start() + 1, len(heading.group("level")), heading.group("title")
+            return
+
+        for token in self.TOKEN.finditer(buffer, pos, end):
+            block = token.group("block")
+            if block:
+                marker = self.get_block_marker(block)
+                if self._block is None:
+                    self._block = marker
+                elif self._block == marker:
+                    self._block = None
+            elif self._block is None:
+                title = token.group("title")
+                if self._needle and self._needle in title:
+                    self._needle = None
+                yield base + token.start() + 1, len(token.group("level")), title
+
+    def get_block_marker(self, block):
+        """Gets what the delimiter closing `block` has to match."""
+        return block
+
+    def _has_block(self, buffer, pos, end):
+        """Searching for a single byte is much faster than for a string, so we only search for a block delimiter if
+        its first character is in the chunk.
+
+        """
+        for block in self.BLOCKS:
+            first = block.lstrip(b"\n")[:1]
+            if buffer.find(first, pos, end) != -1 and buffer.find(block, pos, end) != -1:
+                return True
+        return False
+
+    def _find_heading(self, buffer, pos, end):
+        """Finds the first heading which contains the needle, with `bytes.find`.
+
+        Returns
+            int: The position of the newline before the heading or -1 if there isn't one.
+
+        """
+        index = buffer.find(self._needle, pos, end)
+        while index != -1:
+            line = buffer.rfind(b"\n", pos, index)
+            if self.HEADING.match(buffer, line, end):
+                return line
+            next_line = buffer.find(b"\n", index, end)
+            if next_line == -1:
+                break
+            index = buffer.find(self._needle, next_line, end)
+        return -1
+
+
+class MarkdownParser(ChangelogParser):
+    """ATX headings i.e. `## [1.0.0] - 2019-10-21`, the level is the number of `#`. Headings in fenced code blocks are
+    ignored.
+
+    """
+
+    name = "markdown"
+    HEADING = re.compile(rb"\n(?P<level>#{1,6})[ \t]+(?P<title>[^\n]*)")
+    TOKEN = re.compile(rb"\n(?:(?P<block> {0,3}(?:`{3,}|~{3,}))|(?P<level>#{1,6})[ \t]+(?P<title>[^\n]*))")
+    BLOCKS = (b"```", b"~~~")
+
+    def get_block_marker(self, block):
+        return block.lstrip()[:1]
+
+
+class RstParser(ChangelogParser):
+    """Section titles with an underline (and optionally an overline) of punctuation i.e. `1.0.0` followed by `-----`.
+    Like docutils, the level of each style of adornment is the order it's first used in, so headings can't be
+    skipped.
+
+    """
+
+    name = "rst"
+    ADORNMENT = re.compile(rb"\n([!-/:-@\[-`{-~])\1{2,}[ \t]*\r?$", re.M)
+
+    def __init__(self):
+        super().__init__()
+        self._styles = {}
+
+    def scan(self, buffer, pos, end, base):
+        for underline in self.ADORNMENT.finditer(buffer, pos, end):
+            title_start = buffer.rfind(b"\n", 0, underline.start())
+            title = buffer[title_start + 1 : underline.start()].rstrip()
+            if title_start == -1 or not title or title[:1].isspace() or self.ADORNMENT.match(b"\n" + title):
+                continue
+
+            style, start = (underline.group(1), False), title_start
+            overline_start = buffer.rfind(b"\n", 0, title_start)
+            if overline_start != -1 and buffer[overline_start:title_start].rstrip() == underline.group(0).rstrip():
+                style, start = (underline.group(1), True), overline_start
+
+            level = self._styles.setdefault(style, len(self._styles) + 1)
+            yield base + start + 1, level, title
+
+
+class AsciidocParser(ChangelogParser):
+    """Section titles i.e. `== 1.0.0`, the level is the number of `=`. Headings in delimited blocks (listing,
+    literal, passthrough and comment blocks) are ignored.
+
+    """
+
+    name = "asciidoc"
+    HEADING = re.compile(rb"\n(?P<level>={1,6})[ \t]+(?P<title>[^\n]*)")
+    TOKEN = re.compile(
+        rb"\n(?:(?P<block>-{4,}|\.{4,}|\+{4,}|/{4,})[ \t]*\r?$|(?P<level>={1,6})[ \t]+(?P<title>[^\n]*))", re.M
+    )
+    BLOCKS = (b"\n----", b"\n....", b"\n++++", b"\n////")
+
+
+class AutoParser(ChangelogParser):
+    """Scans each chunk with every parser, until one of them finds a version heading. From then on only that parser is
+    used. Until then no heading is returned, as a section can only start at a version heading. Headings aren't
+    skipped, as a skipped version heading could change which parser is picked.
+
+    """
+
+    name = "auto"
+
+    def __init__(self):
+        super().__init__()
+        self._parsers = [parser() for parser in CHANGELOG_FORMATS.values()]
+
+    def scan(self, buffer, pos, end, base):
+        if len(self._parsers) == 1:
+            return self._parsers[0].scan(buffer, pos, end, base)
+
+        candidates = []
+        for priority, parser in enumerate(self._parsers):
+            headings = list(parser.scan(buffer, pos, end, base))
+            for index, heading in enumerate(headings):
+                if get_version(heading[2]):
+                    candidates.append((heading[0], priority, parser, headings[index:]))
+                    break
+
+        if not candidates:
+            return []
+        _, _, parser, headings = min(candidates, key=lambda candidate: candidate[:2])
+        self._parsers = [parser]
+        return headings
+
+
+CHANGELOG_FORMATS = {parser.name: parser for parser in (MarkdownParser, RstParser, AsciidocParser)}
+EXTENSIONS = {
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".rst": "rst",
+    ".rest": "rst",
+    ".adoc": "asciidoc",
+    ".asciidoc": "asciidoc",
+    ".asc": "asciidoc",
+}
+
+
+def get_parser(path, changelog_format=None):
+    """Gets a parser for a changelog.
+
+    Args:
+        path (str): Path to changelog file, its extension is used to pick the format.
+        changelog_format (str): One of `CHANGELOG_FORMATS`, auto or None to pick it from the extension.
+
+    Returns
+        ChangelogParser: A new parser for the changelog.
+
+    Raises
+        ValueError: If the format isn't supported.
+
+    """
+    if changelog_format in (None, "auto"):
+        changelog_format = EXTENSIONS.get(os.path.splitext(path)[1].lower(), "auto")
+    if changelog_format == "auto":
+        return AutoParser()
+    if changelog_format not in CHANGELOG_FORMATS:
+        raise ValueError(f"Unsupported changelog format {changelog_format}.")
+    return CHANGELOG_FORMATS[changelog_format]()
+
+
+def get_version(title):
+    """Gets the version from the title of a heading.
+
+    Args:
+        title (bytes): The title of a heading i.e. `[1.0.0] - 2019-10-21`.
+
+    Returns
+        str: The semantic version in the title, Unreleased or None if this isn't a version heading.
+
+    """
+    semver = VERSION.search(title)
+    if semver:
+        return semver.group(0).decode("utf-8")
+    if UNRELEASED.search(title):
+        return "Unreleased"
+    return None
+
+
+def iter_headings(change, parser, digest=None):
+    """Reads the changelog in chunks and scans each one for headings, only complete lines are scanned. The buffer
+    always starts with a newline (a sentinel one at the start of the file), so the parsers' regexes can start with a
+    literal newline, which is much faster to search for than `^`. The last few lines of each chunk are kept, so
+    parsers can look at the lines before a match (i.e. the title of an underline).
+
+    Args:
+        change (file): The changelog, opened in binary mode.
+        parser (ChangelogParser): A new parser for the changelog's format.
+        digest (hashlib.sha256): If set, every chunk read is added to it.
+
+    Yields
+        tuple: The byte offset each heading starts at in the changelog, its level and title.
+
+    """
+    buffer = b"\n"
+    base = -1
+    pos = 0
+    while True:
+        data = change.read(CHUNK_SIZE)
+        if digest and data:
+            digest.update(data)
+        buffer += data
+        end = buffer.rfind(b"\n") + 1 if data else len(buffer)
+        if end - 1 > pos:
+            yield from parser.scan(buffer, pos, end, base)
+        if not data:
+            return
+
+        cut = end - 1
+        for _ in range(LOOKBEHIND_LINES):
+            cut = max(buffer.rfind(b"\n", 0, cut), 0)
+        buffer = buffer[cut:]
+        base += cut
+        pos = end - 1 - cut
+
+
+def iter_sections(change, parser, digest=None, only=None):
+    """Finds the sections in a changelog, in a single pass.
+
+    Args:
+        change (file): The changelog, opened in binary mode.
+        parser (ChangelogParser): A new parser for the changelog's format.
+        digest (hashlib.sha256): If set, the changelog is added to it as it's read.
+        only (str): If set, only the section for this version is found. Headings which don't contain it aren't
+            searched for a version, until the section starts.
+
+    Yields
+        tuple: The version, start and end byte offset of each section, as soon as the end of the section is read.
+
+    """
+    needle = only.encode("utf-8") if only else None
+    if needle:
+        parser.skip_to(needle)
+    current = None
+    for start, level, title in iter_headings(change, parser, digest):
+        if current is None and needle and needle not in title:
+            continue
+
+        version = get_version(title)
+        if current and (version or level < current[2]):
+            yield current[0], current[1], start
+            current = None
+        if version and (not only or version == only):
+            current = (version, start, level)
+
+    if current:
+        yield current[0], current[1], change.tell()
+
+
+def get_changelog(changelog, tag_name, changelog_format=None):
+    """Gets details from the changelog to include in the description of the release.
+    The file is read in chunks and we stop reading as soon as the next section starts, so large changelogs are never
+    fully loaded into memory.
+
+    Args:
+        changelog (str): Path to changelog file.
+        tag_name (str): The tag name i.e. release/0.1.0, must contain semantic versioning somewhere in the tag (0.1.0).
+        changelog_format (str): One of `CHANGELOG_FORMATS`, defaults to picking it from the file extension.
+
+    Returns
+        str: The description to use for the release.
+
+    Raises:
+        AttributeError: If the tag_name doesn't contain semantic versioning somewhere within the name.
+        FileNotFoundError: If the file couldn't be found.
+        OSError: If couldn't open file for some reason.
+        ValueError: If the format isn't supported.
+
+    """
+    parser = get_parser(changelog, changelog_format)
+    with open(changelog, "rb") as change:
+        semver_tag = SEMVER.search(tag_name).group(0)
+        for _, start, end in iter_sections(change, parser, only=semver_tag):
+            change.seek(start)
+            return change.read(end - start).decode("utf-8").replace("\r\n", "\n")
+
+    return ""
+
+
+class ChangelogIndex:
+    """The byte offsets of each section in a changelog.
+
+    Args:
+        path (str): Path to changelog file.
+        sections (dict): The version to the (start, end) byte offsets of its section.
+        mtime (int): When the changelog was last modified, in nanoseconds.
+        size (int): The size of the changelog in bytes.
+        digest (str): The SHA-256 of the changelog.
+
+    """
+
+    def __init__(self, path, sections, mtime, size, digest):
+        self.path = path
+        self.sections = sections
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+
+    @classmethod
+    def build(cls, path, changelog_format=None):
+        """Builds the index, in a single pass over the changelog.
+
+        Args:
+            path (str): Path to changelog file.
+            changelog_format (str): One of `CHANGELOG_FORMATS`, defaults to picking it from the file extension.
+
+        Returns
+            ChangelogIndex: The index of the changelog.
+
+        """
+        parser = get_parser(path, changelog_format)
+        sections = {}
+        digest = hashlib.sha256()
+
+        with open(path, "rb") as change:
+            stat = os.fstat(change.fileno())
+            for version, start, end in iter_sections(change, parser, digest):
+                sections.setdefault(version, (start, end))
+            size = change.tell()
+
+        return cls(path, sections, stat.st_mtime_ns, size, digest.hexdigest())
+
+    def section(self, tag_name):
+        """Gets the section for the tag, the same as `get_changelog` would.
+
+        Args:
+            tag_name (str): The tag name i.e. release/0.1.0, must contain semantic versioning somewhere in the tag.
+
+        Returns
+            str: The section of the changelog or an empty string if the version isn't in the changelog.
+
+        Raises:
+            AttributeError: If the tag_name doesn't contain semantic versioning somewhere within the name.
+
+        """
+        semver_tag = SEMVER.search(tag_name).group(0)
+        if semver_tag not in self.sections:
+            return ""
+
+        start, end = self.sections[semver_tag]
+        with open(self.path, "rb") as change:
+            change.seek(start)
+            section = change.read(end - start)
+        return section.decode("utf-8").replace("\r\n", "\n")
+
+    def to_dict(self):
+        return {
+            "version": SIDECAR_VERSION,
+            "mtime": self.mtime,
+            "size": self.size,
+            "digest": self.digest,
+            "sections": self.sections,
+        }
+
+
+class ChangelogIndexes:
+    """Keeps the index of each changelog in memory, so each changelog is only read once. If `sidecar_dir` is set the
+    indexes are also stored in that directory. A sidecar is used if the changelog's modified time and size haven't
+    changed, or if its contents haven't changed (i.e. a fresh git checkout in CI).
+
+    Args:
+        sidecar_dir (str): Where to store the indexes, if not set they're only kept in memory.
+        changelog_format (str): One of `CHANGELOG_FORMATS`, defaults to picking it from each file's extension.
+
+    """
+
+    def __init__(self, sidecar_dir=None, changelog_format=None):
+        self.sidecar_dir = sidecar_dir
+        self.changelog_format = changelog_format
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get_changelog(self, changelog, tag_name):
+        """Gets the section for the tag, see `get_changelog`."""
+        return self.get_index(changelog).section(tag_name)
+
+    def get_index(self, changelog):
+        """Gets the index for the changelog, from memory, the sidecar or by building it.
+
+        Args:
+            changelog (str): Path to changelog file.
+
+        Returns
+            ChangelogIndex: The index of the changelog.
+
+        Raises:
+            FileNotFoundError: If the file couldn't be found.
+            OSError: If couldn't open file for some reason.
+
+        """
+        path = os.path.abspath(changelog)
+        stat = os.stat(path)
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is None or (index.mtime, index.size) != (stat.st_mtime_ns, stat.st_size):
+                index = self._load_sidecar(path, stat) or self._build(path)
+                self._indexes[path] = index
+        return index
+
+    def _build(self, path):
+        index = ChangelogIndex.build(path, self.changelog_format)
+        self._save_sidecar(index)
+        return index
+
+    def _save_sidecar(self, index):
+        sidecar = self._get_sidecar_path(index.path)
+        if sidecar:
+            os.makedirs(self.sidecar_dir, exist_ok=True)
+            with open(sidecar, "w") as sidecar_file:
+                json.dump(index.to_dict(), sidecar_file)
+
+    def _load_sidecar(self, path, stat):
+        sidecar = self._get_sidecar_path(path)
+        try:
+            with open(sidecar, "r") as sidecar_file:
+                data = json.load(sidecar_file)
+        except (TypeError, OSError, ValueError):
+            return None
+
+        if data.get("version") != SIDECAR_VERSION or data["size"] != stat.st_size:
+            return None
+        modified = data["mtime"] != stat.st_mtime_ns
+        if modified and data["digest"] != get_digest(path):
+            return None
+
+        sections = {version: tuple(offsets) for version, offsets in data["sections"].items()}
+        index = ChangelogIndex(path, sections, stat.st_mtime_ns, stat.st_size, data["digest"])
+        if modified:
+            self._save_sidecar(index)
+        return index
+
+    def _get_sidecar_path(self, path):
+        if not self.sidecar_dir:
+            return None
+        name = hashlib.sha256(f"{path}:{self.changelog_format or 'auto'}".encode("utf-8")).hexdigest()
+        return os.path.join(self.sidecar_dir, f"{name}.json")
+
+
+def get_digest(path):
+    """Gets the SHA-256 of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as change:
+        for chunk in iter(lambda: change.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
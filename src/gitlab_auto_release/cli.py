@@ -16,13 +16,41 @@ Example:
     http://google.github.io/styleguide/pyguide.html
 
 """
+import contextvars
+import functools
+import json
 import os
-import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 import click
-import gitlab
-import requests
+
+from gitlab_auto_release.changelog import CHANGELOG_FORMATS
+from gitlab_auto_release.changelog import get_changelog
+from gitlab_auto_release.jobs import list_job_records
+from gitlab_auto_release.lazy import LazyModule
+from gitlab_auto_release.metrics import METRICS_FORMATS
+from gitlab_auto_release.metrics import Metrics
+from gitlab_auto_release.notes import generate_notes
+from gitlab_auto_release.notes import get_notes_cache
+from gitlab_auto_release.options import connection_options
+from gitlab_auto_release.sync import diff_release
+from gitlab_auto_release.sync import sync_release
+from gitlab_auto_release.transport import get_transport
+from gitlab_auto_release.uploads import DEFAULT_PACKAGE_NAME
+from gitlab_auto_release.uploads import DEFAULT_UPLOAD_WORKERS
+from gitlab_auto_release.uploads import get_upload_index
+from gitlab_auto_release.wait import DEFAULT_WAIT_TIMEOUT
+from gitlab_auto_release.wait import JobFailedError
+from gitlab_auto_release.wait import WaitTimeoutError
+from gitlab_auto_release.wait import wait_for_jobs
+
+gitlab = LazyModule("gitlab")
+requests = LazyModule("requests")
+
+JOBS_PER_PAGE = 100
+MAX_WORKERS = 4
+JOB_SCOPES = ("created", "pending", "running", "failed", "success", "canceled", "skipped", "manual")
 
 
 @click.command()
@@ -45,36 +73,464 @@ import requests
 @click.option(
     "--changelog",
     "-c",
-    help="Path to file to changelog file, will append itself to the description with tag matching changelog. Must be in keepachangelog format.",
+    help="Path to file to changelog file, will append itself to the description with tag matching changelog. Can be Markdown (i.e. keepachangelog), reStructuredText or AsciiDoc.",
+)
+@click.option(
+    "--changelog-format",
+    envvar="GITLAB_AUTO_RELEASE_CHANGELOG_FORMAT",
+    default="auto",
+    type=click.Choice(("auto",) + tuple(CHANGELOG_FORMATS)),
+    help="The format of the changelog, auto picks it from the file extension.",
+)
+@click.option(
+    "--notes/--no-notes",
+    envvar="GITLAB_AUTO_RELEASE_NOTES",
+    default=False,
+    help="If there's no changelog, generate release notes from the commits and merge requests since the previous tag.",
+)
+@click.option(
+    "--previous-tag",
+    envvar="GITLAB_AUTO_RELEASE_PREVIOUS_TAG",
+    help="The tag to generate release notes from, defaults to the tag before --tag-name.",
 )
 @click.option("--description", "-d", default="", type=str, help="String to use as the description for the release.")
 @click.option("--asset", "-a", multiple=True, help="An asset to include in the release, i.e. name=link_to_asset.")
 @click.option(
     "--artifacts", multiple=True, help="Will include artifacts from jobs specified in current pipeline. Use job name."
 )
-def cli(private_token, gitlab_url, project_id, tag_name, release_name, changelog, description, asset, artifacts):
+@click.option(
+    "--wait-for-artifacts/--no-wait-for-artifacts",
+    envvar="GITLAB_AUTO_RELEASE_WAIT_FOR_ARTIFACTS",
+    default=False,
+    help="Wait for the --artifacts jobs to succeed, if they are still running.",
+)
+@click.option(
+    "--wait-timeout",
+    envvar="GITLAB_AUTO_RELEASE_WAIT_TIMEOUT",
+    default=DEFAULT_WAIT_TIMEOUT,
+    type=click.IntRange(min=0),
+    help="How long to wait for the --artifacts jobs in seconds, with --wait-for-artifacts.",
+)
+@click.option(
+    "--upload",
+    "-u",
+    multiple=True,
+    help="A file to upload to the generic package registry and include in the release, i.e. path or name=path.",
+)
+@click.option(
+    "--upload-package",
+    envvar="GITLAB_AUTO_RELEASE_UPLOAD_PACKAGE",
+    default=DEFAULT_PACKAGE_NAME,
+    help="The generic package to upload files to, the version is the tag name.",
+)
+@click.option(
+    "--dedup/--no-dedup",
+    envvar="GITLAB_AUTO_RELEASE_DEDUP",
+    default=True,
+    help="Link to files already published in the project with the same SHA-256, instead of uploading them again.",
+)
+@click.option(
+    "--artifacts-scope",
+    multiple=True,
+    type=click.Choice(JOB_SCOPES),
+    help="Only link artifacts from jobs with this status i.e. success, can be used multiple times.",
+)
+@click.option(
+    "--optimistic/--no-optimistic",
+    envvar="GITLAB_AUTO_RELEASE_OPTIMISTIC",
+    default=False,
+    help="Don't check if the release exists first, create it and treat a conflict as it existing. Not with --upload.",
+)
+@click.option(
+    "--sync/--no-sync",
+    envvar="GITLAB_AUTO_RELEASE_SYNC",
+    default=False,
+    help="If the release already exists, update its description and links to match instead of leaving it as it is.",
+)
+@click.option(
+    "--dry-run/--no-dry-run",
+    envvar="GITLAB_AUTO_RELEASE_DRY_RUN",
+    default=False,
+    help="Resolve the release without creating it, print it and how many requests each step made or would make.",
+)
+@click.option(
+    "--lite/--no-lite",
+    envvar="GITLAB_AUTO_RELEASE_LITE",
+    default=False,
+    help="Use a lightweight GitLab client, which starts faster. Not used with --cache or --http2, requests aren't retried.",
+)
+@click.option(
+    "--metrics-file",
+    envvar="GITLAB_AUTO_RELEASE_METRICS_FILE",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write how long each step took and every request made to GitLab to this file, i.e. as a CI artifact.",
+)
+@click.option(
+    "--metrics-format",
+    envvar="GITLAB_AUTO_RELEASE_METRICS_FORMAT",
+    default="jsonl",
+    type=click.Choice(METRICS_FORMATS),
+    help="The format of --metrics-file, JSON lines or OpenMetrics text.",
+)
+@click.option(
+    "--profile/--no-profile",
+    envvar="GITLAB_AUTO_RELEASE_PROFILE",
+    default=False,
+    help="Profile the release with cProfile and tracemalloc, a summary is printed to stderr.",
+)
+@connection_options
+def cli(
+    private_token,
+    gitlab_url,
+    project_id,
+    tag_name,
+    release_name,
+    changelog,
+    changelog_format,
+    notes,
+    previous_tag,
+    description,
+    asset,
+    artifacts,
+    wait_for_artifacts,
+    wait_timeout,
+    upload,
+    upload_package,
+    dedup,
+    artifacts_scope,
+    optimistic,
+    sync,
+    dry_run,
+    lite,
+    metrics_file,
+    metrics_format,
+    profile,
+    cache,
+    cache_dir,
+    max_retries,
+    rate_limit,
+    pool_size,
+    keep_alive,
+    http2,
+    gzip,
+    dns_cache_ttl,
+):
     """Gitlab Auto Release Tool."""
-    gl = gitlab.Gitlab(gitlab_url, private_token=private_token)
-    project = get_gitlab_project(gl, project_id, gitlab_url)
+    metrics = Metrics(profile=profile)
+    try:
+        with metrics.phase("total"):
+            with metrics.phase("connect"):
+                transport = get_transport(pool_size, keep_alive, http2, gzip, dns_cache_ttl)
+                gl = connect(
+                    gitlab_url, private_token, lite, cache, cache_dir, max_retries, rate_limit, metrics, transport
+                )
+            create_release(
+                gl,
+                project_id,
+                gitlab_url,
+                tag_name,
+                release_name,
+                changelog=changelog,
+                description=description,
+                asset=asset,
+                artifacts=artifacts,
+                artifacts_scope=artifacts_scope,
+                get_section=functools.partial(get_changelog, changelog_format=changelog_format),
+                notes=notes,
+                previous_tag=previous_tag,
+                notes_cache=get_notes_cache(cache, cache_dir) if notes and not changelog else None,
+                wait_timeout=wait_timeout if wait_for_artifacts else None,
+                upload=upload,
+                upload_package=upload_package,
+                upload_index=get_upload_index(cache, cache_dir) if upload else None,
+                dedup=dedup,
+                optimistic=optimistic,
+                sync=sync,
+                dry_run=dry_run,
+                metrics=metrics,
+            )
+    finally:
+        report_metrics(metrics, metrics_file, metrics_format)
+
+
+def connect(gitlab_url, private_token, lite, cache, cache_dir, max_retries, rate_limit, metrics=None, transport=None):
+    """Gets the Gitlab object, python-gitlab and requests are only imported if the lite client isn't used.
+
+    Args:
+        gitlab_url (str): The FQDN of the GitLab instance.
+        private_token (str): Private GITLAB token, used to authenticate.
+        lite (bool): Use the lightweight client, unless the cache or HTTP/2 is enabled.
+        cache (bool): If responses should be cached.
+        cache_dir (str): Where to store the cache.
+        max_retries (int): How many times to retry a request.
+        rate_limit (float): The maximum requests per second.
+        metrics (Metrics): If set, every request is recorded in it.
+        transport (Transport): How to connect to GitLab.
 
-    check_if_release_exists(project, tag_name)
-    assets = add_assets(asset)
+    Returns
+        Gitlab: The Gitlab object (or the lite equivalent).
 
-    if artifacts:
-        project_artifacts = try_to_add_artifacts(project, artifacts, gitlab_url)
-        assets += project_artifacts
+    """
+    if lite and not (cache or cache_dir or (transport and transport.http2)):
+        from gitlab_auto_release.lite import LiteGitlab
 
-    if changelog:
-        changelog_data = try_to_get_changelog(changelog, tag_name)
-        description += changelog_data
+        return LiteGitlab(gitlab_url, private_token, metrics=metrics, transport=transport)
 
-    description = description if description else f"Release for {tag_name}"
-    project.releases.create(
-        {"name": release_name, "tag_name": tag_name, "description": description, "assets": {"links": assets}}
+    from gitlab_auto_release.session import create_session
+    from gitlab_auto_release.session import get_cache
+    from gitlab_auto_release.session import get_gitlab
+    from gitlab_auto_release.session import get_scheduler
+
+    scheduler = get_scheduler(max_retries, rate_limit)
+    session = create_session(
+        transport=transport, cache=get_cache(cache, cache_dir), scheduler=scheduler, metrics=metrics
     )
+    return get_gitlab(gitlab_url, private_token, session=session, scheduler=scheduler)
+
+
+def report_metrics(metrics, metrics_file=None, metrics_format="jsonl"):
+    """Writes the metrics to `metrics_file` and prints the profile summary, if profiling is on.
+
+    Args:
+        metrics (Metrics): The metrics recorded during the release.
+        metrics_file (str): Where to write the metrics, if not set they aren't written.
+        metrics_format (str): jsonl or openmetrics.
+
+    """
+    metrics.stop()
+    if metrics_file:
+        metrics.write(metrics_file, metrics_format)
+    if metrics.profile:
+        print(metrics.profile_summary(), file=sys.stderr)
+
+
+def create_release(
+    gl,
+    project_id,
+    gitlab_url,
+    tag_name,
+    release_name,
+    changelog=None,
+    description="",
+    asset=(),
+    artifacts=(),
+    artifacts_scope=(),
+    pipeline_id=None,
+    get_project=None,
+    get_section=None,
+    optimistic=False,
+    metrics=None,
+    upload=(),
+    upload_package=DEFAULT_PACKAGE_NAME,
+    upload_index=None,
+    dedup=True,
+    wait_timeout=None,
+    notes=False,
+    previous_tag=None,
+    notes_cache=None,
+    on_resolved=None,
+    sync=False,
+    dry_run=False,
+):
+    """Creates the release, the steps which don't depend on each other are run at the same time.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        project_id (int): The id of the project to create the release for.
+        gitlab_url (str): The FQDN of the project.
+        tag_name (str): The tag the release should be created from.
+        release_name (str): The name of the release.
+        changelog (str): Path to changelog file.
+        description (str): The description to use for the release.
+        asset (list): A list of assets in the format name=link.
+        artifacts (list): A list Of jobs from the pipeline to link artifacts from.
+        artifacts_scope (list): Only consider jobs with these statuses i.e. success.
+        pipeline_id (str): The pipeline to link artifacts from, defaults to `CI_PIPELINE_ID`.
+        get_project (function): Used to get the project, defaults to `get_gitlab_project`.
+        get_section (function): Used to get the section from the changelog, defaults to `get_changelog`.
+        optimistic (bool): Don't check if the release exists before creating it, if it already exists GitLab will
+            reject it and we exit with 0 anyway. This saves a request when the release doesn't exist. It's ignored when
+            there are files to upload, so they aren't uploaded for a release which already exists.
+        metrics (Metrics): Where to record how long each step took.
+        upload (list): Files to upload to the generic package registry and link in the release, path or name=path.
+        upload_package (str): The generic package to upload the files to.
+        upload_index (UploadIndex): The local index of uploaded files, used to find duplicates without any requests.
+        dedup (bool): Link to files already published in the project instead of uploading the same content again.
+        wait_timeout (int): If set, wait up to this many seconds for the artifacts jobs to succeed.
+        notes (bool): If there's no changelog, generate release notes from the commits since the previous tag.
+        previous_tag (str): The tag to generate release notes from, defaults to the tag before `tag_name`.
+        notes_cache (NotesCache): If set, the release notes for each range of commits are only generated once.
+        on_resolved (function): If set, called with the release once its description and assets have been resolved,
+            before it's created.
+        sync (bool): If the release already exists, update it to match instead of exiting. `optimistic` is ignored,
+            as the existing release has to be fetched to diff it.
+        dry_run (bool): Resolve the release without making any changes, then print it and the requests each step
+            made or would make. Files aren't uploaded and jobs aren't waited for.
+
+    """
+    get_project = get_project or get_gitlab_project
+    metrics = metrics or Metrics()
+    planned_uploads = [] if dry_run else None
+    if dry_run:
+        wait_timeout = None
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        changelog_data = None
+        if changelog:
+            changelog_data = submit_timed(
+                executor, metrics, "changelog", try_to_get_changelog, changelog, tag_name, get_section
+            )
+        with metrics.phase("get_project"):
+            project = get_project(gl, project_id, gitlab_url)
+
+        release_notes = None
+        if notes and not changelog:
+            release_notes = submit_timed(
+                executor, metrics, "notes", try_to_generate_notes, gl, project, tag_name, previous_tag, notes_cache
+            )
+        release_exists = existing_release = None
+        if sync or dry_run:
+            existing_release = submit_timed(executor, metrics, "check_release", get_release, project, tag_name)
+        elif not optimistic or upload:
+            release_exists = submit_timed(
+                executor, metrics, "check_release", check_if_release_exists, project, tag_name
+            )
+
+        # Waiting for the jobs and uploading files can take a long time (and uploads publish files), so they only
+        # start once we know the release doesn't exist.
+        if release_exists and (wait_timeout is not None or upload):
+            release_exists.result()
+        project_artifacts = None
+        if artifacts:
+            project_artifacts = submit_timed(
+                executor,
+                metrics,
+                "artifacts",
+                try_to_add_artifacts,
+                project,
+                artifacts,
+                gitlab_url,
+                artifacts_scope,
+                pipeline_id,
+                wait_timeout,
+            )
+        project_uploads = None
+        if upload:
+            project_uploads = submit_timed(
+                executor,
+                metrics,
+                "uploads",
+                try_to_upload_assets,
+                gl,
+                project,
+                upload,
+                gitlab_url,
+                tag_name,
+                upload_package,
+                upload_index,
+                dedup,
+                planned_uploads,
+            )
+
+        if release_exists:
+            release_exists.result()
+        assets = add_assets(asset)
+
+        if project_artifacts:
+            assets += project_artifacts.result()
+
+        if project_uploads:
+            assets += project_uploads.result()
+
+        if changelog_data:
+            description += changelog_data.result()
+
+        if release_notes:
+            description += release_notes.result()
+
+        existing = existing_release.result() if existing_release else None
+
+    description = description if description else f"Release for {tag_name}"
+    release = {"name": release_name, "tag_name": tag_name, "description": description, "assets": {"links": assets}}
+    if on_resolved:
+        on_resolved(release)
+    if dry_run:
+        print_plan(release, existing, sync, planned_uploads, metrics)
+        return
+
+    if existing is not None:
+        with metrics.phase("sync_release"):
+            try_to_sync_release(project, existing, release)
+        return
+
+    with metrics.phase("create_release"):
+        create_gitlab_release(project, release, optimistic)
     print(f"Created a release for tag {tag_name}.")
 
 
+def submit_timed(executor, metrics, name, func, *args):
+    """Submits a step of the release to the executor, timed as the phase `name`. It runs in a copy of our context, so
+    what it prints is kept with the release when `batch` creates many releases at once.
+
+    Returns
+        concurrent.futures.Future: The result of the step.
+
+    """
+    return executor.submit(contextvars.copy_context().run, metrics.timed(name, func), *args)
+
+
+def print_plan(release, existing, sync, planned_uploads, metrics):
+    """Prints what a dry run would have done, the release and the requests each step made or would make.
+
+    Args:
+        release (dict): The release which would be created.
+        existing (Gitlab.release): The existing release, None if it doesn't exist.
+        sync (bool): If the existing release would be updated.
+        planned_uploads (list): The links to the files which would be uploaded.
+        metrics (Metrics): The phases and requests of the dry run, the planned requests are added to it.
+
+    """
+    tag_name = release["tag_name"]
+    if planned_uploads:
+        workers = min(len(planned_uploads), DEFAULT_UPLOAD_WORKERS)
+        metrics.plan("uploads", len(planned_uploads), rounds=-(-len(planned_uploads) // workers))
+
+    if existing is None:
+        print(f"Dry run, the release for tag {tag_name} would be created with:")
+        metrics.plan("create_release", 1)
+    elif sync:
+        diff = diff_release(existing.attributes, release)
+        if diff:
+            print(f"Dry run, the release for tag {tag_name} would be updated ({diff.summary()}) to:")
+            metrics.plan("sync_release", len(diff), rounds=diff.rounds())
+        else:
+            print(f"Dry run, the release for tag {tag_name} is already up to date:")
+    else:
+        print(f"Dry run, the release for tag {tag_name} already exists, it wouldn't be created:")
+
+    print(json.dumps(release, indent=2))
+    print(metrics.plan_summary())
+
+
+def create_gitlab_release(project, release, optimistic=False):
+    """Creates the release on GitLab.
+
+    Args:
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        release (dict): The release to create.
+        optimistic (bool): If set and GitLab says the release already exists, we exit the same way as
+            `check_if_release_exists` would have.
+
+    """
+    try:
+        project.releases.create(release)
+    except gitlab.exceptions.GitlabCreateError as e:
+        if optimistic and e.response_code == 409:
+            print(f"Release already exists for tag {release['tag_name']}.")
+            sys.exit(0)
+        raise
+
+
 def get_gitlab_project(gl, project_id, gitlab_url):
     """Gets the gitlab project object.
 
@@ -98,6 +554,9 @@ def get_gitlab_project(gl, project_id, gitlab_url):
     except requests.exceptions.MissingSchema:
         print(f"Incorrect --gitlab-url, missing schema i.e. https:// {gitlab_url}.")
         sys.exit(1)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        print(f"Unable to connect to {gitlab_url}: {e}")
+        sys.exit(1)
 
     return project
 
@@ -128,6 +587,40 @@ def check_if_release_exists(project, tag_name):
     return exists
 
 
+def get_release(project, tag_name):
+    """Gets the release for a tag.
+
+    Returns
+        Gitlab.release: The release or None if it doesn't exist.
+
+    """
+    try:
+        return project.releases.get(tag_name) or None
+    except gitlab.exceptions.GitlabGetError:
+        return None
+
+
+def try_to_sync_release(project, existing, release):
+    """Updates the existing release to match `release`, see `sync.sync_release`.
+
+    Args:
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        existing (Gitlab.release): The release on GitLab.
+        release (dict): The release we would have created.
+
+    """
+    try:
+        diff = sync_release(project.manager.gitlab, project.id, existing.attributes, release)
+    except gitlab.exceptions.GitlabError as e:
+        print(f"Unable to update the release for tag {release['tag_name']}: {e.error_message}")
+        sys.exit(1)
+
+    if diff:
+        print(f"Updated the release for tag {release['tag_name']}: {diff.summary()}.")
+    else:
+        print(f"Release for tag {release['tag_name']} is already up to date.")
+
+
 def add_assets(asset):
     """Gets the asset in the correct format for the API request to create the release and include these extra assets
     with the release.
@@ -153,22 +646,25 @@ def add_assets(asset):
     return assets
 
 
-def try_to_add_artifacts(project, artifacts, gitlab_url):
+def try_to_add_artifacts(project, artifacts, gitlab_url, scope=None, pipeline_id=None, wait_timeout=None):
     """Try to get the artifacts from the job name specified.
 
     Args:
         project (Gitlab.project): Gitlab project object, to make API requests.
         artifacts (list): A list Of jobs from current pipeline to link artifacts from.
         gitlab_url (str): The url of the gitlab project.
+        scope (list): Only consider jobs with these statuses i.e. success, if not set all jobs are considered.
+        pipeline_id (str): The pipeline to link artifacts from, defaults to `CI_PIPELINE_ID`.
+        wait_timeout (int): If set, wait up to this many seconds for the jobs to succeed.
 
     Returns
         list: (of dicts), which includes a name and url for the asset we will include in the release.
 
     """
     try:
-        artifacts = add_artifacts(project, artifacts, gitlab_url)
+        artifacts = add_artifacts(project, artifacts, gitlab_url, scope, pipeline_id, wait_timeout)
     except gitlab.exceptions.GitlabGetError:
-        print(f"Invalid pipeline id {os.environ['CI_PIPELINE_ID']}.")
+        print(f"Invalid pipeline id {pipeline_id or os.environ['CI_PIPELINE_ID']}.")
         sys.exit(1)
     except IndexError:
         print(f"One of the jobs specified is not found cannot link artifacts {artifacts}.")
@@ -176,97 +672,287 @@ def try_to_add_artifacts(project, artifacts, gitlab_url):
     except KeyError:
         print("Missing `CI_PIPELINE_ID` ENV variable.")
         sys.exit(1)
+    except (JobFailedError, WaitTimeoutError) as e:
+        print(f"Unable to link artifacts {artifacts}. {e}")
+        sys.exit(1)
 
     return artifacts
 
 
-def add_artifacts(project, artifacts, project_url):
+def try_to_upload_assets(
+    gl, project, upload, gitlab_url, tag_name, package_name=DEFAULT_PACKAGE_NAME, index=None, dedup=True, planned=None
+):
+    """Try to upload files to the generic package registry, to include in the release.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        upload (list): A list of files to upload in the format path or name=path.
+        gitlab_url (str): The FQDN of the GitLab instance.
+        tag_name (str): The tag name, used as the version of the package.
+        package_name (str): The generic package to upload the files to.
+        index (UploadIndex): The local index of uploaded files.
+        dedup (bool): Link to files already published in the project instead of uploading them again.
+        planned (list): If set, it's a dry run. The files aren't uploaded, the links to them are added to it.
+
+    Returns
+        list: (of dicts), which includes a name and url for the asset we will include in the release.
+
+    """
+    from gitlab_auto_release.uploads import upload_assets
+
+    try:
+        uploaded = upload_assets(
+            gl,
+            project,
+            upload,
+            gitlab_url,
+            tag_name,
+            package_name,
+            index=index,
+            dedup=dedup,
+            dry_run=planned is not None,
+        )
+    except OSError as e:
+        print(f"Unable to open file to upload {e.filename}.")
+        sys.exit(1)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    except gitlab.exceptions.GitlabError as e:
+        print(f"Unable to upload files {upload}: {e.error_message}")
+        sys.exit(1)
+
+    links = []
+    for link, sha256, status in uploaded:
+        if status == "reused":
+            print(f"Reused {link['name']} (sha256 {sha256}), it's already published at {link['url']}.")
+        elif status == "planned":
+            print(f"Would upload {link['name']} (sha256 {sha256}) to {link['url']}.")
+            planned.append(link)
+        else:
+            print(f"Uploaded {link['name']} (sha256 {sha256}).")
+        links.append(link)
+    return links
+
+
+def add_artifacts(project, artifacts, project_url, scope=None, pipeline_id=None, wait_timeout=None):
     """Gets the artifacts from the job name specified. Gets the current pipeline id,
-    then matches the jobs we are looking finds the job id.
+    then matches the jobs we are looking finds the job id. Jobs in downstream pipelines are found too.
 
     Args:
         project (Gitlab.project): Gitlab project object, to make API requests.
         artifacts (list): A list Of jobs from current pipeline to link artifacts from.
         project_url (str): The url of the gitlab project.
+        scope (list): Only consider jobs with these statuses i.e. success, if not set all jobs are considered.
+        pipeline_id (str): The pipeline to link artifacts from, defaults to `CI_PIPELINE_ID`.
+        wait_timeout (int): If set, wait up to this many seconds for the jobs to succeed, `scope` isn't used as only
+            successful jobs are linked.
 
     Returns
         list: (of dicts), which includes a name and url for the asset we will include in the release.
 
     Raises
         IndexError: When the job doesn't exist in the pipeline jobs list.
-        KeyError: When `CI_PIPELINE_ID` ENV variable is not set.
+        JobFailedError: When waiting and one of the jobs fails.
+        WaitTimeoutError: When waiting and the jobs haven't succeeded within `wait_timeout` seconds.
+        KeyError: When `pipeline_id` is not passed and `CI_PIPELINE_ID` ENV variable is not set.
 
     """
     assets = []
 
-    pipeline_id = os.environ["CI_PIPELINE_ID"]
+    pipeline_id = pipeline_id or os.environ["CI_PIPELINE_ID"]
     pipeline = project.pipelines.get(pipeline_id)
-    jobs = pipeline.jobs.list()
+    if wait_timeout is None:
+        jobs = index_pipeline_tree(project, pipeline, artifacts, scope=scope)
+    else:
+        resolve = functools.partial(index_pipeline_tree, project, pipeline)
+        jobs = wait_for_jobs(project.manager.gitlab, resolve, artifacts, timeout=wait_timeout)
 
     for artifact in artifacts:
-        matched = [job for job in jobs if job.name == artifact][0]
-        job_id = matched.id
-        artifact_link = {"name": f"Artifact: {artifact}", "url": f"{project_url}/-/jobs/{job_id}/artifacts/download"}
-        assets.append(artifact_link)
+        try:
+            job, job_project_id = jobs[artifact]
+        except KeyError:
+            raise IndexError(f"Job {artifact} not found in pipeline {pipeline_id}.") from None
+
+        if str(job_project_id) == str(project.id):
+            url = f"{project_url}/-/jobs/{job.id}/artifacts/download"
+        else:
+            url = f"{job.web_url}/artifacts/download"
+        assets.append({"name": f"Artifact: {artifact}", "url": url})
 
     return assets
 
 
-def try_to_get_changelog(changelog, tag_name):
-    """Try to get details from the changelog to include in the description of the release.
+def index_pipeline_tree(project, pipeline, names, scope=None, max_workers=MAX_WORKERS):
+    """Builds an index of job name to job across a pipeline and all its downstream (child and multi-project)
+    pipelines. The tree is walked breadth first, the jobs and bridges of every pipeline in a level are listed at the
+    same time. We stop once every job in `names` has been found, so downstream pipelines are only listed if they
+    are needed.
 
     Args:
-        changelog (str): Path to changelog file.
-        tag_name (str): The tag name i.e. release/0.1.0, must contain semantic versioning somewhere in the tag (0.1.0).
+        project (Gitlab.project): The project the pipeline belongs to.
+        pipeline (Gitlab.pipeline): The pipeline at the root of the tree.
+        names (list): The job names we need to find.
+        scope (list): Only list jobs with these statuses i.e. success, if not set all jobs are listed.
+        max_workers (int): How many requests to make at the same time.
 
     Returns
-        str: The description to use for the release.
+        dict: Job name to (job, project id). A job found in a pipeline closer to the root is preferred, then the
+            latest job with that name.
+
+    """
+    gl = project.manager.gitlab
+    index = {}
+    level = [(project, pipeline)]
+    visited = {(str(project.id), str(pipeline.id))}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            missing = [name for name in names if name not in index]
+            # The workers run in a copy of our context, so their requests are recorded in our metrics phase and
+            # bypass the cache when `wait_for_jobs` resolves.
+            jobs = [
+                executor.submit(contextvars.copy_context().run, index_pipeline_jobs, level_pipeline, missing, scope)
+                for _, level_pipeline in level
+            ]
+            bridges = [
+                executor.submit(contextvars.copy_context().run, list_downstream_pipelines, gl, *item) for item in level
+            ]
+
+            found = {}
+            for (level_project, _), level_jobs in zip(level, jobs):
+                for name, job in level_jobs.result().items():
+                    latest = found.get(name)
+                    if name not in index and (latest is None or int(job.id) > int(latest[0].id)):
+                        found[name] = (job, level_project.id)
+            index.update(found)
+            if all(name in index for name in names):
+                break
+
+            next_level = []
+            for downstream in bridges:
+                for project_id, pipeline_id in downstream.result():
+                    if (str(project_id), str(pipeline_id)) in visited:
+                        continue
+                    visited.add((str(project_id), str(pipeline_id)))
+                    downstream_project = project
+                    if str(project_id) != str(project.id):
+                        downstream_project = gl.projects.get(project_id, lazy=True)
+                    next_level.append((downstream_project, downstream_project.pipelines.get(pipeline_id, lazy=True)))
+            level = next_level
+
+    return index
+
+
+def list_downstream_pipelines(gl, project, pipeline):
+    """Lists the pipelines triggered by the bridge jobs of a pipeline.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        project (Gitlab.project): The project the pipeline belongs to.
+        pipeline (Gitlab.pipeline): The pipeline to list the bridges of.
+
+    Returns
+        list: Of (project id, pipeline id), bridges which haven't created their pipeline yet are skipped.
 
     """
+    path = f"/projects/{project.id}/pipelines/{pipeline.id}/bridges"
     try:
-        description = f"\n\n {get_changelog(changelog, tag_name)}"
-    except (IndexError, AttributeError):
-        print(f"Invalid tag name doesn't contain a valid semantic version {tag_name}.")
-        sys.exit(1)
-    except FileNotFoundError:
-        print(f"Unable to find changelog file at {changelog}.")
+        bridges = gl.http_list(path, {"per_page": JOBS_PER_PAGE}, all=True)
+    except gitlab.exceptions.GitlabError:
+        return []
+
+    downstream = []
+    for bridge in bridges:
+        downstream_pipeline = bridge.get("downstream_pipeline")
+        if downstream_pipeline:
+            downstream.append((downstream_pipeline["project_id"], downstream_pipeline["id"]))
+    return downstream
+
+
+def index_pipeline_jobs(pipeline, names, scope=None, per_page=JOBS_PER_PAGE):
+    """Builds an index of job name to the latest job with that name. Jobs are fetched a page at a time and
+    we stop requesting pages as soon as every job in `names` has been found. Only the fields we need of each job are
+    kept, see `jobs.JobRecord`.
+
+    Args:
+        pipeline (Gitlab.pipeline): Gitlab pipeline object, to list the jobs from.
+        names (list): The job names we need to find.
+        scope (list): Only list jobs with these statuses i.e. success, if not set all jobs are listed.
+        per_page (int): How many jobs to request per page.
+
+    Returns
+        dict: Job name to `JobRecord`, if a job was retried the one with the highest id is kept.
+
+    """
+    wanted = set(names)
+    index = {}
+    page = 1
+
+    while True:
+        jobs = list_job_records(pipeline, page, per_page, scope)
+        for job in jobs:
+            latest = index.get(job.name)
+            if latest is None or job.id > latest.id:
+                index[job.name] = job
+
+        if len(jobs) < per_page or wanted.issubset(index):
+            break
+        page += 1
+
+    return index
+
+
+def try_to_generate_notes(gl, project, tag_name, previous_tag=None, cache=None):
+    """Try to generate release notes from the commits and merge requests since the previous tag.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        project (Gitlab.project): Gitlab project object, to make API requests.
+        tag_name (str): The tag the release is created from.
+        previous_tag (str): The tag to start from, defaults to the tag before `tag_name`.
+        cache (NotesCache): If set, the release notes for each range of commits are only generated once.
+
+    Returns
+        str: The release notes to add to the description of the release.
+
+    """
+    try:
+        notes = generate_notes(gl, project.id, tag_name, previous_tag, cache)
+    except ValueError as e:
+        print(e)
         sys.exit(1)
-    except OSError:
-        print(f"Unable to open changelog file at {changelog}.")
+    except gitlab.exceptions.GitlabError as e:
+        print(f"Unable to generate release notes for {tag_name}: {e.error_message}")
         sys.exit(1)
 
-    return description
+    return f"\n\n{notes}" if notes else ""
 
 
-def get_changelog(changelog, tag_name):
-    """Gets details from the changelog to include in the description of the release.
-    The changelog must adhere to the keepachangelog format.
+def try_to_get_changelog(changelog, tag_name, get_section=None):
+    """Try to get details from the changelog to include in the description of the release.
 
     Args:
         changelog (str): Path to changelog file.
         tag_name (str): The tag name i.e. release/0.1.0, must contain semantic versioning somewhere in the tag (0.1.0).
+        get_section (function): Used to get the section from the changelog, defaults to `get_changelog`.
 
     Returns
         str: The description to use for the release.
 
-    Raises:
-        AttributeError: If the tag_name doesn't contain semantic versioning somewhere within the name.
-        FileNotFoundError: If the file couldn't be found.
-        OSError: If couldn't open file for some reason.
-
     """
-    with open(changelog, "r") as change:
-        content = change.read()
-        semver = r"((([0-9]+)\.([0-9]+)\.([0-9]+)(?:-([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?)(?:\+([0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?)"
-        semver_tag = re.search(semver, tag_name).group(0)
-        if semver_tag:
-            semver_changelog = f"## [{semver_tag}]"
-            description = "\n"
-
-            position_start = content.find(semver_changelog)
-            if position_start:
-                position_end = content[position_start + 2 :].find("## [")
-                position_end = (position_end + position_start + 2) if position_end != -1 else -1
-                description = content[position_start:position_end]
+    get_section = get_section or get_changelog
+    try:
+        description = f"\n\n {get_section(changelog, tag_name)}"
+    except (IndexError, AttributeError):
+        print(f"Invalid tag name doesn't contain a valid semantic version {tag_name}.")
+        sys.exit(1)
+    except FileNotFoundError:
+        print(f"Unable to find changelog file at {changelog}.")
+        sys.exit(1)
+    except OSError:
+        print(f"Unable to open changelog file at {changelog}.")
+        sys.exit(1)
 
     return description
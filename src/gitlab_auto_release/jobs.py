@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""This module lists the jobs of a pipeline as compact records, used to find the jobs to link artifacts from.
+
+python-gitlab builds a `ProjectPipelineJob` for every job it lists, each keeps the whole JSON response (the commit,
+the runner, the user, the artifacts ...) and a reference to its manager. We only need a few fields of each job, so the
+jobs are streamed with `pager.iter_page` and each one is decoded straight into a `JobRecord`, which only has the fields
+needed to link its artifacts and to wait for it. When the server and batch modes index the jobs of thousands of
+pipelines this uses about an order of magnitude less memory.
+
+"""
+from gitlab_auto_release.pager import iter_page
+
+
+class JobRecord:
+    """The fields of a job needed to link its artifacts, like a python-gitlab job the fields are attributes.
+
+    Args:
+        name (str): The name of the job.
+        job_id (int): The id of the job, the `id` attribute.
+        status (str): The status of the job i.e. success.
+        finished_at (str): When the job finished, None if it hasn't.
+        web_url (str): The url of the job, used to link artifacts from other projects.
+        has_artifacts (bool): If the job has an artifacts archive to download.
+
+    """
+
+    __slots__ = ("name", "id", "status", "finished_at", "web_url", "has_artifacts")
+
+    def __init__(self, name, job_id, status=None, finished_at=None, web_url=None, has_artifacts=False):
+        self.name = name
+        self.id = job_id
+        self.status = status
+        self.finished_at = finished_at
+        self.web_url = web_url
+        self.has_artifacts = has_artifacts
+
+    @classmethod
+    def from_attributes(cls, attributes):
+        """Decodes a job from the JSON returned by the API, every other field is dropped.
+
+        Args:
+            attributes (dict): The job, as returned by the API.
+
+        Returns
+            JobRecord: The job.
+
+        """
+        return cls(
+            attributes["name"],
+            int(attributes["id"]),
+            attributes.get("status"),
+            attributes.get("finished_at"),
+            attributes.get("web_url"),
+            has_artifacts(attributes),
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, JobRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"JobRecord(name={self.name!r}, id={self.id!r}, status={self.status!r})"
+
+
+def has_artifacts(attributes):
+    """GitLab lists the files in `artifacts`, older versions only return `artifacts_file`."""
+    artifacts = attributes.get("artifacts")
+    if artifacts is not None:
+        return any(artifact.get("file_type") == "archive" for artifact in artifacts)
+    return bool(attributes.get("artifacts_file"))
+
+
+def list_job_records(pipeline, page, per_page, scope=None):
+    """Lists a page of the jobs of a pipeline, without building a python-gitlab object for each job.
+
+    Args:
+        pipeline (Gitlab.pipeline): The pipeline to list the jobs of (python-gitlab or lite), only its `jobs`
+            manager is used.
+        page (int): The page to list.
+        per_page (int): How many jobs to request per page.
+        scope (list): Only list jobs with these statuses i.e. success, if not set all jobs are listed.
+
+    Returns
+        list: Of `JobRecord`, in the order GitLab returned them.
+
+    """
+    manager = pipeline.jobs
+    query = {"scope[]": list(scope)} if scope else {}
+    jobs = iter_page(manager.gitlab, manager.path, dict(query, page=page, per_page=per_page))
+    return [JobRecord.from_attributes(job) for job in jobs]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""This module defers importing modules until they are used. python-gitlab and requests take most of the time it
+takes the cli to start, and with `--lite` they're only needed if something goes wrong.
+
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """A module which is only imported the first time one of its attributes is used.
+
+    Args:
+        name (str): The name of the module, i.e. gitlab.
+
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""This module is a lightweight GitLab client, used by `--lite`. It only implements the endpoints the cli uses and
+only needs the standard library, so the cli doesn't have to import python-gitlab and requests when it starts.
+
+It has the same interface as the parts of python-gitlab the cli uses and raises the same exceptions. python-gitlab
+is only imported to raise them, so only when something goes wrong. The one difference is `releases.get` returns
+`None` when the release doesn't exist, instead of raising an exception.
+
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_PER_PAGE = 100
+DEFAULT_TIMEOUT = 60
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+_errors_lock = threading.Lock()
+
+
+class LiteGitlab:
+    """The lightweight equivalent of the `gitlab.Gitlab` object.
+
+    Args:
+        gitlab_url (str): The FQDN of the GitLab instance.
+        private_token (str): Private GITLAB token, used to authenticate.
+        timeout (int): How long to wait for GitLab to respond, in seconds.
+        metrics (Metrics): If set, every request is recorded in it.
+        transport (Transport): Only its gzip setting is used, urllib opens a new connection for every request.
+
+    """
+
+    def __init__(self, gitlab_url, private_token, timeout=DEFAULT_TIMEOUT, metrics=None, transport=None):
+        self.url = gitlab_url.rstrip("/")
+        self.metrics = metrics
+        self.api_url = f"{self.url}/api/v4"
+        self.timeout = timeout
+        self.headers = {
+            "PRIVATE-TOKEN": private_token,
+            "User-Agent": "gitlab-auto-release",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip" if transport is None or transport.gzip else "identity",
+        }
+        self.projects = ProjectManager(self)
+
+    def http_request(
+        self, method, path, query_data=None, post_data=None, error="GitlabGetError", missing_ok=False, data=None
+    ):
+        """Makes a request to the GitLab API.
+
+        Args:
+            method (str): The HTTP method i.e. GET.
+            path (str): The path of the endpoint, after /api/v4.
+            query_data (dict): The query parameters, lists are sent as `key[]=value`.
+            post_data (dict): Sent as the JSON body of the request.
+            error (str): The python-gitlab exception to raise if the request fails.
+            missing_ok (bool): If set a `404` is returned instead of raising an exception.
+            data (file): Sent as the body of the request a chunk at a time, instead of `post_data`. Must support
+                `len`.
+
+        Returns
+            tuple: The status code and decoded JSON body.
+
+        """
+        url = self._build_url(path, query_data)
+        headers = dict(self.headers)
+        if data is not None:
+            headers["Content-Type"] = "application/octet-stream"
+            headers["Content-Length"] = str(len(data))
+        elif post_data is not None:
+            data = json.dumps(post_data).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        request = urllib.request.Request(url, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = response.read()
+                self._record(method, url, response.status, body, start)
+                return response.status, json.loads(decode_body(response.headers, body) or b"null")
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            self._record(method, url, e.code, body, start)
+            if missing_ok and e.code == 404:
+                return e.code, None
+            raise_error(error, e.code, decode_body(e.headers, body))
+        except OSError as e:
+            self._record(method, url, None, b"", start)
+            raise_connection_error(url, e)
+
+    def http_get(self, path, query_data=None, **kwargs):
+        """Gets `path`, like python-gitlab's `http_get`.
+
+        Returns
+            dict: The decoded JSON body.
+
+        """
+        return self.http_request("GET", path, query_data=dict(query_data or {}, **kwargs))[1]
+
+    def http_post(self, path, query_data=None, post_data=None, **kwargs):
+        """Posts `post_data` to `path`, like python-gitlab's `http_post`."""
+        return self.http_request("POST", path, query_data, post_data, error="GitlabHttpError", **kwargs)[1]
+
+    def http_put(self, path, query_data=None, post_data=None, **kwargs):
+        """Puts `post_data` to `path`, like python-gitlab's `http_put`."""
+        return self.http_request("PUT", path, query_data, post_data, error="GitlabHttpError", **kwargs)[1]
+
+    def http_delete(self, path, **kwargs):
+        """Deletes `path`, like python-gitlab's `http_delete`."""
+        return self.http_request("DELETE", path, error="GitlabHttpError", **kwargs)[1]
+
+    def http_list(self, path, query_data=None, **kwargs):
+        """Lists the items at `path`, like python-gitlab's `http_list`. If `all` is set every page is fetched.
+
+        Returns
+            list: The decoded items.
+
+        """
+        query_data = dict(query_data or {}, **kwargs)
+        if not query_data.pop("all", False):
+            return self.http_request("GET", path, query_data=query_data)[1]
+
+        per_page = int(query_data.setdefault("per_page", DEFAULT_PER_PAGE))
+        page = int(query_data.pop("page", 1))
+        items = []
+        while True:
+            _, batch = self.http_request("GET", path, query_data=dict(query_data, page=page))
+            items += batch
+            if len(batch) < per_page:
+                return items
+            page += 1
+
+    def http_stream(self, path, query_data=None):
+        """Gets `path` without reading the body, used by `pager` to decode large lists as they arrive.
+
+        Returns
+            tuple: The response headers and an iterator over the body in chunks, the response is closed once the body
+                has been read (or the iterator is closed).
+
+        """
+        url = self._build_url(path, query_data)
+        start = time.perf_counter()
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=self.headers), timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            self._record("GET", url, e.code, body, start)
+            raise_error("GitlabHttpError", e.code, decode_body(e.headers, body))
+        except OSError as e:
+            self._record("GET", url, None, b"", start)
+            raise_connection_error(url, e)
+        return response.headers, self._iter_body(response, url, start)
+
+    def _iter_body(self, response, url, start):
+        size = 0
+        decompressor = zlib.decompressobj(GZIP_WBITS) if is_gzip(response.headers) else None
+        try:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                size += len(chunk)
+                yield decompressor.decompress(chunk) if decompressor else chunk
+            if decompressor:
+                yield decompressor.flush()
+        finally:
+            response.close()
+            if self.metrics:
+                self.metrics.record_request("GET", url, response.status, size, time.perf_counter() - start)
+
+    def http_put_file(self, path, reader, query_data=None):
+        """Streams a file to the GitLab API, used by `uploads.upload_assets`.
+
+        Returns
+            dict: The decoded JSON response.
+
+        """
+        _, body = self.http_request("PUT", path, query_data=query_data, data=reader, error="GitlabUploadError")
+        return body
+
+    def http_get_conditional(self, path, etag=None):
+        """Gets `path` with the `If-None-Match` header, used by `wait.wait_for_jobs` to poll jobs.
+
+        Args:
+            path (str): The path of the endpoint, after /api/v4.
+            etag (str): The ETag of the last response, if set GitLab responds with a `304` if nothing changed.
+
+        Returns
+            tuple: The decoded JSON body (None if it hasn't changed) and the ETag of the response.
+
+        """
+        url = f"{self.api_url}{path}"
+        headers = dict(self.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                body = response.read()
+                self._record("GET", url, response.status, body, start)
+                return json.loads(decode_body(response.headers, body) or b"null"), response.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            self._record("GET", url, e.code, body, start)
+            if e.code == 304:
+                return None, etag
+            raise_error("GitlabGetError", e.code, decode_body(e.headers, body))
+        except OSError as e:
+            self._record("GET", url, None, b"", start)
+            raise_connection_error(url, e)
+
+    def _build_url(self, path, query_data=None):
+        if not urllib.parse.urlparse(self.url).scheme:
+            raise get_requests_exceptions().MissingSchema(f"Invalid URL {self.url}: No scheme supplied.")
+
+        url = f"{self.api_url}{path}"
+        if query_data:
+            url = f"{url}?{encode_query(query_data)}"
+        return url
+
+    def _record(self, method, url, status, body, start):
+        if self.metrics:
+            self.metrics.record_request(method, url, status, len(body), time.perf_counter() - start)
+
+
+class ProjectManager:
+    def __init__(self, gl):
+        self.gitlab = gl
+
+    def get(self, project_id, lazy=False):
+        """Like python-gitlab, with `lazy` the project isn't fetched, i.e. to list the jobs of one of its pipelines."""
+        if lazy:
+            return Project(self, {"id": project_id})
+        _, attributes = self.gitlab.http_request("GET", f"/projects/{quote(project_id)}")
+        return Project(self, attributes)
+
+
+class LiteObject:
+    """A GitLab object, its attributes are the fields in the JSON response."""
+
+    def __init__(self, manager, attributes):
+        self.manager = manager
+        self.attributes = attributes
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__["attributes"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class Project(LiteObject):
+    def __init__(self, manager, attributes):
+        super().__init__(manager, attributes)
+        self.releases = ReleaseManager(manager.gitlab, self.id)
+        self.pipelines = PipelineManager(manager.gitlab, self.id)
+
+
+class ReleaseManager:
+    def __init__(self, gl, project_id):
+        self.gitlab = gl
+        self.path = f"/projects/{quote(project_id)}/releases"
+
+    def get(self, tag_name):
+        status_code, attributes = self.gitlab.http_request("GET", f"{self.path}/{quote(tag_name)}", missing_ok=True)
+        if status_code == 404:
+            return None
+        return LiteObject(self, attributes)
+
+    def create(self, data):
+        _, attributes = self.gitlab.http_request("POST", self.path, post_data=data, error="GitlabCreateError")
+        return LiteObject(self, attributes)
+
+
+class PipelineManager:
+    def __init__(self, gl, project_id):
+        self.gitlab = gl
+        self.path = f"/projects/{quote(project_id)}/pipelines"
+
+    def get(self, pipeline_id, lazy=True):
+        """Like `lazy=True` in python-gitlab, the pipeline isn't fetched until we list its jobs."""
+        return Pipeline(self, {"id": pipeline_id})
+
+
+class Pipeline(LiteObject):
+    def __init__(self, manager, attributes):
+        super().__init__(manager, attributes)
+        self.jobs = JobManager(manager.gitlab, f"{manager.path}/{quote(self.id)}/jobs")
+
+
+class JobManager:
+    def __init__(self, gl, path):
+        self.gitlab = gl
+        self.path = path
+
+    def list(self, **query_data):  # noqa: A003 - the same API as python-gitlab's managers.
+        _, jobs = self.gitlab.http_request("GET", self.path, query_data=query_data)
+        return [LiteObject(self, job) for job in jobs]
+
+
+def quote(value):
+    return urllib.parse.quote(str(value), safe="")
+
+
+def encode_query(query_data):
+    """Encodes the query parameters the same way as python-gitlab, lists are sent as `key[]=value`. Like
+    `http_list` in python-gitlab the key can already end with `[]`.
+
+    """
+    query = []
+    for key, value in query_data.items():
+        if isinstance(value, (list, tuple)):
+            name = key if key.endswith("[]") else f"{key}[]"
+            query.extend((name, item) for item in value)
+        else:
+            query.append((key, value))
+    return urllib.parse.urlencode(query)
+
+
+def is_gzip(headers):
+    return ((headers or {}).get("Content-Encoding") or "").lower() == "gzip"
+
+
+def decode_body(headers, body):
+    """Decompresses the body if GitLab gzipped it, the metrics record the size before it's decompressed."""
+    return zlib.decompress(body, GZIP_WBITS) if body and is_gzip(headers) else body
+
+
+def raise_error(error, status_code, body):
+    """Raises the same exception python-gitlab would have."""
+    try:
+        message = json.loads(body).get("message") or body
+    except (ValueError, AttributeError):
+        message = body
+
+    exceptions = get_gitlab_exceptions()
+    exception = exceptions.GitlabAuthenticationError if status_code == 401 else getattr(exceptions, error)
+    raise exception(error_message=message, response_code=status_code, response_body=body)
+
+
+def raise_connection_error(url, error):
+    """Raises the same exception requests (so python-gitlab) would have when there's no response, i.e. the host can't
+    be resolved, the connection is refused or it timed out.
+
+    """
+    exceptions = get_requests_exceptions()
+    reason = getattr(error, "reason", error)
+    exception = exceptions.Timeout if isinstance(reason, TimeoutError) else exceptions.ConnectionError
+    raise exception(f"{reason}, requesting {url}") from error
+
+
+def get_gitlab_exceptions():
+    with _errors_lock:
+        from gitlab import exceptions
+    return exceptions
+
+
+def get_requests_exceptions():
+    with _errors_lock:
+        from requests import exceptions
+    return exceptions
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""This module records how long each step of a release takes and every request made to the GitLab API, so we can
+tell where the time in a slow release job went.
+
+The metrics can be written as JSON lines, one line per phase/request, or as an OpenMetrics text file which CI can
+collect as an artifact. With `profile` set the Python side is also profiled with cProfile and tracemalloc, every
+thread which runs a phase gets its own profiler and the results are merged in the summary.
+
+The current phase is kept in a context variable, so requests made by threads which run in a copy of the context of the
+thread that started the phase (i.e. the workers of `uploads.upload_assets`) are recorded in it too.
+
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import io
+import json
+import re
+import threading
+import time
+
+METRICS_FORMATS = ("jsonl", "openmetrics")
+METRICS_PREFIX = "gitlab_auto_release"
+GENERIC_PACKAGE_FILE = re.compile(r"/packages/generic/[^/]+/[^/]+/[^/]+")
+ID_SEGMENT = re.compile(r"/(projects|pipelines|jobs|releases|tags|bridges|merge_requests)/[^/]+")
+
+
+class Metrics:
+    """Records phase timings and requests, can be shared between threads.
+
+    Args:
+        profile (bool): If set, each phase is profiled with cProfile and memory allocations are traced.
+
+    """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.phases = []
+        self.requests = []
+        self.planned = []
+        self.started = time.perf_counter()
+        self.peak_memory = None
+        self._snapshot = None
+        self._profilers = []
+        self._phase = contextvars.ContextVar("phase", default=None)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if profile:
+            import tracemalloc
+
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Times the code in the with block as the phase `name`, requests made in this context are recorded in it."""
+        profiler = self._start_profiler()
+        token = self._phase.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self._phase.reset(token)
+            if profiler:
+                profiler.disable()
+                self._local.profiler = None
+            with self._lock:
+                self.phases.append({"type": "phase", "name": name, "duration": duration})
+
+    def timed(self, name, func):
+        """Wraps `func` so each call is timed as the phase `name`, i.e. before submitting it to an executor."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def record_request(self, method, url, status, size, latency, retries=0, cache=None):
+        """Records a request made to the GitLab API.
+
+        Args:
+            method (str): The HTTP method i.e. GET.
+            url (str): The url of the request, the ids in it are removed to get the endpoint.
+            status (int): The status code of the response, None if no response was received.
+            size (int): The size of the response body in bytes, None if it isn't known.
+            latency (float): How long the request took in seconds, including retries.
+            retries (int): How many times the request was retried.
+            cache (str): hit, miss or revalidated if the response cache was used.
+
+        """
+        request = {
+            "type": "request",
+            "method": method,
+            "endpoint": get_endpoint(url),
+            "status": status,
+            "bytes": size,
+            "latency": latency,
+            "retries": retries,
+            "cache": cache,
+            "phase": self._phase.get(),
+        }
+        with self._lock:
+            self.requests.append(request)
+
+    def plan(self, name, requests, rounds=1):
+        """Records the requests a phase would make, in a dry run.
+
+        Args:
+            name (str): The phase, i.e. create_release.
+            requests (int): How many requests it would make.
+            rounds (int): How many of the requests would be made one after the other, the rest are made at the same
+                time.
+
+        """
+        with self._lock:
+            self.planned.append({"type": "plan", "name": name, "requests": requests, "rounds": rounds})
+
+    def plan_summary(self):
+        """Summarises the requests made and the time spent in each phase, followed by the phases which were planned.
+        Planned phases are predicted to take as long as the average request did, for each round of requests.
+
+        Returns
+            str: A table of the phases, the number of requests and the seconds each took or is predicted to take.
+
+        """
+        with self._lock:
+            phases, requests, planned = list(self.phases), list(self.requests), list(self.planned)
+
+        rows = collections.OrderedDict()
+        for phase in phases:
+            if phase["name"] != "total":
+                count, duration = rows.get(phase["name"], (0, 0.0))
+                rows[phase["name"]] = (count, duration + phase["duration"])
+        for request in requests:
+            name = request["phase"] if request["phase"] in rows else "other"
+            count, duration = rows.get(name, (0, 0.0))
+            rows[name] = (count + 1, duration)
+
+        latency = sum(request["latency"] for request in requests) / len(requests) if requests else 0.0
+        elapsed = time.perf_counter() - self.started
+        lines = [f"{'Step':<20} {'Requests':>8} {'Seconds':>8}"]
+        lines += [f"{name:<20} {count:>8} {duration:>8.3f}  observed" for name, (count, duration) in rows.items()]
+        predicted = 0.0
+        for phase in planned:
+            predicted += latency * phase["rounds"]
+            lines.append(f"{phase['name']:<20} {phase['requests']:>8} {latency * phase['rounds']:>8.3f}  predicted")
+        total = len(requests) + sum(phase["requests"] for phase in planned)
+        lines.append(f"{'total':<20} {total:>8} {elapsed + predicted:>8.3f}  predicted")
+        return "\n".join(lines)
+
+    def stop(self):
+        """Stops tracing memory allocations, recording the peak."""
+        if self.profile:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+                self._snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+    def write(self, path, metrics_format="jsonl"):
+        """Writes the metrics to a file.
+
+        Args:
+            path (str): Path to the file.
+            metrics_format (str): jsonl or openmetrics.
+
+        """
+        content = self.to_openmetrics() if metrics_format == "openmetrics" else self.to_jsonl()
+        with open(path, "w") as metrics_file:
+            metrics_file.write(content)
+
+    def to_jsonl(self):
+        with self._lock:
+            records = self.phases + self.requests + self.planned
+        if self.peak_memory is not None:
+            records.append({"type": "memory", "peak_bytes": self.peak_memory})
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+    def to_openmetrics(self):
+        with self._lock:
+            phases, requests = list(self.phases), list(self.requests)
+
+        lines = [f"# TYPE {METRICS_PREFIX}_phase_seconds gauge", f"# UNIT {METRICS_PREFIX}_phase_seconds seconds"]
+        durations = collections.OrderedDict()
+        for phase in phases:
+            durations[phase["name"]] = durations.get(phase["name"], 0.0) + phase["duration"]
+        lines += [f'{METRICS_PREFIX}_phase_seconds{{phase="{name}"}} {value}' for name, value in durations.items()]
+
+        totals = collections.OrderedDict()
+        for request in requests:
+            labels = (request["method"], request["endpoint"], request["status"])
+            count, latency, size, retries = totals.get(labels, (0, 0.0, 0, 0))
+            totals[labels] = (
+                count + 1,
+                latency + request["latency"],
+                size + (request["bytes"] or 0),
+                retries + request["retries"],
+            )
+
+        families = (
+            ("requests", "counter", 0, "_total"),
+            ("request_seconds", "summary", 1, "_sum"),
+            ("response_bytes", "counter", 2, "_total"),
+            ("request_retries", "counter", 3, "_total"),
+        )
+        for name, metric_type, position, suffix in families:
+            lines.append(f"# TYPE {METRICS_PREFIX}_{name} {metric_type}")
+            for (method, endpoint, status), values in totals.items():
+                labels = f'method="{method}",endpoint="{escape(endpoint)}",status="{status or ""}"'
+                lines.append(f"{METRICS_PREFIX}_{name}{suffix}{{{labels}}} {values[position]}")
+                if metric_type == "summary":
+                    lines.append(f"{METRICS_PREFIX}_{name}_count{{{labels}}} {values[0]}")
+
+        if self.peak_memory is not None:
+            lines += [f"# TYPE {METRICS_PREFIX}_peak_memory_bytes gauge"]
+            lines += [f"{METRICS_PREFIX}_peak_memory_bytes {self.peak_memory}"]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def profile_summary(self, limit=20):
+        """Gets the slowest functions by cumulative time and the lines which allocated the most memory.
+
+        Args:
+            limit (int): How many functions/lines to include.
+
+        Returns
+            str: The summary or an empty string if profiling is off.
+
+        """
+        if not self.profile:
+            return ""
+
+        import pstats
+
+        output = io.StringIO()
+        with self._lock:
+            profilers = list(self._profilers)
+        if profilers:
+            stats = pstats.Stats(*profilers, stream=output)
+            stats.sort_stats("cumulative").print_stats(limit)
+
+        if self._snapshot:
+            output.write(f"Peak memory: {self.peak_memory / 1024:.1f} KiB\n")
+            for statistic in self._snapshot.statistics("lineno")[:limit]:
+                output.write(f"{statistic}\n")
+        return output.getvalue()
+
+    def _start_profiler(self):
+        """Profilers can't be nested, so a thread already being profiled by an outer phase isn't profiled again. From
+        Python 3.12 only one profiler can be active at a time, so phases which overlap it are only timed.
+
+        """
+        if not self.profile or getattr(self._local, "profiler", None):
+            return None
+
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return None
+        with self._lock:
+            self._profilers.append(profiler)
+        self._local.profiler = profiler
+        return profiler
+
+
+def get_endpoint(url):
+    """Gets the endpoint of a url, without the query and with ids replaced by `:id`.
+
+    Args:
+        url (str): i.e. https://gitlab.com/api/v4/projects/1/pipelines/2/jobs?page=3
+
+    Returns
+        str: i.e. /api/v4/projects/:id/pipelines/:id/jobs
+
+    """
+    path = url.split("?", 1)[0]
+    path = re.sub(r"^[a-z]+://[^/]+", "", path)
+    path = GENERIC_PACKAGE_FILE.sub("/packages/generic/:package/:version/:file", path)
+    return ID_SEGMENT.sub(r"/\1/:id", path)
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""This module generates release notes from the git history, for releases without a changelog.
+
+The changes in a release are the commits between the previous tag and the release's tag. They are fetched with a
+single compare request, however many commits there are. The merge requests in that range are listed in bulk, only
+those updated since the previous tag was created, and matched to the commits by their SHAs. So a release with
+thousands of commits only takes a handful of requests, instead of one request per commit.
+
+Merge requests, and commits which weren't merged by one, are grouped by their conventional commit type
+(`feat: ...`), or the first label of the merge request if its title doesn't have one. The notes for each range of
+commits can be cached, as a range of commits never changes.
+
+"""
+import collections
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from gitlab_auto_release.changelog import SEMVER
+from gitlab_auto_release.pager import iter_list
+
+PER_PAGE = 100
+CONVENTIONAL_COMMIT = re.compile(r"^(?P<type>[a-zA-Z]+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?:\s*(?P<subject>.+)")
+BREAKING_CHANGE = re.compile(r"^BREAKING[ -]CHANGE:", re.MULTILINE)
+BREAKING_HEADING = "Breaking Changes"
+OTHER_HEADING = "Other Changes"
+TYPE_HEADINGS = collections.OrderedDict(
+    (
+        ("feat", "Features"),
+        ("fix", "Bug Fixes"),
+        ("perf", "Performance Improvements"),
+        ("revert", "Reverts"),
+        ("refactor", "Code Refactoring"),
+        ("docs", "Documentation"),
+        ("build", "Build System"),
+        ("ci", "Continuous Integration"),
+        ("test", "Tests"),
+        ("style", "Styles"),
+        ("chore", "Chores"),
+    )
+)
+
+
+class NotesCache:
+    """The notes we have generated, by project and range of commits, stored in a SQLite database in the cache
+    directory.
+
+    Args:
+        path (str): Path to the cache directory.
+
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "notes.sqlite"), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS notes (project_id TEXT, from_sha TEXT, to_sha TEXT, notes TEXT, "
+                "stored_at REAL, PRIMARY KEY (project_id, from_sha, to_sha))"
+            )
+
+    def get(self, project_id, from_sha, to_sha):
+        """Gets the notes for the commits between `from_sha` and `to_sha`, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT notes FROM notes WHERE project_id = ? AND from_sha = ? AND to_sha = ?",
+                (str(project_id), from_sha or "", to_sha),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, project_id, from_sha, to_sha, notes):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?)",
+                (str(project_id), from_sha or "", to_sha, notes, time.time()),
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+def generate_notes(gl, project_id, tag_name, previous_tag=None, cache=None):
+    """Generates the release notes for a tag, from the commits and merge requests since the previous tag.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project the tag belongs to.
+        tag_name (str): The tag of the release.
+        previous_tag (str): The tag to start from, defaults to the tag before `tag_name`.
+        cache (NotesCache): If set, the notes for each range of commits are only generated once.
+
+    Returns
+        str: The release notes, in Markdown, or an empty string if there are no changes.
+
+    Raises
+        ValueError: If `tag_name` or `previous_tag` don't exist.
+
+    """
+    tag, previous = find_tags(gl, project_id, tag_name, previous_tag)
+    to_sha = tag["commit"]["id"]
+    from_sha = previous["commit"]["id"] if previous else None
+    if cache:
+        notes = cache.get(project_id, from_sha, to_sha)
+        if notes is not None:
+            return notes
+
+    commits = get_commits(gl, project_id, tag, previous)
+    since = previous["commit"].get("committed_date") if previous else None
+    merge_requests = get_merge_requests(gl, project_id, {commit["id"] for commit in commits}, since)
+    notes = render_notes(group_changes(commits, merge_requests, to_sha))
+    if cache:
+        cache.put(project_id, from_sha, to_sha, notes)
+    return notes
+
+
+def find_tags(gl, project_id, tag_name, previous_tag=None):
+    """Finds a tag and the tag before it. Tags are listed a page at a time, newest first, so a new tag and the one
+    before it are almost always on the first page.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project to look in.
+        tag_name (str): The tag of the release.
+        previous_tag (str): If set, this tag is used as the previous tag.
+
+    Returns
+        tuple: The tag and the previous tag, None if there isn't one.
+
+    Raises
+        ValueError: If `tag_name` or `previous_tag` don't exist.
+
+    """
+    path = f"/projects/{quote(project_id)}/repository/tags"
+    version = get_version(tag_name)
+    tag = previous = None
+    query = {"order_by": "updated", "sort": "desc"}
+    # The tags are usually on the first page, so the next page isn't prefetched.
+    for item in iter_list(gl, path, query, per_page=PER_PAGE, prefetch=0):
+        if item["name"] == tag_name:
+            tag = item
+        elif previous_tag and item["name"] == previous_tag:
+            previous = item
+        elif not previous_tag and tag and not previous and is_previous(item["name"], version):
+            previous = item
+        if tag and previous:
+            break
+
+    if tag is None:
+        raise ValueError(f"Unable to find tag {tag_name}.")
+    if previous_tag and previous is None:
+        raise ValueError(f"Unable to find tag {previous_tag}.")
+    return tag, previous
+
+
+def is_previous(tag_name, version):
+    """Checks if a tag listed after the release's tag can be the previous tag. If the release's tag has a semantic
+    version, the previous tag has to have a lower one, i.e. so release candidates of the same version are skipped.
+
+    """
+    if version is None:
+        return True
+    previous_version = get_version(tag_name)
+    return previous_version is not None and previous_version < version
+
+
+def get_commits(gl, project_id, tag, previous=None):
+    """Gets the commits between the previous tag and the tag, in one request. For the first tag every commit up to it
+    is listed, a page at a time.
+
+    Returns
+        list: The commits, newest first.
+
+    """
+    project_path = f"/projects/{quote(project_id)}/repository"
+    if previous is None:
+        return list(iter_list(gl, f"{project_path}/commits", {"ref_name": tag["name"]}, per_page=PER_PAGE))
+
+    compare = gl.http_get(f"{project_path}/compare", {"from": previous["commit"]["id"], "to": tag["commit"]["id"]})
+    return list(reversed(compare.get("commits") or []))
+
+
+def get_merge_requests(gl, project_id, shas, since=None):
+    """Lists the merge requests merged in a range of commits. Every merged merge request updated since the start of
+    the range is listed in bulk, then those whose head, merge or squash commit are in the range are kept.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project to look in.
+        shas (set): The SHAs of the commits in the range.
+        since (str): When the first commit in the range was committed, in ISO 8601.
+
+    Returns
+        list: The merge requests, in the order they were listed.
+
+    """
+    query = {"state": "merged"}
+    if since:
+        query["updated_after"] = since
+    merge_requests = iter_list(gl, f"/projects/{quote(project_id)}/merge_requests", query, per_page=PER_PAGE)
+    return [
+        merge_request
+        for merge_request in merge_requests
+        if any(merge_request.get(key) in shas for key in ("merge_commit_sha", "squash_commit_sha", "sha"))
+    ]
+
+
+def group_changes(commits, merge_requests, to_sha):
+    """Groups the changes by their type. Commits which belong to a merge request aren't listed separately. A commit
+    which isn't one of the merge requests' head, merge or squash commits may still belong to one, so only the
+    non-merge commits on the first parent chain from the tag, i.e. those pushed straight to the branch, are listed.
+
+    Args:
+        commits (list): The commits in the range.
+        merge_requests (list): The merge requests in the range.
+        to_sha (str): The commit the tag points to.
+
+    Returns
+        collections.OrderedDict: The heading of each group to its lines, in the order of `TYPE_HEADINGS`.
+
+    """
+    groups = collections.defaultdict(list)
+    merged = set()
+    for merge_request in merge_requests:
+        merged.update(merge_request.get(key) for key in ("merge_commit_sha", "squash_commit_sha", "sha"))
+        heading, subject = get_heading(
+            merge_request["title"], merge_request.get("description") or "", merge_request.get("labels")
+        )
+        groups[heading].append(f"{subject} (!{merge_request['iid']})")
+
+    by_sha = {commit["id"]: commit for commit in commits}
+    sha = to_sha
+    while sha in by_sha:
+        commit = by_sha[sha]
+        parents = commit.get("parent_ids") or []
+        if sha not in merged and len(parents) <= 1:
+            heading, subject = get_heading(commit["title"], commit.get("message") or "")
+            groups[heading].append(f"{subject} ({commit['short_id']})")
+        sha = parents[0] if parents else None
+
+    headings = [BREAKING_HEADING] + list(TYPE_HEADINGS.values())
+    headings += sorted(heading for heading in groups if heading not in headings and heading != OTHER_HEADING)
+    headings.append(OTHER_HEADING)
+    return collections.OrderedDict((heading, groups[heading]) for heading in headings if groups.get(heading))
+
+
+def get_heading(title, message="", labels=None):
+    """Gets the group a change belongs in.
+
+    Args:
+        title (str): The title of the commit or merge request.
+        message (str): The commit message or merge request description, checked for `BREAKING CHANGE:`.
+        labels (list): The labels of the merge request.
+
+    Returns
+        tuple: The heading of the group and the title to list the change as, without its type.
+
+    """
+    conventional = CONVENTIONAL_COMMIT.match(title)
+    if conventional:
+        subject = conventional.group("subject")
+        if conventional.group("scope"):
+            subject = f"**{conventional.group('scope')}:** {subject}"
+        if conventional.group("breaking") or BREAKING_CHANGE.search(message):
+            return BREAKING_HEADING, subject
+        heading = TYPE_HEADINGS.get(conventional.group("type").lower())
+        if heading:
+            return heading, subject
+
+    if labels:
+        return labels[0], title
+    return OTHER_HEADING, title
+
+
+def render_notes(groups):
+    """Renders the groups of changes as Markdown, a section per group."""
+    return "\n".join(f"### {heading}\n" + "".join(f"- {line}\n" for line in lines) for heading, lines in groups.items())
+
+
+def get_version(tag_name):
+    semver = SEMVER.search(tag_name)
+    return tuple(int(part) for part in semver.group(3, 4, 5)) if semver else None
+
+
+def get_notes_cache(enabled, cache_dir=None):
+    """Gets the notes cache, stored with the response cache if it has been enabled.
+
+    Args:
+        enabled (bool): If the cache should be used.
+        cache_dir (str): Where the cache is stored, defaults to `$XDG_CACHE_HOME/gitlab-auto-release`.
+
+    Returns
+        NotesCache: The cache or None if the cache isn't enabled.
+
+    """
+    if not (enabled or cache_dir):
+        return None
+
+    from gitlab_auto_release.cache import get_cache_dir
+
+    return NotesCache(cache_dir or get_cache_dir())
+
+
+def quote(value):
+    return urllib.parse.quote(str(value), safe="")
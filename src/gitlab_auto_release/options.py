@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""This module has the options shared by all the commands, which configure how we connect to GitLab."""
+import click
+
+from gitlab_auto_release.scheduler import DEFAULT_MAX_RETRIES
+from gitlab_auto_release.transport import DEFAULT_DNS_CACHE_TTL
+
+CONNECTION_OPTIONS = (
+    click.option(
+        "--cache/--no-cache",
+        envvar="GITLAB_AUTO_RELEASE_CACHE",
+        default=False,
+        help="Cache GitLab API responses on disk, so repeated runs mostly hit the cache.",
+    ),
+    click.option(
+        "--cache-dir",
+        envvar="GITLAB_AUTO_RELEASE_CACHE_DIR",
+        help="Where to store the cache, defaults to $XDG_CACHE_HOME/gitlab-auto-release. Setting it enables the cache.",
+    ),
+    click.option(
+        "--max-retries",
+        envvar="GITLAB_AUTO_RELEASE_MAX_RETRIES",
+        default=DEFAULT_MAX_RETRIES,
+        type=click.IntRange(min=0),
+        help="How many times to retry a request which was rate limited or failed with a server error.",
+    ),
+    click.option(
+        "--rate-limit",
+        envvar="GITLAB_AUTO_RELEASE_RATE_LIMIT",
+        type=click.FloatRange(min=0.01),
+        help="The maximum GitLab API requests per second, defaults to the limit GitLab sends in its responses.",
+    ),
+    click.option(
+        "--pool-size",
+        envvar="GITLAB_AUTO_RELEASE_POOL_SIZE",
+        type=click.IntRange(min=1),
+        help="The maximum number of connections to keep open to GitLab, defaults to the number of workers.",
+    ),
+    click.option(
+        "--keep-alive/--no-keep-alive",
+        envvar="GITLAB_AUTO_RELEASE_KEEP_ALIVE",
+        default=True,
+        help="Keep connections to GitLab open between requests.",
+    ),
+    click.option(
+        "--http2/--no-http2",
+        envvar="GITLAB_AUTO_RELEASE_HTTP2",
+        default=False,
+        help="Use HTTP/2, requests are multiplexed over one connection. Needs httpx, --lite is ignored when it's set.",
+    ),
+    click.option(
+        "--gzip/--no-gzip",
+        envvar="GITLAB_AUTO_RELEASE_GZIP",
+        default=True,
+        help="Ask GitLab to gzip its responses.",
+    ),
+    click.option(
+        "--dns-cache-ttl",
+        envvar="GITLAB_AUTO_RELEASE_DNS_CACHE_TTL",
+        default=DEFAULT_DNS_CACHE_TTL,
+        type=click.IntRange(min=0),
+        help="Cache DNS lookups for this many seconds, for the whole process. Off (0) by default.",
+    ),
+)
+
+
+def connection_options(func):
+    """Adds the options in `CONNECTION_OPTIONS` to a command."""
+    for option in reversed(CONNECTION_OPTIONS):
+        func = option(func)
+    return func
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""This module lists paginated API endpoints a record at a time, used for the endpoints which can return a lot of
+items i.e. tags, releases, merge requests and pipeline jobs.
+
+python-gitlab reads each page into memory, decodes all of it and builds an object for every item before the first one
+is returned. Instead each page is streamed and its JSON array is decoded incrementally, so items are yielded as soon as
+they have arrived and only a chunk of the response is held in memory at a time. While the caller works through the
+items of one page, the next page is fetched and decoded in a background thread, up to `PREFETCH` items ahead of the
+caller.
+
+ijson is used to decode the pages if it's installed, otherwise they are decoded with the standard library's
+`json.JSONDecoder.raw_decode`, one item at a time.
+
+"""
+import codecs
+import contextvars
+import json
+import queue
+import threading
+
+CHUNK_SIZE = 64 * 1024
+PER_PAGE = 100
+PREFETCH = 100
+WHITESPACE = " \t\n\r"
+
+
+def iter_list(gl, path, query_data=None, per_page=PER_PAGE, prefetch=PREFETCH):
+    """Lists every item at a paginated endpoint, a page at a time.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        path (str): The path of the endpoint, after /api/v4.
+        query_data (dict): The query parameters, other than the page.
+        per_page (int): How many items to request per page.
+        prefetch (int): How many items to decode ahead of the caller in a background thread, so the next page is
+            fetched while the caller works through the current one. If 0 pages are only requested when the caller
+            gets to them, i.e. for callers which usually stop on the first page.
+
+    Yields
+        dict: The items, in the order GitLab returns them.
+
+    """
+    items = iter_pages(gl, path, dict(query_data or {}), per_page)
+    if prefetch:
+        items = prefetch_items(items, prefetch)
+    yield from items
+
+
+def iter_pages(gl, path, query_data, per_page):
+    """Streams the pages one after another. The `X-Next-Page` header is used to tell if there is another page, if
+    GitLab doesn't send it (i.e. when there are more than 10,000 items) we stop at the first page which isn't full.
+
+    """
+    page = 1
+    while True:
+        headers, chunks = stream_page(gl, path, dict(query_data, page=page, per_page=per_page))
+        count = 0
+        try:
+            for item in decode_items(chunks):
+                count += 1
+                yield item
+        finally:
+            close(chunks)
+
+        next_page = headers.get("X-Next-Page")
+        if next_page is not None:
+            if not next_page:
+                return
+            page = int(next_page)
+        elif count < per_page:
+            return
+        else:
+            page += 1
+
+
+def iter_page(gl, path, query_data=None):
+    """Streams a single page, for callers which handle the pagination themselves.
+
+    Yields
+        dict: The items in the page, as they arrive.
+
+    """
+    _, chunks = stream_page(gl, path, dict(query_data or {}))
+    try:
+        yield from decode_items(chunks)
+    finally:
+        close(chunks)
+
+
+def stream_page(gl, path, query_data):
+    """Requests a page, without reading its body. The lite client streams it with `http_stream`, python-gitlab with a
+    streamed `http_request`.
+
+    Returns
+        tuple: The response headers and an iterator over the body in chunks, the response is closed once the body has
+            been read.
+
+    """
+    http_stream = getattr(gl, "http_stream", None)
+    if http_stream is not None:
+        return http_stream(path, query_data)
+
+    response = gl.http_request("get", path, query_data=query_data, streamed=True)
+    return response.headers, iter_response(response)
+
+
+def close(chunks):
+    """Closes the response as soon as we're done with it, even if the end of the array wasn't read."""
+    if hasattr(chunks, "close"):
+        chunks.close()
+
+
+def iter_response(response):
+    try:
+        yield from response.iter_content(CHUNK_SIZE)
+    finally:
+        response.close()
+
+
+def decode_items(chunks):
+    """Decodes the items in a JSON array as the chunks arrive, with ijson if it's installed.
+
+    Args:
+        chunks (iterable): The body of the response, in chunks of bytes.
+
+    Returns
+        iterator: The decoded items.
+
+    """
+    ijson = get_ijson()
+    if ijson is None:
+        return iter_json_array(chunks)
+    return ijson.items(ChunkReader(chunks), "item", use_float=True)
+
+
+def get_ijson():
+    try:
+        import ijson
+    except ImportError:
+        return None
+    return ijson
+
+
+def iter_json_array(chunks):
+    """Decodes a JSON array a chunk at a time, each item is yielded as soon as all of it has arrived. Only the items
+    which haven't been decoded yet are kept in memory.
+
+    Args:
+        chunks (iterable): The bytes of the array, in chunks of any size.
+
+    Yields
+        The items in the array.
+
+    Raises
+        ValueError: If the body isn't a JSON array.
+
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    started = final = False
+
+    while not final:
+        chunk = next(chunks, None)
+        final = chunk is None
+        buffer += utf8.decode(b"" if final else chunk, final=final)
+
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+
+            if not started:
+                if buffer[position] != "[":
+                    raise ValueError("Expected a JSON array.")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            if buffer[position] == ",":
+                position += 1
+                continue
+
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                if final:
+                    raise ValueError(f"Invalid JSON array: {e}") from None
+                break
+            # A number at the end of the buffer could carry on in the next chunk.
+            if end == len(buffer) and not final:
+                break
+            yield item
+            position = end
+        buffer = buffer[position:]
+
+    raise ValueError("The JSON array ended unexpectedly.")
+
+
+class ChunkReader:
+    """A file like object over the chunks of a response, for ijson. Each read returns the next chunk, whatever its
+    size, except for `read(0)` which ijson uses to check if the file is binary.
+
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+
+    def read(self, size=-1):
+        if size == 0:
+            return b""
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return b""
+
+
+def prefetch_items(items, size):
+    """Iterates over `items` in a background thread, up to `size` items ahead of the caller. If the caller stops early
+    the background thread stops too, once it has finished decoding the current item.
+
+    Args:
+        items (iterator): The items to iterate over, it's closed by the background thread.
+        size (int): The maximum number of items to hold, which haven't been used yet.
+
+    Yields
+        The items, errors raised by `items` are raised in the caller's thread.
+
+    """
+    buffer = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def put(kind, value=None):
+        while not stop.is_set():
+            try:
+                buffer.put((kind, value), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put("item", item):
+                    return
+            put("done")
+        except Exception as e:  # noqa: B902 - it's raised again in the caller's thread.
+            put("error", e)
+        finally:
+            items.close()
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(produce,), name="gitlab-auto-release-prefetch", daemon=True).start()
+    try:
+        while True:
+            kind, value = buffer.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise value
+            yield value
+    finally:
+        stop.set()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""This module limits how often we make requests to the GitLab API."""
+import threading
+import time
+
+
+class TokenBucket:
+    """A token bucket, which can be shared between threads. Tokens are added at `rate` per second, up to `capacity`.
+    Each request takes a token, if there are none left it waits until there is one.
+
+    Args:
+        rate (float): How many tokens are added per second.
+        capacity (int): The most tokens the bucket can hold, i.e. how many requests can be made in a burst.
+
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, waiting if there are none.
+
+        Returns
+            float: How long we waited in seconds.
+
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
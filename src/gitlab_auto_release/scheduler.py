@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""This module schedules every request made to the GitLab API. It limits how many requests run at the same time,
+keeps to GitLab's rate limits and retries requests which fail because GitLab is busy.
+
+GitLab tells us how many requests we have left using the `RateLimit-*` headers, if we run out we wait until
+`RateLimit-Reset` before sending more. If a rate isn't set it is taken from the `RateLimit-Limit` header. Requests
+which fail with a `429` or a `5xx` are retried with jittered exponential backoff, or after `Retry-After` seconds if
+GitLab sends it. Only requests which are safe to resend are retried on `5xx` and connection errors, as a `POST` may
+have already created the release. How many times a request was retried is added to its response in the
+`X-Gitlab-Auto-Release-Retries` header. The adapter which sends requests through the scheduler is
+`session.SchedulingAdapter`, so this module doesn't import requests until a request fails and `options` can use its
+defaults. python-gitlab's own retries are turned off when a scheduler is used, see `session.get_gitlab`.
+
+"""
+import collections
+import email.utils
+import random
+import threading
+import time
+
+from gitlab_auto_release.lazy import LazyModule
+from gitlab_auto_release.ratelimit import TokenBucket
+
+requests = LazyModule("requests")
+
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_MAX_RETRIES = 3
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+RETRIES_HEADER = "X-Gitlab-Auto-Release-Retries"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RequestScheduler:
+    """Decides when each request is sent and if it should be retried, can be shared between threads.
+
+    Args:
+        rate (float): The maximum requests per second, if not set it's taken from GitLab's `RateLimit-Limit` header.
+        max_concurrency (int): The maximum number of requests to send at the same time.
+        max_retries (int): How many times to retry a request.
+        backoff (float): The base delay in seconds between retries, doubled after every retry.
+        max_backoff (float): The longest delay in seconds between retries.
+
+    """
+
+    def __init__(
+        self,
+        rate=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        max_retries=DEFAULT_MAX_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        max_backoff=DEFAULT_MAX_BACKOFF,
+    ):
+        self.bucket = TokenBucket(rate, capacity=max_concurrency) if rate else None
+        self.fixed_rate = bool(rate)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.counters = collections.Counter()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def send(self, send, request, **kwargs):
+        """Sends the request using `send`, once the rate limit allows it. Retrying it if it fails.
+
+        Args:
+            send (function): Sends the request, i.e. `HTTPAdapter.send`.
+            request (requests.PreparedRequest): The request to send.
+            **kwargs: Passed to `send`.
+
+        Returns
+            requests.Response: The response from GitLab.
+
+        """
+        attempt = 0
+        while True:
+            self._wait()
+            try:
+                with self._semaphore:
+                    self._count("requests")
+                    response = send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not self._can_retry(request, attempt, None):
+                    raise
+                delay = self._get_backoff(attempt)
+            else:
+                self._update_limits(response)
+                if not self._can_retry(request, attempt, response):
+                    response.headers[RETRIES_HEADER] = str(attempt)
+                    return response
+
+                self._count("throttled" if response.status_code == 429 else "server_errors")
+                delay = get_retry_after(response)
+                delay = self._get_backoff(attempt) if delay is None else delay
+                response.close()
+
+            attempt += 1
+            self._count("retries")
+            self._count("waited", delay)
+            time.sleep(delay)
+            rewind_body(request)
+
+    def stats(self):
+        """Gets the counters, how many requests were sent, retried, throttled etc.
+
+        Returns
+            dict: The name of the counter to its value.
+
+        """
+        with self._lock:
+            return dict(self.counters)
+
+    def _wait(self):
+        with self._lock:
+            delay = self._paused_until - time.time()
+        if delay > 0:
+            self._count("waited", delay)
+            time.sleep(delay)
+        if self.bucket:
+            self._count("waited", self.bucket.acquire())
+
+    def _can_retry(self, request, attempt, response):
+        if attempt >= self.max_retries or not is_rewindable(request):
+            return False
+        if response is None:
+            return request.method in IDEMPOTENT_METHODS
+        if response.status_code == 429:
+            return True
+        return response.status_code in RETRY_STATUSES and request.method in IDEMPOTENT_METHODS
+
+    def _get_backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+    def _update_limits(self, response):
+        limit = to_number(response.headers.get("RateLimit-Limit"))
+        remaining = to_number(response.headers.get("RateLimit-Remaining"))
+        reset = to_number(response.headers.get("RateLimit-Reset"))
+
+        with self._lock:
+            if limit and not self.fixed_rate:
+                rate = limit / 60
+                if self.bucket is None:
+                    self.bucket = TokenBucket(rate, capacity=self.max_concurrency)
+                self.bucket.rate = rate
+            if remaining is not None and remaining < 1 and reset:
+                self._paused_until = max(self._paused_until, reset)
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+
+def get_retry_after(response):
+    """Gets how long GitLab asked us to wait from the `Retry-After` header, in seconds or as a HTTP date.
+
+    Args:
+        response (requests.Response): The response from GitLab.
+
+    Returns
+        float: How long to wait in seconds or None if the header isn't set.
+
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+
+    seconds = to_number(retry_after)
+    if seconds is not None:
+        return max(seconds, 0.0)
+
+    try:
+        date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+
+def is_rewindable(request):
+    """Requests with a streamed body can only be resent if we can go back to the start of the body."""
+    body = request.body
+    return body is None or isinstance(body, (bytes, str)) or hasattr(body, "seek")
+
+
+def rewind_body(request):
+    if hasattr(request.body, "seek"):
+        request.body.seek(0)
+
+
+def to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
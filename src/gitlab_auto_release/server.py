@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+r"""This module is a long running release server. Instead of starting a new process for every release, which has to
+import python-gitlab and open new connections to GitLab, the server keeps one pooled GitLab session, the projects it
+has fetched and the changelogs it has indexed, and creates releases as they come in.
+
+Releases are queued by GitLab tag push webhooks or the local API. The releases for a project are created one at a
+time, in the order they were queued, releases for different projects are created at the same time (up to
+`--workers` at once).
+
+* `POST /webhook`: A GitLab webhook, tag push events create a release for the tag.
+* `POST /releases`: A release (or a list of them), with the same fields as the entries in a batch manifest. With
+  `?wait=true` the response is sent once they've been created, with the status of each release.
+* `GET /health`: How many releases are queued, running, created, already existed or failed.
+
+If `--webhook-secret` is set, requests to `/webhook` and `/releases` must send it in the `X-Gitlab-Token` header. It
+has to be set to listen on anything other than a loopback address. A release's `changelog` is read from the server's
+disk and published in the release, so it can only be used with `--changelog-root`, and has to be a file in it.
+
+Example:
+    ::
+        $ gitlab_auto_release_server --private-token xxxx --gitlab-url https://gitlab.com --port 8080 \
+        --webhook-secret yyyy --notes
+
+"""
+import asyncio
+import collections
+import functools
+import hmac
+import http
+import ipaddress
+import json
+import os
+import re
+import signal
+import sys
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import gitlab
+
+from gitlab_auto_release.batch import ProjectCache
+from gitlab_auto_release.batch import is_true
+from gitlab_auto_release.batch import print_stats
+from gitlab_auto_release.batch import release_entry
+from gitlab_auto_release.changelog import ChangelogIndexes
+from gitlab_auto_release.notes import get_notes_cache
+from gitlab_auto_release.options import connection_options
+from gitlab_auto_release.session import create_session
+from gitlab_auto_release.session import get_cache
+from gitlab_auto_release.session import get_gitlab
+from gitlab_auto_release.session import get_scheduler
+from gitlab_auto_release.transport import get_transport
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 8
+MAX_BODY_SIZE = 1024 * 1024
+NULL_SHA = "0" * 40
+TAG_PREFIX = "refs/tags/"
+
+Request = collections.namedtuple("Request", "method path query headers body")
+
+
+@click.command()
+@click.option(
+    "--private-token",
+    envvar="GITLAB_PRIVATE_TOKEN",
+    required=True,
+    help="Private GITLAB token, used to authenticate when calling the Release API.",
+)
+@click.option("--gitlab-url", envvar="CI_SERVER_URL", required=True, help="The GitLab URL i.e. gitlab.com.")
+@click.option("--host", envvar="GITLAB_AUTO_RELEASE_HOST", default=DEFAULT_HOST, help="The address to listen on.")
+@click.option(
+    "--port", envvar="GITLAB_AUTO_RELEASE_PORT", default=DEFAULT_PORT, type=click.IntRange(0, 65535), help="The port."
+)
+@click.option(
+    "--workers", default=DEFAULT_WORKERS, type=click.IntRange(min=1), help="How many releases to create at once."
+)
+@click.option(
+    "--webhook-secret",
+    envvar="GITLAB_AUTO_RELEASE_WEBHOOK_SECRET",
+    help="The secret token of the GitLab webhook, requests without it in X-Gitlab-Token are rejected.",
+)
+@click.option(
+    "--changelog-root",
+    envvar="GITLAB_AUTO_RELEASE_CHANGELOG_ROOT",
+    type=click.Path(exists=True, file_okay=False),
+    help="Releases sent to /releases can use changelogs in this directory, if not set they can't use a changelog.",
+)
+@click.option("--tag-pattern", help="Only create releases for pushed tags matching this regex, i.e. ^release/.")
+@click.option(
+    "--notes/--no-notes",
+    envvar="GITLAB_AUTO_RELEASE_NOTES",
+    default=False,
+    help="Generate release notes from the commits and merge requests since the previous tag for pushed tags.",
+)
+@click.option(
+    "--optimistic/--no-optimistic",
+    envvar="GITLAB_AUTO_RELEASE_OPTIMISTIC",
+    default=False,
+    help="Don't check if the releases exist first, create them and treat a conflict as the release already existing.",
+)
+@connection_options
+def server(
+    private_token,
+    gitlab_url,
+    host,
+    port,
+    workers,
+    webhook_secret,
+    changelog_root,
+    tag_pattern,
+    notes,
+    optimistic,
+    cache,
+    cache_dir,
+    max_retries,
+    rate_limit,
+    pool_size,
+    keep_alive,
+    http2,
+    gzip,
+    dns_cache_ttl,
+):
+    """Gitlab Auto Release Tool, a server which creates releases for pushed tags."""
+    if not webhook_secret and not is_loopback(host):
+        print(
+            f"--webhook-secret is required to listen on {host}, otherwise anyone who can reach it can queue releases."
+        )
+        sys.exit(1)
+
+    response_cache = get_cache(cache, cache_dir)
+    scheduler = get_scheduler(max_retries, rate_limit, max_concurrency=workers)
+    transport = get_transport(pool_size, keep_alive, http2, gzip, dns_cache_ttl, workers=workers)
+    session = create_session(transport=transport, cache=response_cache, scheduler=scheduler)
+    gl = get_gitlab(gitlab_url, private_token, session=session, scheduler=scheduler)
+    try:
+        gl.auth()
+    except gitlab.exceptions.GitlabAuthenticationError:
+        print(f"Unable to authenticate with {gitlab_url}, check your private token.")
+        sys.exit(1)
+
+    changelogs = ChangelogIndexes(os.path.join(response_cache.path, "changelogs") if response_cache else None)
+    process = functools.partial(
+        release_entry,
+        gl,
+        gitlab_url,
+        projects=ProjectCache(),
+        changelogs=changelogs,
+        optimistic=optimistic,
+        notes_cache=get_notes_cache(cache, cache_dir),
+    )
+    queue = ReleaseQueue(process, workers)
+    app = ReleaseServer(queue, webhook_secret, re.compile(tag_pattern) if tag_pattern else None, notes, changelog_root)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        loop.run_until_complete(serve(app, host, port, stop))
+    finally:
+        queue.close()
+        loop.close()
+        print_stats(scheduler)
+
+
+async def serve(app, host, port, stop, started=None):
+    """Serves requests until `stop` is set, then waits for the queued releases to be created.
+
+    Args:
+        app (ReleaseServer): Handles the requests.
+        host (str): The address to listen on.
+        port (int): The port to listen on, 0 picks a free port.
+        stop (asyncio.Event): Set to stop the server.
+        started (function): If set, called with the port once the server is listening.
+
+    """
+    listener = await asyncio.start_server(app.handle_connection, host, port)
+    port = listener.sockets[0].getsockname()[1]
+    print(f"Listening on {host}:{port}.")
+    if started:
+        started(port)
+
+    await stop.wait()
+    listener.close()
+    await listener.wait_closed()
+    await app.queue.join()
+
+
+class HTTPError(Exception):
+    """Sent as the response to a request, with the status code and a message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ReleaseServer:
+    """Handles the HTTP requests, releases are added to the queue.
+
+    Args:
+        queue (ReleaseQueue): Where releases are queued.
+        secret (str): If set, requests which queue releases must send it in the `X-Gitlab-Token` header.
+        tag_pattern (re.Pattern): If set, only tags matching it are released by the webhook.
+        notes (bool): Generate release notes for the tags released by the webhook.
+        changelog_root (str): If set, releases sent to `/releases` can use changelogs in this directory. Otherwise
+            releases with a changelog are rejected.
+
+    """
+
+    def __init__(self, queue, secret=None, tag_pattern=None, notes=False, changelog_root=None):
+        self.queue = queue
+        self.secret = secret
+        self.tag_pattern = tag_pattern
+        self.notes = notes
+        self.changelog_root = changelog_root
+        self.routes = {
+            "/health": ("GET", self.health),
+            "/webhook": ("POST", self.webhook),
+            "/releases": ("POST", self.releases),
+        }
+
+    async def handle_connection(self, reader, writer):
+        """Handles the requests sent on a connection, connections are kept alive unless the client closes them."""
+        try:
+            while True:
+                request = None
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    status, body = await self.dispatch(request)
+                except HTTPError as e:
+                    status, body = e.status, {"message": e.message}
+
+                keep_alive = request is not None and request.headers.get("connection", "").lower() != "close"
+                writer.write(encode_response(status, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request):
+        """Calls the handler for the request's path.
+
+        Returns
+            tuple: The status code and the body to send as JSON.
+
+        Raises
+            HTTPError: If the path doesn't exist or it doesn't support the method.
+
+        """
+        if request.path not in self.routes:
+            raise HTTPError(404, f"Unknown path {request.path}.")
+        method, handler = self.routes[request.path]
+        if request.method != method:
+            raise HTTPError(405, f"{request.path} only supports {method}.")
+        return await handler(request)
+
+    async def health(self, request):
+        return 200, self.queue.stats()
+
+    async def webhook(self, request):
+        self.check_token(request)
+        entry = get_webhook_entry(load_json(request.body), self.tag_pattern, self.notes)
+        if entry is None:
+            return 200, {"queued": 0}
+        self.queue.put(entry)
+        return 202, {"queued": 1}
+
+    async def releases(self, request):
+        self.check_token(request)
+        entries = load_json(request.body)
+        if isinstance(entries, dict):
+            entries = [entries]
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            raise HTTPError(400, "Expected a release or a list of releases.")
+        entries = [get_changelog_entry(entry, self.changelog_root) for entry in entries]
+
+        futures = [self.queue.put(entry) for entry in entries]
+        if not is_true(request.query.get("wait")):
+            return 202, {"queued": len(futures)}
+
+        results = await asyncio.gather(*futures)
+        return (
+            200,
+            {
+                "releases": [
+                    {
+                        "project_id": entry.get("project_id"),
+                        "tag_name": entry.get("tag_name"),
+                        "status": status,
+                        "message": message,
+                    }
+                    for entry, status, message in results
+                ]
+            },
+        )
+
+    def check_token(self, request):
+        token = request.headers.get("x-gitlab-token", "")
+        if self.secret and not hmac.compare_digest(token.encode("utf-8"), self.secret.encode("utf-8")):
+            raise HTTPError(401, "Invalid X-Gitlab-Token.")
+
+
+class ReleaseQueue:
+    """Creates the queued releases. The releases for a project are created one at a time, in the order they were
+    queued, so releases are created in the order their tags were pushed. Releases for different projects are created
+    at the same time, up to `workers` at once.
+
+    Args:
+        process (function): Creates the release for an entry and returns the entry, status and message, see
+            `batch.release_entry`. It blocks, so it's called from a thread pool.
+        workers (int): How many releases to create at once.
+
+    """
+
+    def __init__(self, process, workers=DEFAULT_WORKERS):
+        self.process = process
+        self.workers = workers
+        self.counts = collections.Counter()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._semaphore = None
+        self._projects = {}
+        self._tasks = set()
+
+    def put(self, entry):
+        """Queues a release.
+
+        Args:
+            entry (dict): The release, with the same fields as an entry in a batch manifest.
+
+        Returns
+            asyncio.Future: Resolves to the entry, status and message once the release has been created.
+
+        """
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        future = loop.create_future()
+        project_id = entry.get("project_id")
+        pending = self._projects.get(project_id)
+        if pending is None:
+            pending = self._projects[project_id] = collections.deque()
+            task = loop.create_task(self._drain(project_id, pending))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        pending.append((entry, future))
+        self.counts["queued"] += 1
+        return future
+
+    async def _drain(self, project_id, pending):
+        loop = asyncio.get_event_loop()
+        while pending:
+            entry, future = pending.popleft()
+            async with self._semaphore:
+                self.counts["queued"] -= 1
+                self.counts["running"] += 1
+                try:
+                    result = await loop.run_in_executor(self._executor, self.process, entry)
+                except Exception as e:  # noqa: B902
+                    result = entry, "failed", str(e) or type(e).__name__
+                finally:
+                    self.counts["running"] -= 1
+
+            _, status, message = result
+            self.counts[status] += 1
+            print(f"[{status}] project {project_id} tag {entry.get('tag_name')}: {message}")
+            if not future.cancelled():
+                future.set_result(result)
+        del self._projects[project_id]
+
+    async def join(self):
+        """Waits until every queued release has been created."""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def stats(self):
+        stats = {key: self.counts[key] for key in ("queued", "running", "created", "exists", "failed")}
+        stats["projects"] = len(self._projects)
+        return stats
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def get_changelog_entry(entry, changelog_root=None):
+    """Resolves the changelog of a release sent to `/releases`, relative to the changelog root. It's read from the
+    server's disk and published in the release, so only files in the root can be used.
+
+    Args:
+        entry (dict): The release, with the same fields as an entry in a batch manifest.
+        changelog_root (str): The directory changelogs can be read from, if not set changelogs can't be used.
+
+    Returns
+        dict: The release, with the absolute path of its changelog.
+
+    Raises
+        HTTPError: If the release has a changelog outside of the root, or there is no root.
+
+    """
+    changelog = entry.get("changelog")
+    if not changelog:
+        return entry
+    if not changelog_root:
+        raise HTTPError(400, "Releases can't use a changelog, the server doesn't have a --changelog-root.")
+    if not isinstance(changelog, str):
+        raise HTTPError(400, "The changelog must be a path.")
+
+    root = os.path.realpath(changelog_root)
+    path = os.path.realpath(os.path.join(root, changelog))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPError(400, f"The changelog {changelog} isn't in the changelog root.")
+    return dict(entry, changelog=path)
+
+
+def is_loopback(host):
+    """If the server only accepts connections from this machine when it listens on `host`."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def get_webhook_entry(event, tag_pattern=None, notes=False):
+    """Gets the release to create for a webhook event.
+
+    Args:
+        event (dict): The body of the webhook.
+        tag_pattern (re.Pattern): If set, tags which don't match it aren't released.
+        notes (bool): Generate release notes for the release.
+
+    Returns
+        dict: The release, with the same fields as an entry in a batch manifest, or None if the event isn't a tag
+        being pushed.
+
+    """
+    if not isinstance(event, dict) or event.get("object_kind") != "tag_push":
+        return None
+    ref = event.get("ref") or ""
+    if not ref.startswith(TAG_PREFIX) or event.get("after") == NULL_SHA:
+        return None
+
+    tag_name = ref[len(TAG_PREFIX) :]
+    if tag_pattern and not tag_pattern.search(tag_name):
+        return None
+    return {"project_id": event.get("project_id"), "tag_name": tag_name, "notes": notes}
+
+
+async def read_request(reader):
+    """Reads a HTTP/1.1 request.
+
+    Returns
+        Request: The request, or None if the client closed the connection.
+
+    Raises
+        HTTPError: If the request is malformed or its body is too large.
+
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.") from None
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, f"The body can be at most {MAX_BODY_SIZE} bytes.")
+
+    body = await reader.readexactly(length) if length else b""
+    url = urllib.parse.urlsplit(target)
+    query = dict(urllib.parse.parse_qsl(url.query))
+    return Request(method.upper(), url.path, query, headers, body)
+
+
+def load_json(body):
+    try:
+        return json.loads(body.decode("utf-8"))
+    except ValueError:
+        raise HTTPError(400, "The body must be JSON.") from None
+
+
+def encode_response(status, body, keep_alive=True):
+    """Encodes a response with a JSON body."""
+    content = json.dumps(body).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(content)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + content
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""This module creates the HTTP session and the Gitlab object used to talk to the GitLab API. The same session can be
+shared between many releases, so connections to GitLab are pooled and re-used. How the session connects to GitLab is
+configured by a `transport.Transport`.
+
+"""
+import functools
+import time
+
+import gitlab
+import requests
+from requests.adapters import BaseAdapter
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from gitlab_auto_release.cache import CACHE_HEADER
+from gitlab_auto_release.cache import CachingAdapter
+from gitlab_auto_release.cache import ResponseCache
+from gitlab_auto_release.cache import get_cache_dir
+from gitlab_auto_release.scheduler import RETRIES_HEADER
+from gitlab_auto_release.scheduler import RequestScheduler
+from gitlab_auto_release.transport import DEFAULT_POOL_SIZE
+from gitlab_auto_release.transport import Transport
+from gitlab_auto_release.transport import get_httpx
+
+CHUNK_SIZE = 64 * 1024
+HTTP1_HEADERS = ("connection", "keep-alive", "transfer-encoding", "upgrade")
+
+
+def create_session(transport=None, cache=None, scheduler=None, metrics=None):
+    """Creates a requests session, which keeps up to `transport.pool_size` connections open to the GitLab instance.
+    When every connection is in use requests wait for one to be free, instead of opening another connection.
+
+    Args:
+        transport (Transport): How to connect to GitLab, defaults to a pool of `DEFAULT_POOL_SIZE` connections.
+        cache (ResponseCache): If set, responses are cached in it.
+        scheduler (RequestScheduler): If set, requests are rate limited and retried by it. Responses from the cache
+            don't count towards the rate limit.
+        metrics (Metrics): If set, every request is recorded in it, including those answered by the cache.
+
+    Returns
+        requests.Session: The session to pass to the Gitlab object.
+
+    """
+    transport = transport or Transport()
+    session = requests.Session()
+    session.headers.update(transport.headers())
+    if transport.http2:
+        adapter = HTTP2Adapter(transport)
+    else:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=transport.pool_size, pool_block=True)
+    if scheduler:
+        adapter = SchedulingAdapter(adapter, scheduler)
+    if cache:
+        adapter = CachingAdapter(adapter, cache)
+    if metrics:
+        adapter = MetricsAdapter(adapter, metrics)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_gitlab(gitlab_url, private_token, session=None, scheduler=None):
+    """Gets the Gitlab object used to make API requests.
+
+    Args:
+        gitlab_url (str): The FQDN of the GitLab instance.
+        private_token (str): Private GITLAB token, used to authenticate.
+        session (requests.Session): The session to make requests with, if not set a new one is created.
+        scheduler (RequestScheduler): The scheduler the session sends requests through. If set, python-gitlab doesn't
+            retry rate limited requests itself, otherwise its retries would stack on top of the scheduler's and
+            `max_retries` wouldn't be the real limit.
+
+    Returns
+        Gitlab: The Gitlab object.
+
+    """
+    session = session or create_session()
+    gl = gitlab.Gitlab(gitlab_url, private_token=private_token, session=session)
+    if scheduler:
+        gl.http_request = functools.partial(gl.http_request, obey_rate_limit=False)
+    return gl
+
+
+def get_cache(enabled, cache_dir=None):
+    """Gets the response cache, if it has been enabled.
+
+    Args:
+        enabled (bool): If the cache should be used.
+        cache_dir (str): Where to store the cache, defaults to `$XDG_CACHE_HOME/gitlab-auto-release`. If set the cache
+            is enabled.
+
+    Returns
+        ResponseCache: The cache or None if it's not enabled.
+
+    """
+    if not (enabled or cache_dir):
+        return None
+    return ResponseCache(cache_dir or get_cache_dir())
+
+
+def get_scheduler(max_retries, rate_limit=None, max_concurrency=DEFAULT_POOL_SIZE):
+    """Gets the request scheduler.
+
+    Args:
+        max_retries (int): How many times to retry a request.
+        rate_limit (float): The maximum requests per second, if not set it's taken from GitLab's response headers.
+        max_concurrency (int): The maximum number of requests to send at the same time.
+
+    Returns
+        RequestScheduler: The scheduler.
+
+    """
+    return RequestScheduler(rate=rate_limit, max_concurrency=max_concurrency, max_retries=max_retries)
+
+
+class SchedulingAdapter(BaseAdapter):
+    """A transport adapter which sends every request through the `RequestScheduler`.
+
+    Args:
+        adapter (requests.adapters.BaseAdapter): The adapter which actually sends the requests.
+        scheduler (RequestScheduler): Decides when requests are sent.
+
+    """
+
+    def __init__(self, adapter, scheduler):
+        super().__init__()
+        self.adapter = adapter
+        self.scheduler = scheduler
+
+    def send(self, request, **kwargs):
+        return self.scheduler.send(self.adapter.send, request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+
+class MetricsAdapter(BaseAdapter):
+    """A transport adapter which records the method, endpoint, status, size, latency and retries of every request.
+
+    Args:
+        adapter (requests.adapters.BaseAdapter): The adapter which actually sends the requests.
+        metrics (Metrics): Where to record the requests.
+
+    """
+
+    def __init__(self, adapter, metrics):
+        super().__init__()
+        self.adapter = adapter
+        self.metrics = metrics
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.adapter.send(request, **kwargs)
+        except requests.exceptions.RequestException:
+            self.metrics.record_request(request.method, request.url, None, None, time.perf_counter() - start)
+            raise
+
+        size = response.headers.get("Content-Length")
+        if size is None and not kwargs.get("stream"):
+            size = len(response.content)
+        self.metrics.record_request(
+            request.method,
+            request.url,
+            response.status_code,
+            int(size) if size is not None else None,
+            time.perf_counter() - start,
+            retries=int(response.headers.get(RETRIES_HEADER, 0)),
+            cache=response.headers.get(CACHE_HEADER),
+        )
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class HTTP2Adapter(BaseAdapter):
+    """A transport adapter which sends requests with httpx over HTTP/2, so requests made at the same time are
+    multiplexed over one connection. Responses are converted to requests responses, so python-gitlab and the other
+    adapters can't tell the difference. HTTP/1.1 only headers, i.e. `Connection`, aren't allowed in HTTP/2 requests
+    and are dropped.
+
+    Args:
+        transport (Transport): How to connect to GitLab.
+        client (httpx.Client): The client to send the requests with, by default one is created for each TLS setting.
+
+    """
+
+    def __init__(self, transport, client=None):
+        super().__init__()
+        self.transport = transport
+        self.httpx = get_httpx()
+        self._clients = {}
+        self._client = client
+
+    def get_client(self, verify, cert):
+        if self._client is not None:
+            return self._client
+
+        key = (verify, cert)
+        if key not in self._clients:
+            keep_alive = self.transport.pool_size if self.transport.keep_alive else 0
+            limits = self.httpx.Limits(max_connections=self.transport.pool_size, max_keepalive_connections=keep_alive)
+            self._clients[key] = self.httpx.Client(http2=True, limits=limits, verify=verify, cert=cert)
+        return self._clients[key]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        client = self.get_client(verify, cert)
+        body = reader = request.body
+        if hasattr(reader, "read"):
+            body = iter(lambda: reader.read(CHUNK_SIZE), b"")
+
+        try:
+            response = client.send(
+                client.build_request(
+                    request.method,
+                    request.url,
+                    headers={
+                        name: value for name, value in request.headers.items() if name.lower() not in HTTP1_HEADERS
+                    },
+                    content=body,
+                    timeout=self.get_timeout(timeout),
+                ),
+                stream=True,
+            )
+        except self.httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request) from e
+        except self.httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request) from e
+
+        result = requests.Response()
+        result.status_code = response.status_code
+        result.reason = response.reason_phrase
+        result.headers = CaseInsensitiveDict(response.headers)
+        result.encoding = requests.utils.get_encoding_from_headers(result.headers)
+        result.raw = HTTP2Body(response)
+        result.url = request.url
+        result.request = request
+        result.connection = self
+        if not stream:
+            result.content
+        return result
+
+    def get_timeout(self, timeout):
+        """requests' timeout can be a (connect, read) tuple."""
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return self.httpx.Timeout(read, connect=connect)
+        return self.httpx.Timeout(timeout)
+
+    def close(self):
+        for client in [self._client] + list(self._clients.values()):
+            if client is not None:
+                client.close()
+
+
+class HTTP2Body:
+    """The body of a httpx response, with the parts of urllib3's response requests uses to read it. httpx has
+    already decompressed it.
+
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def stream(self, chunk_size, decode_content=True):
+        yield from self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()
+
+    def release_conn(self):
+        self.response.close()
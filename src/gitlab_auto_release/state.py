@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""This module records how far each release in a batch has got, so a batch which was interrupted (i.e. the runner was
+preempted or the token expired) can be resumed without starting over.
+
+Each release moves through these states, keyed by its project and tag:
+
+* pending: It has been started, but nothing has been resolved yet.
+* resolved: Its description and assets have been resolved, the release to create is stored with it.
+* created/exists: It has been created, or it already existed. Resumed runs skip it without any requests.
+* failed: It failed, resumed runs try it again. If it had been resolved, it's created from the stored release.
+
+Releases which had been resolved are created straight away when resumed, as if `--optimistic` was set, so if the
+release was created just before the run was interrupted GitLab's conflict is treated as it already existing.
+
+"""
+import json
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+RESOLVED = "resolved"
+CREATED = "created"
+EXISTS = "exists"
+FAILED = "failed"
+COMPLETED = (CREATED, EXISTS)
+
+
+class ReleaseState:
+    """The state of each release in a batch, stored in a SQLite database. Every change is committed straight away,
+    so nothing is lost if the process is killed.
+
+    Args:
+        path (str): Path to the state file, it's created if it doesn't exist.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS releases (project_id TEXT, tag_name TEXT, status TEXT, release TEXT, "
+                "message TEXT, updated_at REAL, PRIMARY KEY (project_id, tag_name))"
+            )
+
+    def get(self, project_id, tag_name):
+        """Gets the state of a release.
+
+        Returns
+            tuple: The status and the resolved release (or None), None if the release hasn't been started.
+
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, release FROM releases WHERE project_id = ? AND tag_name = ?",
+                (str(project_id), tag_name),
+            ).fetchone()
+        if row is None:
+            return None
+        status, release = row
+        return status, json.loads(release) if release else None
+
+    def is_completed(self, project_id, tag_name):
+        state = self.get(project_id, tag_name)
+        return state is not None and state[0] in COMPLETED
+
+    def put(self, project_id, tag_name, status, release=None, message=None):
+        """Updates the status of a release. The resolved release is kept unless a new one is passed."""
+        release = json.dumps(release) if release is not None else None
+        with self._lock, self._connection:
+            updated = self._connection.execute(
+                "UPDATE releases SET status = ?, release = COALESCE(?, release), message = ?, updated_at = ? "
+                "WHERE project_id = ? AND tag_name = ?",
+                (status, release, message, time.time(), str(project_id), tag_name),
+            )
+            if not updated.rowcount:
+                self._connection.execute(
+                    "INSERT INTO releases VALUES (?, ?, ?, ?, ?, ?)",
+                    (str(project_id), tag_name, status, release, message, time.time()),
+                )
+
+    def counts(self):
+        """Counts the releases in each status."""
+        with self._lock:
+            return dict(self._connection.execute("SELECT status, COUNT(*) FROM releases GROUP BY status"))
+
+    def close(self):
+        self._connection.close()
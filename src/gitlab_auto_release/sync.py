@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""This module updates an existing release to match the release we would have created, used by `--sync`.
+
+The existing release is fetched once and diffed against the release we want. Only what's different is sent: one
+request to update the name and description if either changed, and one request per link which has to be added,
+changed or removed. Links are matched by name, then by URL (so a renamed link is updated, not replaced). The requests
+are sent at the same time, links which are removed are removed first because GitLab doesn't allow two links in a
+release to have the same name or URL. For the same reason a link can't be changed to (or added with) the name or URL
+of a link which is kept until that link has been changed, i.e. when two links swap URLs. Those links are removed with
+the other removed links, then added after the changes.
+
+"""
+import contextvars
+import functools
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = 4
+RELEASE_FIELDS = ("name", "description")
+UNIQUE_LINK_FIELDS = ("name", "url")
+
+
+class ReleaseDiff:
+    """What has to change for a release to match the release we want.
+
+    Args:
+        fields (dict): The fields of the release to update, i.e. the description.
+        deleted (list): The ids of the links to remove.
+        updated (list): Of (id, fields), the links to update and the fields which changed.
+        added (list): The links to add.
+        added_last (list): The links to add once the others have been updated, as they take the name or URL of one.
+
+    """
+
+    def __init__(self, fields=None, deleted=(), updated=(), added=(), added_last=()):
+        self.fields = fields or {}
+        self.deleted = list(deleted)
+        self.updated = list(updated)
+        self.added = list(added)
+        self.added_last = list(added_last)
+
+    def __len__(self):
+        """The number of requests needed to make the changes, so a diff without any changes is falsy."""
+        return (
+            (1 if self.fields else 0) + len(self.deleted) + len(self.updated) + len(self.added) + len(self.added_last)
+        )
+
+    def rounds(self):
+        """How many rounds of requests the changes take, links are removed before anything else is changed and the
+        links in `added_last` are added after that.
+
+        """
+        changed = self.fields or self.updated or self.added
+        return (1 if self.deleted else 0) + (1 if changed else 0) + (1 if self.added_last else 0)
+
+    def summary(self):
+        """Describes the changes, i.e. `description, 1 link(s) added`."""
+        changes = list(self.fields)
+        added = self.added + self.added_last
+        for links, action in ((added, "added"), (self.updated, "updated"), (self.deleted, "removed")):
+            if links:
+                changes.append(f"{len(links)} link(s) {action}")
+        return ", ".join(changes)
+
+
+def diff_release(existing, desired):
+    """Works out what has to change for the existing release to match the release we want.
+
+    Args:
+        existing (dict): The release on GitLab, as returned by the API.
+        desired (dict): The release we would have created, with `assets.links`.
+
+    Returns
+        ReleaseDiff: The changes, it's falsy if there aren't any.
+
+    """
+    fields = {key: desired[key] for key in RELEASE_FIELDS if key in desired and not same_field(existing, desired, key)}
+    links = ((existing.get("assets") or {}).get("links")) or []
+    by_name = {link["name"]: link for link in links}
+    by_url = {link["url"]: link for link in links}
+
+    matched = {}
+    changed = []
+    new = []
+    for link in desired.get("assets", {}).get("links", []):
+        current = by_name.get(link["name"])
+        if current is None or current["id"] in matched:
+            current = by_url.get(link["url"])
+        if current is None or current["id"] in matched:
+            new.append(link)
+            continue
+
+        matched[current["id"]] = current
+        changes = {key: value for key, value in link.items() if current.get(key) != value}
+        if changes:
+            changed.append((current["id"], link, changes))
+
+    deleted = [link["id"] for link in links if link["id"] not in matched]
+
+    # The names and URLs of the links which are kept, until they are updated.
+    held = {(key, link.get(key)): link["id"] for link in matched.values() for key in UNIQUE_LINK_FIELDS}
+    updated = []
+    added_last = []
+    for link_id, link, changes in changed:
+        if not takes_held(held, link, link_id):
+            updated.append((link_id, changes))
+            continue
+
+        # It's removed with the deleted links, so what it holds can be taken by the others.
+        deleted.append(link_id)
+        added_last.append(link)
+        for key in UNIQUE_LINK_FIELDS:
+            held.pop((key, matched[link_id].get(key)), None)
+
+    added = []
+    for link in new:
+        (added_last if takes_held(held, link) else added).append(link)
+    return ReleaseDiff(fields, deleted, updated, added, added_last)
+
+
+def takes_held(held, link, link_id=None):
+    """If the link has the name or URL of another link, which keeps it until the link is updated."""
+    return any(held.get((key, link.get(key)), link_id) != link_id for key in UNIQUE_LINK_FIELDS)
+
+
+def same_field(existing, desired, key):
+    """GitLab strips trailing whitespace from descriptions, so it's ignored when comparing them."""
+    return (existing.get(key) or "").rstrip() == (desired[key] or "").rstrip()
+
+
+def sync_release(gl, project_id, existing, desired, max_workers=MAX_WORKERS):
+    """Updates the existing release to match the release we want, only sending what has changed.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project the release belongs to.
+        existing (dict): The release on GitLab, as returned by the API.
+        desired (dict): The release we would have created.
+        max_workers (int): How many requests to send at once.
+
+    Returns
+        ReleaseDiff: The changes which were made.
+
+    Raises
+        GitlabHttpError: If any of the changes fail.
+
+    """
+    diff = diff_release(existing, desired)
+    if not diff:
+        return diff
+
+    path = f"/projects/{quote(project_id)}/releases/{quote(desired['tag_name'])}"
+    removals = [functools.partial(gl.http_delete, f"{path}/assets/links/{link_id}") for link_id in diff.deleted]
+    changes = [functools.partial(gl.http_put, path, post_data=diff.fields)] if diff.fields else []
+    changes += [
+        functools.partial(gl.http_put, f"{path}/assets/links/{link_id}", post_data=fields)
+        for link_id, fields in diff.updated
+    ]
+    changes += [functools.partial(gl.http_post, f"{path}/assets/links", post_data=link) for link in diff.added]
+    additions = [functools.partial(gl.http_post, f"{path}/assets/links", post_data=link) for link in diff.added_last]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for requests in (removals, changes, additions):
+            for future in [executor.submit(contextvars.copy_context().run, request) for request in requests]:
+                future.result()
+    return diff
+
+
+def quote(value):
+    return urllib.parse.quote(str(value), safe="")
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""This module configures how we connect to GitLab: the size of the connection pool, keep-alive, HTTP/2, gzip and
+DNS caching. One transport is created per run and shared by every request the run makes, see `session.create_session`.
+
+The connection pool blocks instead of opening extra connections when every connection is in use, so a batch of
+hundreds of releases reuses the same handful of connections (and TLS sessions) throughout. With HTTP/2 (which needs
+httpx, `pip install gitlab-auto-release[http2]`) requests are multiplexed over a single connection instead.
+
+The DNS cache is opt-in (`--dns-cache-ttl`). It replaces `socket.getaddrinfo` for the whole process, until it's turned
+off again, so GitLab's hostname is only resolved once every `dns_cache_ttl` seconds, rather than every time a connection
+is opened. The TTLs of the DNS records aren't known to `getaddrinfo`, so `dns_cache_ttl` should be shorter than them.
+It only needs the standard library, so the lite client uses it too.
+
+"""
+import socket
+import sys
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_DNS_CACHE_TTL = 0
+_dns_lock = threading.Lock()
+_dns_cache = None
+
+
+class Transport:
+    """How to connect to GitLab.
+
+    Args:
+        pool_size (int): The maximum number of connections to keep open to GitLab.
+        keep_alive (bool): Keep connections open between requests, if not set a new connection is opened per request.
+        http2 (bool): Use HTTP/2, requests are multiplexed over one connection. Needs httpx.
+        gzip (bool): Ask GitLab to compress its responses.
+        dns_cache_ttl (int): How long to cache DNS lookups for in seconds, 0 turns the cache off.
+
+    """
+
+    def __init__(
+        self, pool_size=DEFAULT_POOL_SIZE, keep_alive=True, http2=False, gzip=True, dns_cache_ttl=DEFAULT_DNS_CACHE_TTL
+    ):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.http2 = http2
+        self.gzip = gzip
+        self.dns_cache_ttl = dns_cache_ttl
+
+    def headers(self):
+        """The headers to send with every request, for the keep-alive and gzip settings.
+
+        Returns
+            dict: The headers.
+
+        """
+        headers = {"Accept-Encoding": "gzip" if self.gzip else "identity"}
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        return headers
+
+
+def get_transport(pool_size, keep_alive, http2, gzip, dns_cache_ttl, workers=DEFAULT_POOL_SIZE):
+    """Gets the transport from the connection options and installs the DNS cache.
+
+    Args:
+        pool_size (int): The maximum number of connections to keep open, defaults to `workers`.
+        keep_alive (bool): Keep connections open between requests.
+        http2 (bool): Use HTTP/2.
+        gzip (bool): Ask GitLab to compress its responses.
+        dns_cache_ttl (int): How long to cache DNS lookups for in seconds.
+        workers (int): How many requests the command makes at the same time.
+
+    Returns
+        Transport: The transport to create the session with.
+
+    """
+    if http2 and get_httpx() is None:
+        print("httpx is required to use HTTP/2, pip install gitlab-auto-release[http2].")
+        sys.exit(1)
+
+    install_dns_cache(dns_cache_ttl)
+    return Transport(pool_size or workers, keep_alive, http2, gzip, dns_cache_ttl)
+
+
+def get_httpx():
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx
+
+
+class DNSCache:
+    """Caches the addresses a hostname resolves to for `ttl` seconds, failed lookups aren't cached.
+
+    Args:
+        ttl (int): How long to use an address for, in seconds.
+        resolve (function): Looks up the addresses, the same as `socket.getaddrinfo`.
+        clock (function): Returns the current time in seconds.
+
+    """
+
+    def __init__(self, ttl, resolve=socket.getaddrinfo, clock=time.monotonic):
+        self.ttl = ttl
+        self.resolve = resolve
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        """Used in place of `socket.getaddrinfo`, takes the same arguments."""
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and now - entry[1] < self.ttl:
+            return list(entry[0])
+
+        addresses = self.resolve(host, port, *args, **kwargs)
+        with self._lock:
+            self._entries[key] = (addresses, now)
+        return list(addresses)
+
+
+def install_dns_cache(ttl):
+    """Caches DNS lookups for the whole process, by replacing `socket.getaddrinfo`. It's only installed once, later
+    calls (i.e. each release in the server) change the TTL, or remove the cache if it's 0.
+
+    Args:
+        ttl (int): How long to cache lookups for in seconds, if 0 lookups aren't cached.
+
+    Returns
+        DNSCache: The cache, None if it isn't installed.
+
+    """
+    global _dns_cache
+    with _dns_lock:
+        if _dns_cache is not None and not ttl:
+            socket.getaddrinfo = _dns_cache.resolve
+            _dns_cache = None
+        elif _dns_cache is not None:
+            _dns_cache.ttl = ttl
+        elif ttl:
+            _dns_cache = DNSCache(ttl)
+            socket.getaddrinfo = _dns_cache.getaddrinfo
+    return _dns_cache
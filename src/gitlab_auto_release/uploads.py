@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""This module uploads files to the GitLab generic package registry, so they can be attached to a release as assets.
+
+Files are streamed from disk a chunk at a time, so even multi GB installers are never loaded into memory, and the
+SHA-256 of each file is computed in the same pass. GitLab returns the SHA-256 of the file it stored, which is checked
+against ours. Several files are uploaded at the same time, over the pooled connections of the session.
+
+Uploads are deduplicated by their content. Before a file is uploaded we look for a file with the same SHA-256 which
+was already published in the project, first in the local `UploadIndex`, then in the version of the package being
+released, which GitLab stores the SHA-256 of, and then in the `PackageIndex` of every file uploaded to the package,
+which is kept in the registry itself so files from earlier releases are found without a local cache. If there is one,
+the release links to it instead and the file isn't uploaded. A file is only hashed before it's uploaded if one of
+those has a file of the same size, otherwise the SHA-256 computed while it's sent is used.
+
+"""
+import contextvars
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from gitlab_auto_release.changelog import get_digest
+from gitlab_auto_release.lazy import LazyModule
+from gitlab_auto_release.lite import raise_error
+
+gitlab = LazyModule("gitlab")
+
+CHUNK_SIZE = 1024 * 1024
+PER_PAGE = 100
+DEFAULT_PACKAGE_NAME = "release-assets"
+DEFAULT_UPLOAD_WORKERS = 4
+INDEX_SUFFIX = "-index"
+INVALID_VERSION_CHARACTERS = re.compile(r"[^\w.+-]")
+
+
+class ChecksumError(ValueError):
+    """Raised when the SHA-256 GitLab computed for an uploaded file doesn't match ours."""
+
+
+class HashingReader:
+    """Wraps a file opened in binary mode, the SHA-256 of the file is updated as it is read. Rewinding the file,
+    i.e. when a request is retried, restarts the hash.
+
+    Args:
+        file (file): The file to read.
+        chunk_size (int): How much to read at once, when iterating over the file.
+
+    """
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.size = os.fstat(file.fileno()).st_size
+        self._hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        chunk = self.file.read(size)
+        self._hash.update(chunk)
+        return chunk
+
+    def __iter__(self):
+        return iter(lambda: self.read(self.chunk_size), b"")
+
+    def __len__(self):
+        return self.size
+
+    def tell(self):
+        return self.file.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if offset != 0 or whence != os.SEEK_SET:
+            raise OSError("HashingReader can only be rewound to the start.")
+        self._hash = hashlib.sha256()
+        return self.file.seek(0)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+class BytesReader(io.BytesIO):
+    """A small body held in memory, which can be sent by the same functions as a `HashingReader`."""
+
+    def __len__(self):
+        return len(self.getvalue())
+
+
+class UploadIndex:
+    """A local index of the files we have uploaded, stored in a SQLite database in the cache directory. It also
+    remembers the SHA-256 of local files, so a file isn't hashed again unless its size or modified time changes.
+
+    Args:
+        path (str): Path to the cache directory.
+
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(os.path.join(path, "uploads.sqlite"), check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (sha256 TEXT, project_id TEXT, url TEXT, stored_at REAL, "
+                "size INTEGER, PRIMARY KEY (sha256, project_id))"
+            )
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(blobs)")]
+            if "size" not in columns:
+                self._connection.execute("ALTER TABLE blobs ADD COLUMN size INTEGER")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS digests (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha256 TEXT)"
+            )
+
+    def get(self, sha256, project_id):
+        """Gets the url of a file with this SHA-256 already uploaded to the project, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url FROM blobs WHERE sha256 = ? AND project_id = ?", (sha256, str(project_id))
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, sha256, project_id, url, size=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?)", (sha256, str(project_id), url, time.time(), size)
+            )
+
+    def has_size(self, size, project_id):
+        """If a file of this size (or of an unknown size) has been uploaded to the project."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM blobs WHERE project_id = ? AND (size = ? OR size IS NULL) LIMIT 1",
+                (str(project_id), size),
+            ).fetchone()
+        return row is not None
+
+    def remove(self, sha256, project_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM blobs WHERE sha256 = ? AND project_id = ?", (sha256, str(project_id)))
+
+    def get_digest(self, path):
+        """Gets the SHA-256 of a local file, it's only computed if the file changed since it was last hashed."""
+        stat = os.stat(path)
+        sha256 = self.get_cached_digest(path, stat)
+        if sha256 is None:
+            sha256 = get_digest(path)
+            self.set_digest(path, stat, sha256)
+        return sha256
+
+    def get_cached_digest(self, path, stat):
+        """Gets the SHA-256 of a local file if it hasn't changed since it was last hashed, otherwise None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime, sha256 FROM digests WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        if row and row[0] == stat.st_size and row[1] == stat.st_mtime:
+            return row[2]
+        return None
+
+    def set_digest(self, path, stat, sha256):
+        """Stores the SHA-256 of a local file, `stat` is the file's stat from before it was hashed."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                (os.path.abspath(path), stat.st_size, stat.st_mtime, sha256),
+            )
+
+    def close(self):
+        self._connection.close()
+
+
+class PublishedFiles:
+    """The files already published in the version of the package being released, by SHA-256. Only that version is
+    listed (the first time it's needed, then it's shared between threads), so a repeat release costs the same couple
+    of requests however many releases the project has. Files published by other releases are found with the
+    `PackageIndex`.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project to look in.
+        gitlab_url (str): The FQDN of the GitLab instance.
+        package_name (str): The generic package to look in.
+        version (str): The version of the package to look in.
+
+    """
+
+    def __init__(self, gl, project_id, gitlab_url, package_name, version):
+        self.gl = gl
+        self.project_id = project_id
+        self.gitlab_url = gitlab_url
+        self.package_name = package_name
+        self.version = version
+        self._files = None
+        self._lock = threading.Lock()
+
+    def get(self, sha256):
+        """Gets the url of a published file with this SHA-256, or None."""
+        return self._get_files()[0].get(sha256)
+
+    def has_size(self, size):
+        """If a file of this size (or of an unknown size) has been published."""
+        sizes = self._get_files()[1]
+        return size in sizes or None in sizes
+
+    def _get_files(self):
+        with self._lock:
+            if self._files is None:
+                self._files = self._list()
+        return self._files
+
+    def _list(self):
+        project_path = f"/projects/{quote(self.project_id)}/packages"
+        query = {
+            "package_type": "generic",
+            "package_name": self.package_name,
+            "package_version": self.version,
+            "per_page": PER_PAGE,
+        }
+        urls, sizes = {}, set()
+        for package in self.gl.http_list(project_path, query, all=True):
+            # Older versions of GitLab don't filter by the version.
+            if package.get("name") != self.package_name or package.get("version") != self.version:
+                continue
+            files_path = f"{project_path}/{package['id']}/package_files"
+            for package_file in self.gl.http_list(files_path, {"per_page": PER_PAGE}, all=True):
+                sha256 = package_file.get("file_sha256")
+                if sha256:
+                    sizes.add(package_file.get("size"))
+                    urls.setdefault(
+                        sha256,
+                        get_package_url(
+                            self.gitlab_url, self.project_id, self.package_name, self.version, package_file["file_name"]
+                        ),
+                    )
+        return urls, sizes
+
+
+class PackageIndex:
+    """An index of the files uploaded to a package by SHA-256, stored in the generic package registry next to it, so
+    it lasts across releases and machines. It's the package `<package_name>-index`, version `size` has a file named
+    after the size of each file uploaded and version `sha256` has a file named after the SHA-256 of each file
+    uploaded, with the url of the file as its JSON body. Looking a file up costs a `HEAD` request for its size, only
+    if a file of that size has been uploaded is the file hashed and its SHA-256 looked up.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project to look in.
+        package_name (str): The package the files are uploaded to.
+        put (function): Sends a file, takes the API path, the body and the query parameters.
+
+    """
+
+    def __init__(self, gl, project_id, package_name, put):
+        self.gl = gl
+        self.project_id = project_id
+        self.package_name = f"{package_name}{INDEX_SUFFIX}"
+        self.put = put
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def has_size(self, size):
+        """If a file of this size has been uploaded, each size is only requested once."""
+        with self._lock:
+            if size in self._sizes:
+                return self._sizes[size]
+        try:
+            self.gl.http_request("HEAD", self._get_path("size", str(size)))
+            found = True
+        except gitlab.exceptions.GitlabError:
+            found = False
+        with self._lock:
+            self._sizes[size] = found
+        return found
+
+    def get(self, sha256):
+        """Gets the url of an uploaded file with this SHA-256, or None."""
+        try:
+            result = self.gl.http_get(self._get_path("sha256", sha256))
+        except gitlab.exceptions.GitlabError:
+            return None
+        # python-gitlab only decodes the body if it's served as JSON, which package files aren't.
+        pointer = result if isinstance(result, dict) else result.json()
+        return pointer.get("url")
+
+    def add(self, sha256, size, url):
+        """Adds an uploaded file to the index. It's only an optimisation, so it isn't an error if it can't be added."""
+        try:
+            self.put(self._get_path("sha256", sha256), BytesReader(json.dumps({"url": url}).encode("utf-8")), None)
+            if not self.has_size(size):
+                self.put(self._get_path("size", str(size)), BytesReader(b"{}"), None)
+                with self._lock:
+                    self._sizes[size] = True
+        except gitlab.exceptions.GitlabError:
+            pass
+
+    def _get_path(self, version, file_name):
+        return get_package_path(self.project_id, self.package_name, version, file_name)
+
+
+def upload_assets(
+    gl,
+    project,
+    uploads,
+    gitlab_url,
+    version,
+    package_name=DEFAULT_PACKAGE_NAME,
+    workers=None,
+    index=None,
+    dedup=True,
+    dry_run=False,
+):
+    """Uploads files to the generic package registry, at the same time. Files which have already been published in
+    the project are linked to instead of being uploaded again.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project (Gitlab.project): Gitlab project object, the package is added to it.
+        uploads (list): The files to upload in the format path or name=path.
+        gitlab_url (str): The FQDN of the GitLab instance.
+        version (str): The version of the package, i.e. the tag name.
+        package_name (str): The name of the package to add the files to.
+        workers (int): How many files to upload at once, defaults to `DEFAULT_UPLOAD_WORKERS`.
+        index (UploadIndex): If set, used to find files we have already uploaded without making any requests.
+        dedup (bool): If set, files with the same content as a file already in the registry aren't uploaded.
+        dry_run (bool): If set, files aren't uploaded, they're linked to where they would have been uploaded.
+
+    Returns
+        list: Of (link, sha256, status) in the same order as `uploads`, the link is a dict with the name and url of
+            the file and the status is uploaded, reused or planned (in a dry run).
+
+    Raises
+        OSError: When one of the files can't be read.
+        ChecksumError: When the file GitLab stored doesn't match the file we uploaded.
+        ValueError: When an upload isn't in the format path or name=path.
+
+    """
+    put = getattr(gl, "http_put_file", None) or (lambda path, reader, query: put_file(gl, path, reader, query))
+    version = get_package_version(version)
+    files = [parse_upload(upload) for upload in uploads]
+
+    published = PublishedFiles(gl, project.id, gitlab_url, package_name, version)
+    package_index = PackageIndex(gl, project.id, package_name, put)
+
+    def upload(item):
+        name, path = item
+        stat = os.stat(path)
+        sha256 = index.get_cached_digest(path, stat) if index else None
+        if dedup:
+            if sha256 is None and has_candidate(project.id, stat.st_size, index, published, package_index):
+                sha256 = get_file_digest(path, stat, index)
+            url = (
+                find_published(gl, project.id, sha256, index, published, package_index, stat.st_size)
+                if sha256
+                else None
+            )
+            if url:
+                return {"name": name, "url": url, "link_type": "package"}, sha256, "reused"
+
+        if dry_run:
+            sha256 = sha256 or get_file_digest(path, stat, index)
+            url = get_package_url(gitlab_url, project.id, package_name, version, os.path.basename(path))
+            return {"name": name, "url": url, "link_type": "package"}, sha256, "planned"
+
+        link, sha256 = upload_file(put, project.id, gitlab_url, package_name, version, name, path)
+        if dedup:
+            package_index.add(sha256, stat.st_size, link["url"])
+        if index:
+            index.put(sha256, project.id, link["url"], stat.st_size)
+            index.set_digest(path, stat, sha256)
+        return link, sha256, "uploaded"
+
+    with ThreadPoolExecutor(max_workers=workers or DEFAULT_UPLOAD_WORKERS) as executor:
+        uploads = [executor.submit(contextvars.copy_context().run, upload, item) for item in files]
+        return [future.result() for future in uploads]
+
+
+def upload_file(put, project_id, gitlab_url, package_name, version, name, path):
+    """Streams a file to the generic package registry, hashing it as it is sent.
+
+    Args:
+        put (function): Sends the request, takes the API path, the body and the query parameters and returns the
+            decoded JSON response.
+        project_id (int): The id of the project to add the package to.
+        gitlab_url (str): The FQDN of the GitLab instance.
+        package_name (str): The name of the package.
+        version (str): The version of the package.
+        name (str): The name of the asset in the release.
+        path (str): Path to the file.
+
+    Returns
+        tuple: The link to the file, a dict with its name and url, and its SHA-256.
+
+    """
+    file_name = os.path.basename(path)
+    api_path = get_package_path(project_id, package_name, version, file_name)
+
+    with open(path, "rb") as file:
+        reader = HashingReader(file)
+        package_file = put(api_path, reader, {"select": "package_file"})
+
+    sha256 = reader.hexdigest()
+    remote_sha256 = package_file.get("file_sha256") if isinstance(package_file, dict) else None
+    if remote_sha256 and remote_sha256 != sha256:
+        raise ChecksumError(f"Uploaded {path} has SHA-256 {remote_sha256} on GitLab, expected {sha256}.")
+
+    url = get_package_url(gitlab_url, project_id, package_name, version, file_name)
+    return {"name": name, "url": url, "link_type": "package"}, sha256
+
+
+def has_candidate(project_id, size, index, published, package_index):
+    """If a file of this size has been published, only then is it worth hashing a file before uploading it."""
+    return bool(index and index.has_size(size, project_id)) or published.has_size(size) or package_index.has_size(size)
+
+
+def get_file_digest(path, stat, index):
+    """Hashes a local file, the SHA-256 is stored in the index (if there is one) so it isn't hashed again."""
+    sha256 = get_digest(path)
+    if index:
+        index.set_digest(path, stat, sha256)
+    return sha256
+
+
+def find_published(gl, project_id, sha256, index, published, package_index, size=None):
+    """Finds a file with this SHA-256 already published in the project.
+
+    Files in the local index are checked with a `HEAD` request, in case they were deleted from the registry. Then
+    the version of the package being released is searched, then the package's index, whose files are checked the
+    same way.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        project_id (int): The project to look in.
+        sha256 (str): The SHA-256 of the file.
+        index (UploadIndex): The local index, can be None.
+        published (PublishedFiles): The files in the version of the package being released.
+        package_index (PackageIndex): The files uploaded to the package by earlier releases.
+        size (int): The size of the file, stored in the index with it.
+
+    Returns
+        str: The url of the file or None if it hasn't been published.
+
+    """
+    url = index.get(sha256, project_id) if index else None
+    if url:
+        if exists(gl, url):
+            return url
+        index.remove(sha256, project_id)
+
+    url = published.get(sha256)
+    if not url:
+        url = package_index.get(sha256)
+        if url and not exists(gl, url):
+            url = None
+    if url and index:
+        index.put(sha256, project_id, url, size)
+    return url
+
+
+def exists(gl, url):
+    """If a file is still in the registry, it could have been deleted since it was published."""
+    try:
+        gl.http_request("HEAD", url.split("/api/v4", 1)[-1])
+        return True
+    except gitlab.exceptions.GitlabError:
+        return False
+
+
+def put_file(gl, path, reader, query_data=None):
+    """Streams a file to the GitLab API, using the session of the python-gitlab object.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        path (str): The path of the endpoint, after /api/v4.
+        reader (HashingReader): The file to send.
+        query_data (dict): The query parameters.
+
+    Returns
+        dict: The decoded JSON response.
+
+    Raises
+        GitlabUploadError: When GitLab doesn't accept the file.
+
+    """
+    headers = {"PRIVATE-TOKEN": gl.private_token, "Content-Type": "application/octet-stream"}
+    response = gl.session.put(f"{gl.api_url}{path}", data=reader, params=query_data, headers=headers)
+    if not 200 <= response.status_code < 300:
+        raise_error("GitlabUploadError", response.status_code, response.content)
+
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def get_package_path(project_id, package_name, version, file_name):
+    """Gets the API path of a file in the generic package registry, after /api/v4."""
+    package_path = "/".join(quote(part) for part in (package_name, version, file_name))
+    return f"/projects/{quote(project_id)}/packages/generic/{package_path}"
+
+
+def get_package_url(gitlab_url, project_id, package_name, version, file_name):
+    return f"{gitlab_url.rstrip('/')}/api/v4{get_package_path(project_id, package_name, version, file_name)}"
+
+
+def get_upload_index(enabled, cache_dir=None):
+    """Gets the local upload index, stored with the response cache if it has been enabled.
+
+    Args:
+        enabled (bool): If the cache should be used.
+        cache_dir (str): Where the cache is stored, defaults to `$XDG_CACHE_HOME/gitlab-auto-release`.
+
+    Returns
+        UploadIndex: The index or None if the cache isn't enabled.
+
+    """
+    if not (enabled or cache_dir):
+        return None
+
+    from gitlab_auto_release.cache import get_cache_dir
+
+    return UploadIndex(cache_dir or get_cache_dir())
+
+
+def parse_upload(upload):
+    """Gets the name and path of an upload in the format path or name=path, the name defaults to the file name."""
+    name, separator, path = upload.partition("=")
+    if not separator:
+        name, path = os.path.basename(upload), upload
+    if not name or not path:
+        raise ValueError(f"Invalid upload {upload}. Format should be `path` or `name=path`.")
+    return name, path
+
+
+def get_package_version(tag_name):
+    """Generic package versions can only contain letters, numbers, `.`, `_`, `+` and `-`, i.e. release/0.1.0 is
+    stored as release-0.1.0.
+
+    """
+    return INVALID_VERSION_CHARACTERS.sub("-", tag_name)
+
+
+def quote(value):
+    return urllib.parse.quote(str(value), safe="")
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""This module waits for the jobs whose artifacts are linked in the release to succeed, so the release job can start
+before the jobs it needs have finished.
+
+The pipeline's jobs are listed once, after that only the jobs which are still running are fetched, each with the
+`If-None-Match` header so GitLab can respond with an empty `304` if the job hasn't changed. Jobs which haven't been
+created yet (i.e. their downstream pipeline hasn't started) are looked for again every round. The time between
+rounds starts at `min_interval` and grows while nothing changes, up to `max_interval`.
+
+Jobs are resolved with the response cache bypassed (see `is_polling`), a cached job list could be stale for up to its
+TTL and a job which was retried wouldn't be seen until it expired.
+
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gitlab_auto_release.lite import raise_error
+
+DEFAULT_WAIT_TIMEOUT = 1800
+DEFAULT_MIN_INTERVAL = 2.0
+DEFAULT_MAX_INTERVAL = 30.0
+BACKOFF_FACTOR = 1.5
+MAX_WORKERS = 4
+FAILED_STATUSES = ("failed", "canceled", "skipped")
+
+_polling = contextvars.ContextVar("polling", default=False)
+
+
+class JobFailedError(Exception):
+    """Raised when a job we are waiting for finishes without succeeding."""
+
+
+class WaitTimeoutError(Exception):
+    """Raised when the jobs we are waiting for haven't all succeeded before the timeout."""
+
+
+def wait_for_jobs(
+    gl,
+    resolve,
+    names,
+    timeout=DEFAULT_WAIT_TIMEOUT,
+    min_interval=DEFAULT_MIN_INTERVAL,
+    max_interval=DEFAULT_MAX_INTERVAL,
+    sleep=time.sleep,
+    clock=time.monotonic,
+):
+    """Waits until there is a successful job for each of `names`.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        resolve (function): Takes a list of job names and returns a dict of job name to (job, project id), i.e.
+            `cli.index_pipeline_tree`.
+        names (list): The job names to wait for.
+        timeout (float): How long to wait in total, in seconds.
+        min_interval (float): The shortest time between polls, in seconds.
+        max_interval (float): The longest time between polls, in seconds.
+        sleep (function): Used to wait between polls.
+        clock (function): Used to get the current time, in seconds.
+
+    Returns
+        dict: Job name to (job, project id), for every name.
+
+    Raises
+        JobFailedError: When one of the jobs fails, is canceled or skipped (and wasn't retried).
+        WaitTimeoutError: When the jobs haven't all succeeded within `timeout` seconds.
+
+    """
+    deadline = clock() + timeout
+    interval = min_interval
+    ready = {}
+    running = {}
+    failed = {}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        while True:
+            changed = False
+            missing = [name for name in names if name not in ready and name not in running]
+            if missing:
+                token = _polling.set(True)
+                try:
+                    found = resolve(missing)
+                finally:
+                    _polling.reset(token)
+                for name in missing:
+                    if name not in found:
+                        continue
+                    job, project_id = found[name]
+                    if failed.get(name) == str(job.id):
+                        raise JobFailedError(f"Job {name} finished with status {job.status}.")
+                    running[name] = {
+                        "job": job,
+                        "project_id": project_id,
+                        "status": job.status,
+                        "etag": None,
+                        "listed": True,
+                    }
+                    changed = True
+
+            polls = {
+                name: executor.submit(contextvars.copy_context().run, poll_job, gl, item)
+                for name, item in running.items()
+                if not item["listed"]
+            }
+            for name, poll in polls.items():
+                changed = poll.result() or changed
+
+            for name, item in list(running.items()):
+                if item["status"] == "success":
+                    print(f"Job {name} succeeded, linking its artifacts.")
+                    ready[name] = (item["job"], item["project_id"])
+                    del running[name]
+                elif item["status"] in FAILED_STATUSES:
+                    # The job may have been retried, so look for the latest job with this name in the next round.
+                    failed[name] = str(item["job"].id)
+                    del running[name]
+                else:
+                    item["listed"] = False
+
+            if len(ready) == len(set(names)):
+                return {name: ready[name] for name in names}
+
+            remaining = deadline - clock()
+            if remaining <= 0:
+                waiting = ", ".join(name for name in names if name not in ready)
+                raise WaitTimeoutError(f"Timed out after {timeout} seconds waiting for jobs {waiting}.")
+
+            interval = min_interval if changed else min(interval * BACKOFF_FACTOR, max_interval)
+            sleep(min(interval, remaining))
+
+
+def is_polling():
+    """If the jobs are being resolved by `wait_for_jobs`, so cached responses have to be revalidated. Set in the
+    context of the thread calling `resolve`, threads it starts need a copy of its context.
+
+    """
+    return _polling.get()
+
+
+def poll_job(gl, item):
+    """Fetches a running job, if it changed its status is updated.
+
+    Args:
+        gl (Gitlab): The Gitlab object (or the lite equivalent).
+        item (dict): The job, project id, last status and ETag of the last response.
+
+    Returns
+        bool: True if the status of the job changed.
+
+    """
+    get = getattr(gl, "http_get_conditional", None) or (lambda path, etag: get_conditional(gl, path, etag))
+    job, item["etag"] = get(f"/projects/{item['project_id']}/jobs/{item['job'].id}", item["etag"])
+    if job is None or job.get("status") == item["status"]:
+        return False
+
+    item["status"] = job.get("status")
+    return True
+
+
+def get_conditional(gl, path, etag=None):
+    """Gets `path` with the `If-None-Match` header, using the session of the python-gitlab object.
+
+    Args:
+        gl (Gitlab): The Gitlab object.
+        path (str): The path of the endpoint, after /api/v4.
+        etag (str): The ETag of the last response.
+
+    Returns
+        tuple: The decoded JSON body (None if it hasn't changed) and the ETag of the response.
+
+    """
+    headers = {"PRIVATE-TOKEN": gl.private_token}
+    if etag:
+        headers["If-None-Match"] = etag
+
+    response = gl.session.get(f"{gl.api_url}{path}", headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    if not 200 <= response.status_code < 300:
+        raise_error("GitlabGetError", response.status_code, response.content)
+    return response.json(), response.headers.get("ETag")
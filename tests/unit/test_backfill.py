@@ -0,0 +1,94 @@
+import json
+
+import gitlab
+import requests
+
+from gitlab_auto_release.backfill import backfill
+from gitlab_auto_release.backfill import get_missing_releases
+
+TAGS = [{"name": "release/2.0.5"}, {"name": "release/2.0.4"}, {"name": "v1"}, {"name": "release/1.0.0"}]
+
+ARGS = ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", "--project-id", 213145]
+
+
+def mock_lists(project, tags, releases):
+    """Streams the tags and releases of the project a page at a time."""
+    items = {f"/projects/{project.id}/repository/tags": tags, f"/projects/{project.id}/releases": releases}
+    project.manager.gitlab.http_stream.side_effect = lambda path, query_data: (
+        {},
+        [
+            json.dumps(
+                items[path][(query_data["page"] - 1) * query_data["per_page"] :][: query_data["per_page"]]
+            ).encode()
+        ],
+    )
+
+
+def test_get_missing_releases(mocker):
+    project = mocker.MagicMock(id=213145)
+    mock_lists(project, TAGS, [{"tag_name": "release/2.0.4"}])
+    assert get_missing_releases(project) == ["release/2.0.5", "v1", "release/1.0.0"]
+    assert get_missing_releases(project, "^release/") == ["release/2.0.5", "release/1.0.0"]
+    project.manager.gitlab.http_stream.assert_called_with(
+        "/projects/213145/repository/tags", {"page": 1, "per_page": 100}
+    )
+
+
+def test_get_missing_releases_pages(mocker, monkeypatch):
+    monkeypatch.setattr("gitlab_auto_release.backfill.PER_PAGE", 2)
+    project = mocker.MagicMock(id=213145)
+    mock_lists(project, TAGS, [{"tag_name": "release/2.0.4"}, {"tag_name": "v1"}])
+    assert get_missing_releases(project) == ["release/2.0.5", "release/1.0.0"]
+    pages = [(path, query["page"]) for (path, query), _ in project.manager.gitlab.http_stream.call_args_list]
+    assert pages == [
+        ("/projects/213145/releases", 1),
+        ("/projects/213145/releases", 2),
+        ("/projects/213145/repository/tags", 1),
+        ("/projects/213145/repository/tags", 2),
+        ("/projects/213145/repository/tags", 3),
+    ]
+
+
+def test_success(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.id = 213145
+    mock_lists(mock.return_value, TAGS[:3], [{"tag_name": "release/2.0.4"}])
+    result = runner.invoke(backfill, ARGS + ["-c", "tests/data/CHANGELOG.md"])
+    assert result.exit_code == 0
+    assert result.output.count("[created]") == 2
+
+    created = {call[0][0]["tag_name"]: call[0][0] for call in mock.return_value.releases.create.call_args_list}
+    assert created["release/2.0.5"]["description"].startswith("## [2.0.5]")
+    assert created["v1"]["description"] == "Release for v1"
+
+
+def test_failed(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.id = 213145
+    mock_lists(mock.return_value, TAGS[:1], [])
+    mock.return_value.releases.create.side_effect = gitlab.exceptions.GitlabCreateError("Forbidden", 403)
+    result = runner.invoke(backfill, ARGS)
+    assert result.exit_code == 1
+    assert "[failed] tag release/2.0.5: Forbidden" in result.output
+
+
+def test_failed_continues(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.id = 213145
+    mock_lists(mock.return_value, TAGS[:2], [])
+    mock.return_value.releases.create.side_effect = [requests.exceptions.ConnectionError("Connection refused"), None]
+    result = runner.invoke(backfill, ARGS + ["--workers", 1])
+    assert result.exit_code == 1
+    assert "[failed] tag release/2.0.5: Connection refused" in result.output
+    assert "[created] tag release/2.0.4: Created release." in result.output
+
+
+def test_failed_changelog_encoding(mocker, runner, tmp_path):
+    changelog = tmp_path / "CHANGELOG.md"
+    changelog.write_bytes("## [2.0.5]\n- Caf\u00e9\n".encode("latin-1"))
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.id = 213145
+    mock_lists(mock.return_value, TAGS[:1], [])
+    result = runner.invoke(backfill, ARGS + ["-c", str(changelog)])
+    assert result.exit_code == 1
+    assert "isn't UTF-8" in result.output
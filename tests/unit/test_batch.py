@@ -0,0 +1,165 @@
+import json
+
+import gitlab
+import pytest
+
+from gitlab_auto_release.batch import batch
+from gitlab_auto_release.batch import get_manifest_format
+from gitlab_auto_release.batch import run_bounded
+from gitlab_auto_release.notes import NotesCache
+from gitlab_auto_release.state import ReleaseState
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    path = tmp_path / "releases.csv"
+    path.write_text(
+        "project_id,tag_name,release_name,assets\n"
+        "213145,release/0.5.0,,name=example.com/image.jpeg;other=example.com/other.jpeg\n"
+        "213145,release/0.6.0,Release 0.6.0,\n"
+        "81236,release/1.0.0,,\n"
+    )
+    return str(path)
+
+
+def test_success(mocker, runner, manifest):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    result = runner.invoke(batch, ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", manifest])
+    assert result.exit_code == 0
+    assert result.output.count("[created]") == 3
+    assert mock.call_count == 2
+    assert mock.return_value.releases.create.call_count == 3
+    mock.return_value.releases.create.assert_any_call(
+        {
+            "name": "release/0.5.0",
+            "tag_name": "release/0.5.0",
+            "description": "Release for release/0.5.0",
+            "assets": {
+                "links": [
+                    {"name": "name", "url": "example.com/image.jpeg"},
+                    {"name": "other", "url": "example.com/other.jpeg"},
+                ]
+            },
+        }
+    )
+
+
+def test_release_exists(mocker, runner, manifest):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.return_value = True
+    result = runner.invoke(batch, ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", manifest])
+    assert result.exit_code == 0
+    assert result.output.count("[exists]") == 3
+    mock.return_value.releases.create.assert_not_called()
+
+
+def test_failed_entries(mocker, runner, tmp_path):
+    path = tmp_path / "releases.jsonl"
+    entries = [{"project_id": 213145, "tag_name": "release/0.5.0"}, {"project_id": 213145}]
+    path.write_text("\n".join(json.dumps(entry) for entry in entries))
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    result = runner.invoke(batch, ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", str(path)])
+    assert result.exit_code == 1
+    assert "[created]" in result.output
+    assert "[failed]" in result.output
+
+
+def test_notes_cached(mocker, runner, tmp_path):
+    path = tmp_path / "releases.jsonl"
+    path.write_text(json.dumps({"project_id": 213145, "tag_name": "release/0.5.0", "notes": True}))
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    generate_notes = mocker.patch("gitlab_auto_release.cli.generate_notes", return_value="- Fixed a bug")
+    cache_dir = str(tmp_path / "cache")
+    args = ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", "--cache-dir", cache_dir]
+    result = runner.invoke(batch, args + [str(path)])
+    assert result.exit_code == 0
+    notes_cache = generate_notes.call_args[0][4]
+    assert isinstance(notes_cache, NotesCache)
+    assert notes_cache.path == cache_dir
+
+
+def test_failed_entry_reason(mocker, runner, tmp_path):
+    path = tmp_path / "releases.jsonl"
+    entries = [
+        {"project_id": 213145, "tag_name": "release/0.5.0", "notes": True},
+        {"project_id": 213145, "tag_name": "release/0.6.0"},
+    ]
+    path.write_text("\n".join(json.dumps(entry) for entry in entries))
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    mocker.patch("gitlab_auto_release.cli.generate_notes", side_effect=gitlab.exceptions.GitlabGetError("Not found"))
+    result = runner.invoke(batch, ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", str(path)])
+    assert result.exit_code == 1
+    # Only the result of each release is printed, in the order they finish.
+    assert sorted(result.output.splitlines()[:2]) == [
+        "[created] project 213145 tag release/0.6.0: Created release.",
+        "[failed] project 213145 tag release/0.5.0: Unable to generate release notes for release/0.5.0: Not found",
+    ]
+
+
+@pytest.mark.parametrize(
+    "manifest, manifest_format",
+    [("releases.csv", "csv"), ("releases.jsonl", "jsonl"), ("releases.json", "jsonl"), ("releases.yml", "yaml")],
+)
+def test_get_manifest_format(manifest, manifest_format):
+    assert get_manifest_format(manifest) == manifest_format
+
+
+def test_run_bounded_reads_lazily():
+    read = []
+
+    def items():
+        for item in range(10):
+            read.append(item)
+            yield item
+
+    results = run_bounded(lambda item: item * 2, items(), workers=2)
+    first = next(results)
+    assert len(read) <= 5
+    assert sorted([first] + list(results)) == list(range(0, 20, 2))
+
+
+def test_resume(mocker, runner, manifest, tmp_path):
+    state_file = str(tmp_path / "state.sqlite")
+    state = ReleaseState(state_file)
+    state.put(213145, "release/0.5.0", "created", message="Created release.")
+    release = {"name": "Release 0.6.0", "tag_name": "release/0.6.0", "description": "Resolved", "assets": {"links": []}}
+    state.put(213145, "release/0.6.0", "resolved", release)
+    state.close()
+
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    args = ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", "--state-file", state_file]
+    result = runner.invoke(batch, args + [manifest])
+    assert result.exit_code == 0
+    assert "Skipped 1 release(s)" in result.output
+    assert result.output.count("[created]") == 2
+    mock.return_value.releases.create.assert_any_call(release)
+    assert mock.return_value.releases.get.call_count == 1
+    assert ReleaseState(state_file).counts() == {"created": 3}
+
+    mock.reset_mock()
+    result = runner.invoke(batch, args + [manifest])
+    assert "Skipped 3 release(s)" in result.output
+    mock.assert_not_called()
+
+
+def test_resume_failed(mocker, runner, manifest, tmp_path):
+    state_file = str(tmp_path / "state.sqlite")
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    mock.return_value.releases.create.side_effect = gitlab.exceptions.GitlabCreateError("Token expired", 401)
+    args = ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", "--state-file", state_file]
+    result = runner.invoke(batch, args + [manifest])
+    assert result.exit_code == 1
+    assert ReleaseState(state_file).counts() == {"failed": 3}
+
+    mock.reset_mock()
+    mock.return_value.releases.create.side_effect = [None, None, gitlab.exceptions.GitlabCreateError("Exists", 409)]
+    result = runner.invoke(batch, args + [manifest])
+    assert result.exit_code == 0
+    mock.return_value.releases.get.assert_not_called()
+    assert ReleaseState(state_file).counts() == {"created": 2, "exists": 1}
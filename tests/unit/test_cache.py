@@ -0,0 +1,136 @@
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from gitlab_auto_release.cache import CACHE_HEADER
+from gitlab_auto_release.cache import DEFAULT_TTLS
+from gitlab_auto_release.cache import CachingAdapter
+from gitlab_auto_release.cache import ResponseCache
+from gitlab_auto_release.cache import get_ttl
+from gitlab_auto_release.wait import wait_for_jobs
+
+PROJECT_URL = "https://gitlab.com/api/v4/projects/213145"
+
+
+class FakeAdapter(BaseAdapter):
+    def __init__(self, etag="abc"):
+        super().__init__()
+        self.etag = etag
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        if self.etag and request.headers.get("If-None-Match") == self.etag:
+            response.status_code = 304
+            response._content = b""
+        else:
+            response.status_code = 200
+            response._content = b'{"id": 213145}'
+            response.headers["ETag"] = self.etag
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path))
+
+
+def get_session(adapter, cache, ttls=None):
+    session = requests.Session()
+    caching_adapter = CachingAdapter(adapter, cache, ttls) if ttls else CachingAdapter(adapter, cache)
+    session.mount("https://", caching_adapter)
+    return session
+
+
+def test_cache_hit(cache):
+    adapter = FakeAdapter()
+    session = get_session(adapter, cache)
+    first = session.get(PROJECT_URL, headers={"PRIVATE-TOKEN": "ATOKEN1234"})
+    second = session.get(PROJECT_URL, headers={"PRIVATE-TOKEN": "ATOKEN1234"})
+    assert first.headers[CACHE_HEADER] == "miss"
+    assert second.headers[CACHE_HEADER] == "hit"
+    assert second.json() == {"id": 213145}
+    assert len(adapter.requests) == 1
+
+
+def test_cache_token_not_shared(cache):
+    adapter = FakeAdapter()
+    session = get_session(adapter, cache)
+    session.get(PROJECT_URL, headers={"PRIVATE-TOKEN": "ATOKEN1234"})
+    response = session.get(PROJECT_URL, headers={"PRIVATE-TOKEN": "ANOTHERTOKEN"})
+    assert response.headers[CACHE_HEADER] == "miss"
+    assert len(adapter.requests) == 2
+
+
+def test_cache_revalidated(cache):
+    adapter = FakeAdapter()
+    ttls = (("project", DEFAULT_TTLS[0][1], 0),)
+    session = get_session(adapter, cache, ttls)
+    session.get(PROJECT_URL)
+    response = session.get(PROJECT_URL)
+    assert response.status_code == 200
+    assert response.headers[CACHE_HEADER] == "revalidated"
+    assert response.json() == {"id": 213145}
+    assert adapter.requests[1].headers["If-None-Match"] == "abc"
+
+
+def test_cache_revalidated_while_polling(cache):
+    adapter = FakeAdapter()
+    session = get_session(adapter, cache)
+    session.get(PROJECT_URL)
+    responses = []
+
+    def resolve(names):
+        responses.append(session.get(PROJECT_URL))
+        return {"build": (type("Job", (), {"id": 1, "status": "success"}), 5)}
+
+    wait_for_jobs(None, resolve, ["build"], sleep=lambda _: None)
+    assert responses[0].headers[CACHE_HEADER] == "revalidated"
+    assert adapter.requests[1].headers["If-None-Match"] == "abc"
+    assert session.get(PROJECT_URL).headers[CACHE_HEADER] == "hit"
+
+
+def test_not_cached(cache):
+    adapter = FakeAdapter()
+    session = get_session(adapter, cache)
+    session.post(f"{PROJECT_URL}/releases")
+    session.post(f"{PROJECT_URL}/releases")
+    session.get(f"{PROJECT_URL}/repository/tags")
+    session.get(f"{PROJECT_URL}/repository/tags")
+    assert len(adapter.requests) == 4
+
+
+def test_lru_eviction(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_size=30)
+    adapter = FakeAdapter()
+    session = get_session(adapter, cache)
+    session.get(f"{PROJECT_URL}")
+    time.sleep(0.01)
+    session.get("https://gitlab.com/api/v4/projects/81236")
+    time.sleep(0.01)
+    session.get(f"{PROJECT_URL}")
+    time.sleep(0.01)
+    session.get("https://gitlab.com/api/v4/projects/12345")
+    assert session.get(f"{PROJECT_URL}").headers[CACHE_HEADER] == "hit"
+    assert session.get("https://gitlab.com/api/v4/projects/81236").headers[CACHE_HEADER] == "miss"
+
+
+@pytest.mark.parametrize(
+    "url, ttl",
+    [
+        (PROJECT_URL, 3600),
+        (f"{PROJECT_URL}/pipelines/79790/jobs", 30),
+        (f"{PROJECT_URL}/releases/release%2F0.5.0", 0),
+        (f"{PROJECT_URL}/repository/tags", None),
+    ],
+)
+def test_get_ttl(url, ttl):
+    assert get_ttl(url) == ttl
@@ -0,0 +1,200 @@
+import io
+import os
+import shutil
+
+import pytest
+
+from gitlab_auto_release.changelog import ChangelogIndex
+from gitlab_auto_release.changelog import ChangelogIndexes
+from gitlab_auto_release.changelog import get_changelog
+
+
+@pytest.mark.parametrize(
+    "tag_name, expected",
+    [
+        (
+            "release/2.0.5",
+            "## [2.0.5] - 2019-10-21\n### Changed\n- All references to MR (merge request) changed to release.\n\n",
+        ),
+        ("v1.2.3", ""),
+    ],
+)
+def test_get_changelog(tag_name, expected):
+    assert get_changelog("tests/data/CHANGELOG.md", tag_name) == expected
+
+
+def test_get_changelog_stops_at_next_section(mocker):
+    content = b"## [1.0.0]\n- Added a feature.\n## [0.1.0]\n- Not read.\n"
+    lines = io.BytesIO(content)
+    change = mocker.MagicMock()
+    change.__enter__.return_value = lines
+    mocker.patch("builtins.open", return_value=change)
+    assert get_changelog("CHANGELOG.md", "release/1.0.0") == "## [1.0.0]\n- Added a feature.\n"
+    assert lines.tell() <= content.index(b"- Not read.")
+
+
+@pytest.mark.parametrize("tag_name", ["release/2.0.5", "release/1.0.4", "release/0.1.0", "v1.2.3"])
+def test_index_matches_get_changelog(tag_name):
+    index = ChangelogIndex.build("tests/data/CHANGELOG.md")
+    assert index.section(tag_name) == get_changelog("tests/data/CHANGELOG.md", tag_name)
+
+
+def test_index_invalid_tag():
+    index = ChangelogIndex.build("tests/data/CHANGELOG.md")
+    with pytest.raises(AttributeError):
+        index.section("release/")
+
+
+def test_indexes_memoized(mocker):
+    build = mocker.spy(ChangelogIndex, "build")
+    changelogs = ChangelogIndexes()
+    changelogs.get_changelog("tests/data/CHANGELOG.md", "release/2.0.5")
+    changelogs.get_changelog("tests/data/CHANGELOG.md", "release/1.0.4")
+    assert build.call_count == 1
+
+
+def test_indexes_sidecar(mocker, tmp_path):
+    changelog = str(tmp_path / "CHANGELOG.md")
+    shutil.copy("tests/data/CHANGELOG.md", changelog)
+    sidecar_dir = str(tmp_path / "changelogs")
+    expected = get_changelog(changelog, "release/2.0.5")
+    ChangelogIndexes(sidecar_dir).get_changelog(changelog, "release/1.0.4")
+    assert len(os.listdir(sidecar_dir)) == 1
+
+    build = mocker.spy(ChangelogIndex, "build")
+    os.utime(changelog, ns=(0, 0))
+    assert ChangelogIndexes(sidecar_dir).get_changelog(changelog, "release/2.0.5") == expected
+    assert build.call_count == 0
+
+    with open(changelog, "a") as change:
+        change.write("\n## [9.9.9]\n")
+    assert ChangelogIndexes(sidecar_dir).get_changelog(changelog, "release/9.9.9") == "## [9.9.9]\n"
+    assert build.call_count == 1
+
+
+RST_CHANGELOG = """=========
+Changelog
+=========
+
+1.1.0 (2020-02-01)
+------------------
+Added
+~~~~~
+- A feature.
+
+1.0.0 (2020-01-01)
+------------------
+- The first release.
+"""
+
+ASCIIDOC_CHANGELOG = """= Changelog
+
+== [1.1.0] - 2020-02-01
+=== Added
+----
+== Not a heading
+----
+
+== [1.0.0] - 2020-01-01
+- The first release.
+"""
+
+CONVENTIONAL_CHANGELOG = """# Changelog
+
+## [1.1.0](https://gitlab.com/group/project/compare/v1.0.1...v1.1.0) (2020-02-01)
+
+### Features
+
+* a feature
+
+### [1.0.1](https://gitlab.com/group/project/compare/v1.0.0...v1.0.1) (2020-01-15)
+
+### Bug Fixes
+
+* a fix
+
+```
+## [0.9.0] in a code block
+```
+
+## 1.0.0 (2020-01-01)
+"""
+
+
+def between(text, start, end):
+    return text[text.index(start) : text.index(end)]
+
+
+@pytest.mark.parametrize(
+    "name, content, tag_name, expected",
+    [
+        (
+            "CHANGELOG.rst",
+            RST_CHANGELOG,
+            "v1.1.0",
+            "1.1.0 (2020-02-01)\n------------------\nAdded\n~~~~~\n- A feature.\n\n",
+        ),
+        ("CHANGELOG.rst", RST_CHANGELOG, "v1.0.0", "1.0.0 (2020-01-01)\n------------------\n- The first release.\n"),
+        (
+            "CHANGELOG.adoc",
+            ASCIIDOC_CHANGELOG,
+            "v1.1.0",
+            "== [1.1.0] - 2020-02-01\n=== Added\n----\n== Not a heading\n----\n\n",
+        ),
+        (
+            "CHANGELOG.md",
+            CONVENTIONAL_CHANGELOG,
+            "v1.1.0",
+            between(CONVENTIONAL_CHANGELOG, "## [1.1.0]", "### [1.0.1]"),
+        ),
+        ("CHANGELOG.md", CONVENTIONAL_CHANGELOG, "v1.0.1", between(CONVENTIONAL_CHANGELOG, "### [1.0.1]", "## 1.0.0")),
+        ("CHANGELOG.md", CONVENTIONAL_CHANGELOG, "v0.9.0", ""),
+        ("CHANGELOG", RST_CHANGELOG, "v1.0.0", "1.0.0 (2020-01-01)\n------------------\n- The first release.\n"),
+        ("CHANGELOG.txt", ASCIIDOC_CHANGELOG, "v1.0.0", "== [1.0.0] - 2020-01-01\n- The first release.\n"),
+    ],
+)
+def test_get_changelog_formats(tmp_path, name, content, tag_name, expected):
+    changelog = tmp_path / name
+    changelog.write_bytes(content.encode("utf-8"))
+    assert get_changelog(str(changelog), tag_name) == expected
+    assert ChangelogIndex.build(str(changelog)).section(tag_name) == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_get_changelog_chunk_boundaries(mocker, chunk_size):
+    mocker.patch("gitlab_auto_release.changelog.CHUNK_SIZE", chunk_size)
+    expected = "## [2.0.5] - 2019-10-21\n### Changed\n- All references to MR (merge request) changed to release.\n\n"
+    assert get_changelog("tests/data/CHANGELOG.md", "release/2.0.5") == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_index_chunk_boundaries_rst(mocker, tmp_path, chunk_size):
+    mocker.patch("gitlab_auto_release.changelog.CHUNK_SIZE", chunk_size)
+    changelog = tmp_path / "CHANGELOG.rst"
+    changelog.write_bytes(RST_CHANGELOG.replace("\n", "\r\n").encode("utf-8"))
+    index = ChangelogIndex.build(str(changelog))
+    assert sorted(index.sections) == ["1.0.0", "1.1.0"]
+    assert index.section("v1.0.0") == "1.0.0 (2020-01-01)\n------------------\n- The first release.\n"
+
+
+def test_get_changelog_format_override(tmp_path):
+    changelog = tmp_path / "CHANGELOG.md"
+    changelog.write_bytes(RST_CHANGELOG.encode("utf-8"))
+    assert get_changelog(str(changelog), "v1.0.0") == ""
+    assert get_changelog(str(changelog), "v1.0.0", changelog_format="rst").startswith("1.0.0 (2020-01-01)")
+    with pytest.raises(ValueError):
+        get_changelog(str(changelog), "v1.0.0", changelog_format="textile")
+
+
+def test_get_changelog_fence_before_section(mocker, tmp_path):
+    mocker.patch("gitlab_auto_release.changelog.CHUNK_SIZE", 48)
+    content = (
+        "```\n## [9.9.9]\n```\n## [1.1.0] - 2020-02-01\n- Second.\n"
+        + "- Padding.\n" * 10
+        + "## [1.0.0] - 2020-01-01\n- The first release.\n"
+    )
+    changelog = tmp_path / "CHANGELOG.md"
+    changelog.write_bytes(content.encode("utf-8"))
+    expected = between(content, "## [1.1.0]", "## [1.0.0]")
+    assert get_changelog(str(changelog), "v1.1.0") == expected
+    assert ChangelogIndex.build(str(changelog)).section("v1.1.0") == expected
@@ -1,10 +1,23 @@
+import json
 import os
+import threading
 from collections import namedtuple
 
 import gitlab
 import pytest
 
+from gitlab_auto_release.cli import add_artifacts
 from gitlab_auto_release.cli import cli
+from gitlab_auto_release.cli import index_pipeline_jobs
+from gitlab_auto_release.cli import index_pipeline_tree
+from gitlab_auto_release.wait import WaitTimeoutError
+from gitlab_auto_release.wait import is_polling
+from gitlab_auto_release.wait import wait_for_jobs
+
+
+def get_page(items):
+    """A page of a streamed list response, as returned by `http_stream`."""
+    return {}, [json.dumps(items).encode("utf-8")]
 
 
 @pytest.mark.parametrize(
@@ -184,7 +197,7 @@ def test_invalid_add_artifacts_index_error(mocker, runner):
     os.environ["CI_PIPELINE_ID"] = "79790"
     mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
     mock.return_value.releases.get.return_value = None
-    mock.return_value.pipelines.get.return_value.jobs.list.return_value = []
+    mock.return_value.pipelines.get.return_value.jobs.gitlab.http_stream.return_value = get_page([])
     result = runner.invoke(cli, args)
     assert result.exit_code == 1
 
@@ -320,10 +333,10 @@ def test_invalid_add_changelog_oserror(mocker, runner):
 )
 def test_success(mocker, runner, args):
     os.environ["CI_PIPELINE_ID"] = "79790"
-    Job = namedtuple("Job", "name id")
     mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
     mock.return_value.releases.get.return_value = None
-    mock.return_value.pipelines.get.return_value.jobs.list.return_value = [Job(name="example_job", id="1235")]
+    jobs = mock.return_value.pipelines.get.return_value.jobs
+    jobs.gitlab.http_stream.return_value = get_page([{"name": "example_job", "id": 1235}])
     result = runner.invoke(cli, args)
     assert result.exit_code == 0
 
@@ -366,9 +379,395 @@ def test_envvars(mocker, runner):
     os.environ["CI_COMMIT_TAG"] = "release/0.5.0"
     os.environ["CI_PIPELINE_ID"] = "79790"
 
-    Job = namedtuple("Job", "name id")
     mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
     mock.return_value.releases.get.return_value = None
-    mock.return_value.pipelines.get.return_value.jobs.list.return_value = [Job(name="example_job", id="1235")]
+    jobs = mock.return_value.pipelines.get.return_value.jobs
+    jobs.gitlab.http_stream.return_value = get_page([{"name": "example_job", "id": 1235}])
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+
+
+def test_index_pipeline_jobs_stops_paging(mocker):
+    pipeline = mocker.MagicMock()
+    pipeline.jobs.gitlab.http_stream.side_effect = [
+        get_page([{"name": "build", "id": 12}, {"name": "lint", "id": 11}]),
+        get_page([{"name": "build", "id": 9}, {"name": "report", "id": 8}]),
+        get_page([{"name": "docs", "id": 5}]),
+    ]
+    jobs = index_pipeline_jobs(pipeline, ["build", "report"], per_page=2)
+    assert jobs["build"].id == 12
+    assert jobs["report"].id == 8
+    assert pipeline.jobs.gitlab.http_stream.call_count == 2
+
+
+def test_index_pipeline_jobs_scope(mocker):
+    pipeline = mocker.MagicMock()
+    pipeline.jobs.gitlab.http_stream.return_value = get_page([])
+    jobs = index_pipeline_jobs(pipeline, ["build"], scope=("success",))
+    assert jobs == {}
+    pipeline.jobs.gitlab.http_stream.assert_called_once_with(
+        pipeline.jobs.path, {"scope[]": ["success"], "page": 1, "per_page": 100}
+    )
+
+
+def get_pipeline_tree(mocker):
+    """Pipeline 1 in project 5 triggers child pipeline 2 and pipeline 3 in project 6, pipeline 2 triggers 4."""
+    jobs = {
+        1: [{"name": "build", "id": 10}],
+        2: [{"name": "build", "id": 20}, {"name": "build-linux", "id": 21}],
+        3: [{"name": "docs", "id": 30, "web_url": "https://gitlab.com/group/docs/-/jobs/30"}],
+        4: [{"name": "deep", "id": 40}],
+    }
+    bridges = {
+        "/projects/5/pipelines/1/bridges": [
+            {"downstream_pipeline": {"id": 2, "project_id": 5}},
+            {"downstream_pipeline": {"id": 3, "project_id": 6}},
+            {"downstream_pipeline": None},
+        ],
+        "/projects/5/pipelines/2/bridges": [
+            {"downstream_pipeline": {"id": 4, "project_id": 5}},
+            {"downstream_pipeline": {"id": 1, "project_id": 5}},
+        ],
+    }
+
+    def get_project(project_id):
+        project = mocker.MagicMock(id=project_id)
+        project.manager.gitlab = gl
+        project.pipelines.get.side_effect = lambda pipeline_id, lazy=False: get_pipeline(pipeline_id)
+        return project
+
+    def get_pipeline(pipeline_id):
+        pipeline = mocker.MagicMock(id=pipeline_id)
+        pipeline.jobs.gitlab.http_stream.return_value = get_page(jobs[pipeline_id])
+        return pipeline
+
+    gl = mocker.MagicMock()
+    gl.http_list.side_effect = lambda path, query_data, **kwargs: bridges.get(path, [])
+    gl.projects.get.side_effect = lambda project_id, lazy=False: get_project(project_id)
+    return gl, get_project(5)
+
+
+def test_index_pipeline_tree(mocker):
+    gl, project = get_pipeline_tree(mocker)
+    index = index_pipeline_tree(project, project.pipelines.get(1), ["build", "build-linux", "docs", "deep"])
+
+    assert {name: (job.id, project_id) for name, (job, project_id) in index.items()} == {
+        "build": (10, 5),
+        "build-linux": (21, 5),
+        "docs": (30, 6),
+        "deep": (40, 5),
+    }
+    assert gl.http_list.call_count == 4
+
+
+def test_index_pipeline_tree_stops_at_root(mocker):
+    gl, project = get_pipeline_tree(mocker)
+    index = index_pipeline_tree(project, project.pipelines.get(1), ["build"])
+    assert index["build"][0].id == 10
+    gl.projects.get.assert_not_called()
+
+
+def test_index_pipeline_tree_bypasses_cache_when_waiting(mocker):
+    gl, project = get_pipeline_tree(mocker)
+    polling = []
+    gl.http_list.side_effect = lambda path, query_data, **kwargs: polling.append(is_polling()) or []
+
+    def resolve(names):
+        index_pipeline_tree(project, project.pipelines.get(1), ["missing"])
+        return {"build": (mocker.MagicMock(id=10, status="success"), 5)}
+
+    wait_for_jobs(gl, resolve, ["build"], sleep=lambda _: None)
+    assert polling == [True]
+    assert not is_polling()
+
+
+def test_add_artifacts_downstream(mocker):
+    _, project = get_pipeline_tree(mocker)
+    assets = add_artifacts(project, ["build-linux", "docs"], "https://gitlab.com/group/app", pipeline_id=1)
+    assert assets == [
+        {"name": "Artifact: build-linux", "url": "https://gitlab.com/group/app/-/jobs/21/artifacts/download"},
+        {"name": "Artifact: docs", "url": "https://gitlab.com/group/docs/-/jobs/30/artifacts/download"},
+    ]
+
+
+def test_success_requests_overlap(mocker, runner):
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--artifacts",
+        "example_job",
+    ]
+    os.environ["CI_PIPELINE_ID"] = "79790"
+    barrier = threading.Barrier(2, timeout=5)
+
+    def get_release(tag_name):
+        barrier.wait()
+        raise gitlab.exceptions.GitlabGetError
+
+    def list_jobs(path, query_data):
+        barrier.wait()
+        return get_page([{"name": "example_job", "id": 1235}])
+
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = get_release
+    mock.return_value.pipelines.get.return_value.jobs.gitlab.http_stream.side_effect = list_jobs
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    mock.return_value.releases.create.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "create_error, exit_code",
+    [(None, 0), (gitlab.exceptions.GitlabCreateError("Release already exists", 409), 0)],
+)
+def test_optimistic(mocker, runner, create_error, exit_code):
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--optimistic",
+    ]
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.create.side_effect = create_error
+    result = runner.invoke(cli, args)
+    assert result.exit_code == exit_code
+    mock.return_value.releases.get.assert_not_called()
+
+
+def test_optimistic_create_error(mocker, runner):
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--optimistic",
+    ]
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.create.side_effect = gitlab.exceptions.GitlabCreateError("Forbidden", 403)
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 1
+    assert isinstance(result.exception, gitlab.exceptions.GitlabCreateError)
+
+
+@pytest.mark.parametrize("metrics_format, expected", [("jsonl", '"name": "create_release"'), ("openmetrics", "# EOF")])
+def test_metrics_file(mocker, runner, tmpdir, metrics_format, expected):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.return_value = None
+    metrics_file = str(tmpdir.join("metrics"))
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--metrics-file",
+        metrics_file,
+        "--metrics-format",
+        metrics_format,
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    with open(metrics_file) as f:
+        assert expected in f.read()
+
+
+def test_invalid_upload_file(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.return_value = None
+    mock.return_value.id = 213145
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--upload",
+        "tests/data/missing.zip",
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Unable to open file to upload tests/data/missing.zip." in result.output
+
+
+@pytest.mark.parametrize("optimistic", [[], ["--optimistic"]])
+def test_upload_release_exists(mocker, runner, optimistic):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.return_value = True
+    upload = mocker.patch("gitlab_auto_release.uploads.upload_assets")
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--upload",
+        "tests/data/CHANGELOG.md",
+    ] + optimistic
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    assert "Release already exists for tag release/0.5.0." in result.output
+    upload.assert_not_called()
+    mock.return_value.releases.create.assert_not_called()
+
+
+def test_wait_for_artifacts_timeout(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = gitlab.exceptions.GitlabGetError
+    wait = mocker.patch("gitlab_auto_release.cli.wait_for_jobs", side_effect=WaitTimeoutError("Timed out."))
+    mocker.patch.dict("os.environ", {"CI_PIPELINE_ID": "79790"})
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--artifacts",
+        "build",
+        "--wait-for-artifacts",
+        "--wait-timeout",
+        "5",
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Timed out." in result.output
+    assert wait.call_args[1]["timeout"] == 5
+
+
+def test_wait_for_artifacts_release_exists(mocker, runner):
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.return_value = True
+    wait = mocker.patch("gitlab_auto_release.cli.wait_for_jobs")
+    mocker.patch.dict("os.environ", {"CI_PIPELINE_ID": "79790"})
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--artifacts",
+        "build",
+        "--wait-for-artifacts",
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    assert "Release already exists for tag release/0.5.0." in result.output
+    wait.assert_not_called()
+    mock.return_value.pipelines.get.assert_not_called()
+
+
+def test_sync(mocker, runner):
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--description",
+        "Fixed description",
+        "--asset",
+        "docs=https://example.com/docs",
+        "--sync",
+    ]
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.id = 213145
+    mock.return_value.releases.get.return_value.attributes = {
+        "name": "release/0.5.0",
+        "description": "Typo",
+        "assets": {"links": [{"id": 1, "name": "docs", "url": "https://example.com/docs"}]},
+    }
+    gl = mock.return_value.manager.gitlab
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    assert "Updated the release for tag release/0.5.0: description." in result.output
+    gl.http_put.assert_called_once_with(
+        "/projects/213145/releases/release%2F0.5.0", post_data={"description": "Fixed description"}
+    )
+    gl.http_post.assert_not_called()
+    gl.http_delete.assert_not_called()
+    mock.return_value.releases.create.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "get_release, expected",
+    [
+        (gitlab.exceptions.GitlabGetError, "would be created with:"),
+        (None, "already exists, it wouldn't be created:"),
+    ],
+)
+def test_dry_run(mocker, runner, get_release, expected):
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com/hmajid2301/gitlab-auto-release",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--asset",
+        "docs=https://example.com/docs",
+        "--dry-run",
+        "--optimistic",
+    ]
+    mock = mocker.patch("gitlab.v4.objects.ProjectManager.get")
+    mock.return_value.releases.get.side_effect = get_release
     result = runner.invoke(cli, args)
     assert result.exit_code == 0
+    assert expected in result.output
+    assert '"url": "https://example.com/docs"' in result.output
+    assert "check_release" in result.output
+    assert ("create_release" in result.output) == (get_release is not None)
+    mock.return_value.releases.create.assert_not_called()
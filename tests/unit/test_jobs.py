@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from gitlab_auto_release.jobs import JobRecord
+from gitlab_auto_release.jobs import has_artifacts
+from gitlab_auto_release.jobs import list_job_records
+
+JOB = {
+    "id": "1235",
+    "name": "build",
+    "status": "success",
+    "stage": "build",
+    "finished_at": "2020-01-01T10:00:00.000Z",
+    "web_url": "https://gitlab.com/group/app/-/jobs/1235",
+    "artifacts": [{"file_type": "trace", "filename": "job.log"}, {"file_type": "archive", "filename": "a.zip"}],
+    "commit": {"id": "abc123", "message": "Add a feature"},
+    "runner": {"id": 1, "description": "shared"},
+    "user": {"id": 2, "username": "user"},
+}
+
+
+def test_from_attributes():
+    job = JobRecord.from_attributes(JOB)
+    assert job == JobRecord(
+        "build", 1235, "success", "2020-01-01T10:00:00.000Z", "https://gitlab.com/group/app/-/jobs/1235", True
+    )
+    assert not hasattr(job, "__dict__")
+    with pytest.raises(AttributeError):
+        job.stage
+
+
+@pytest.mark.parametrize(
+    "attributes, expected",
+    [
+        ({"artifacts": [{"file_type": "archive"}]}, True),
+        ({"artifacts": [{"file_type": "trace"}]}, False),
+        ({"artifacts": [], "artifacts_file": {"filename": "a.zip"}}, False),
+        ({"artifacts_file": {"filename": "a.zip"}}, True),
+        ({}, False),
+    ],
+)
+def test_has_artifacts(attributes, expected):
+    assert has_artifacts(attributes) is expected
+
+
+def test_list_job_records(mocker):
+    pipeline = mocker.MagicMock()
+    pipeline.jobs.path = "/projects/5/pipelines/1/jobs"
+    pipeline.jobs.gitlab.http_stream.return_value = ({}, [json.dumps([JOB, {"id": 1234, "name": "lint"}]).encode()])
+    jobs = list_job_records(pipeline, 2, 50, scope=("success", "failed"))
+
+    assert [(job.name, job.id, job.status) for job in jobs] == [("build", 1235, "success"), ("lint", 1234, None)]
+    pipeline.jobs.gitlab.http_stream.assert_called_once_with(
+        "/projects/5/pipelines/1/jobs", {"scope[]": ["success", "failed"], "page": 2, "per_page": 50}
+    )
@@ -0,0 +1,174 @@
+import gzip
+import io
+import json
+import urllib.error
+
+import gitlab
+import pytest
+import requests
+
+from gitlab_auto_release.cli import cli
+from gitlab_auto_release.lite import LiteGitlab
+from gitlab_auto_release.lite import encode_query
+from gitlab_auto_release.transport import Transport
+
+
+class FakeResponse(io.BytesIO):
+    status = 200
+    headers = {}
+
+
+def fake_urlopen(routes, requests_made):
+    def urlopen(request, timeout=None):
+        requests_made.append(request)
+        status_code, body = routes[(request.get_method(), request.full_url)]
+        body = json.dumps(body).encode("utf-8")
+        if status_code >= 400:
+            raise urllib.error.HTTPError(request.full_url, status_code, "Error", {}, io.BytesIO(body))
+        return FakeResponse(body)
+
+    return urlopen
+
+
+API_URL = "https://gitlab.com/api/v4/projects/213145"
+
+
+def test_success(mocker, runner):
+    routes = {
+        ("GET", API_URL): (200, {"id": 213145}),
+        ("GET", f"{API_URL}/releases/release%2F0.5.0"): (404, {"message": "404 Not Found"}),
+        ("GET", f"{API_URL}/pipelines/79790/jobs?page=1&per_page=100"): (200, [{"name": "example_job", "id": 1235}]),
+        ("POST", f"{API_URL}/releases"): (201, {"tag_name": "release/0.5.0"}),
+    }
+    requests_made = []
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, requests_made))
+    mocker.patch.dict("os.environ", {"CI_PIPELINE_ID": "79790"})
+    args = [
+        "--private-token",
+        "ATOKEN1234",
+        "--project-id",
+        213145,
+        "--gitlab-url",
+        "https://gitlab.com",
+        "--tag-name",
+        "release/0.5.0",
+        "--release-name",
+        "release/0.5.0",
+        "--artifacts",
+        "example_job",
+        "--lite",
+    ]
+    result = runner.invoke(cli, args)
+    assert result.exit_code == 0
+    created = json.loads(requests_made[-1].data)
+    assert created["assets"]["links"] == [
+        {"name": "Artifact: example_job", "url": "https://gitlab.com/-/jobs/1235/artifacts/download"}
+    ]
+    assert requests_made[0].headers["Private-token"] == "ATOKEN1234"
+
+
+@pytest.mark.parametrize(
+    "status_code, exception",
+    [(401, gitlab.exceptions.GitlabAuthenticationError), (404, gitlab.exceptions.GitlabGetError)],
+)
+def test_project_errors(mocker, status_code, exception):
+    routes = {("GET", API_URL): (status_code, {"message": "Error"})}
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, []))
+    with pytest.raises(exception):
+        LiteGitlab("https://gitlab.com", "ATOKEN1234").projects.get(213145)
+
+
+def test_release_exists(mocker):
+    routes = {
+        ("GET", API_URL): (200, {"id": 213145}),
+        ("GET", f"{API_URL}/releases/v1.0.0"): (200, {"tag_name": "v1.0.0"}),
+    }
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, []))
+    project = LiteGitlab("https://gitlab.com", "ATOKEN1234").projects.get(213145)
+    assert project.releases.get("v1.0.0").tag_name == "v1.0.0"
+
+
+def test_create_error(mocker):
+    routes = {
+        ("GET", API_URL): (200, {"id": 213145}),
+        ("POST", f"{API_URL}/releases"): (409, {"message": "Release already exists"}),
+    }
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, []))
+    project = LiteGitlab("https://gitlab.com", "ATOKEN1234").projects.get(213145)
+    with pytest.raises(gitlab.exceptions.GitlabCreateError) as e:
+        project.releases.create({"tag_name": "v1.0.0"})
+    assert e.value.response_code == 409
+    assert e.value.error_message == "Release already exists"
+
+
+def test_missing_schema():
+    with pytest.raises(Exception) as e:
+        LiteGitlab("gitlab.com", "ATOKEN1234").projects.get(213145)
+    assert type(e.value).__name__ == "MissingSchema"
+
+
+@pytest.mark.parametrize(
+    "error, exception",
+    [
+        (urllib.error.URLError(OSError(-2, "Name or service not known")), requests.exceptions.ConnectionError),
+        (urllib.error.URLError(TimeoutError("timed out")), requests.exceptions.Timeout),
+        (ConnectionResetError(104, "Connection reset by peer"), requests.exceptions.ConnectionError),
+    ],
+)
+def test_connection_errors(mocker, error, exception):
+    mocker.patch("urllib.request.urlopen", side_effect=error)
+    gl = LiteGitlab("https://gitlab.com", "ATOKEN1234")
+    with pytest.raises(exception, match="requesting https://gitlab.com/api/v4/projects/213145"):
+        gl.projects.get(213145)
+    with pytest.raises(exception):
+        gl.http_stream("/projects/213145/repository/tags")
+    with pytest.raises(exception):
+        gl.http_get_conditional("/projects/213145/jobs/1")
+
+
+def test_connection_error_cli(mocker, runner):
+    mocker.patch("urllib.request.urlopen", side_effect=urllib.error.URLError(ConnectionRefusedError(111, "refused")))
+    args = ["--private-token", "ATOKEN1234", "--project-id", 213145, "--gitlab-url", "https://gitlab.com"]
+    result = runner.invoke(cli, args + ["--tag-name", "v1.0.0", "--release-name", "v1.0.0", "--lite"])
+    assert result.exit_code == 1
+    assert "Unable to connect to https://gitlab.com: [Errno 111] refused" in result.output
+
+
+def test_encode_query():
+    assert encode_query({"page": 1, "scope": ["success", "failed"]}) == "page=1&scope%5B%5D=success&scope%5B%5D=failed"
+    assert encode_query({"scope[]": ["success"]}) == "scope%5B%5D=success"
+
+
+def test_http_stream(mocker):
+    routes = {("GET", f"{API_URL}/repository/tags?page=1&per_page=2"): (200, [{"name": "v2"}, {"name": "v1"}])}
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, []))
+    metrics = mocker.MagicMock()
+    gl = LiteGitlab("https://gitlab.com", "ATOKEN1234", metrics=metrics)
+
+    _, chunks = gl.http_stream("/projects/213145/repository/tags", {"page": 1, "per_page": 2})
+    metrics.record_request.assert_not_called()
+    assert json.loads(b"".join(chunks)) == [{"name": "v2"}, {"name": "v1"}]
+    assert metrics.record_request.call_args[0][:4] == ("GET", f"{API_URL}/repository/tags?page=1&per_page=2", 200, 32)
+
+
+def test_http_stream_error(mocker):
+    routes = {("GET", f"{API_URL}/repository/tags"): (403, {"message": "403 Forbidden"})}
+    mocker.patch("urllib.request.urlopen", side_effect=fake_urlopen(routes, []))
+    with pytest.raises(gitlab.exceptions.GitlabHttpError, match="403 Forbidden"):
+        LiteGitlab("https://gitlab.com", "ATOKEN1234").http_stream("/projects/213145/repository/tags")
+
+
+class GzipResponse(FakeResponse):
+    headers = {"Content-Encoding": "gzip"}
+
+
+@pytest.mark.parametrize("transport, accept_encoding", [(None, "gzip"), (Transport(gzip=False), "identity")])
+def test_gzip(mocker, transport, accept_encoding):
+    body = gzip.compress(json.dumps([{"name": "v1"}] * 1000).encode("utf-8"))
+    urlopen = mocker.patch("urllib.request.urlopen", side_effect=lambda request, timeout=None: GzipResponse(body))
+    gl = LiteGitlab("https://gitlab.com", "ATOKEN1234", transport=transport)
+
+    assert gl.http_list("/projects/213145/repository/tags") == [{"name": "v1"}] * 1000
+    _, chunks = gl.http_stream("/projects/213145/repository/tags")
+    assert json.loads(b"".join(chunks)) == [{"name": "v1"}] * 1000
+    assert urlopen.call_args[0][0].headers["Accept-encoding"] == accept_encoding
@@ -0,0 +1,143 @@
+import contextvars
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from gitlab_auto_release.metrics import Metrics
+from gitlab_auto_release.metrics import get_endpoint
+from gitlab_auto_release.session import MetricsAdapter
+
+
+class RetriedAdapter(BaseAdapter):
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["X-Gitlab-Auto-Release-Retries"] = "2"
+        response._content = b"{}"
+        return response
+
+
+@pytest.mark.parametrize(
+    "url, endpoint",
+    [
+        ("https://gitlab.com/api/v4/projects/1", "/api/v4/projects/:id"),
+        ("https://gitlab.com/api/v4/projects/group%2Fproject/releases", "/api/v4/projects/:id/releases"),
+        ("http://localhost:8080/api/v4/projects/1/pipelines/2/jobs?page=3", "/api/v4/projects/:id/pipelines/:id/jobs"),
+        ("https://gitlab.com/api/v4/projects/1/releases/release%2F0.5.0", "/api/v4/projects/:id/releases/:id"),
+        (
+            "https://gitlab.com/api/v4/projects/1/packages/generic/assets/0.5.0/app.zip",
+            "/api/v4/projects/:id/packages/generic/:package/:version/:file",
+        ),
+    ],
+)
+def test_get_endpoint(url, endpoint):
+    assert get_endpoint(url) == endpoint
+
+
+def test_phases_from_threads():
+    metrics = Metrics()
+    with metrics.phase("total"):
+        thread = threading.Thread(target=metrics.timed("changelog", lambda: None))
+        thread.start()
+        thread.join()
+
+    assert [phase["name"] for phase in metrics.phases] == ["changelog", "total"]
+    assert metrics.phases[1]["duration"] >= metrics.phases[0]["duration"]
+
+
+def test_requests_from_copied_context():
+    metrics = Metrics()
+    with metrics.phase("artifacts"), ThreadPoolExecutor(max_workers=2) as executor:
+        record = functools.partial(metrics.record_request, "GET", "https://gitlab.com/api/v4/projects/5", 200, 2, 0.1)
+        executor.submit(contextvars.copy_context().run, record).result()
+        executor.submit(record).result()
+
+    assert [request["phase"] for request in metrics.requests] == ["artifacts", None]
+
+
+def test_phase_recorded_on_error():
+    metrics = Metrics()
+    with pytest.raises(SystemExit):
+        with metrics.phase("get_project"):
+            raise SystemExit(1)
+    assert metrics.phases[0]["name"] == "get_project"
+
+
+def test_to_jsonl():
+    metrics = Metrics()
+    metrics.record_request("GET", "https://gitlab.com/api/v4/projects/1", 200, 51, 0.5, retries=1, cache="miss")
+    records = [json.loads(line) for line in metrics.to_jsonl().splitlines()]
+    assert records == [
+        {
+            "type": "request",
+            "method": "GET",
+            "endpoint": "/api/v4/projects/:id",
+            "status": 200,
+            "bytes": 51,
+            "latency": 0.5,
+            "retries": 1,
+            "cache": "miss",
+            "phase": None,
+        }
+    ]
+
+
+def test_to_openmetrics():
+    metrics = Metrics()
+    with metrics.phase("create_release"):
+        pass
+    for _ in range(2):
+        metrics.record_request("GET", "https://gitlab.com/api/v4/projects/1/pipelines/2/jobs", 200, 100, 0.25, 1)
+
+    lines = metrics.to_openmetrics().splitlines()
+    labels = 'method="GET",endpoint="/api/v4/projects/:id/pipelines/:id/jobs",status="200"'
+    assert f"gitlab_auto_release_requests_total{{{labels}}} 2" in lines
+    assert f"gitlab_auto_release_request_seconds_sum{{{labels}}} 0.5" in lines
+    assert f"gitlab_auto_release_request_seconds_count{{{labels}}} 2" in lines
+    assert f"gitlab_auto_release_response_bytes_total{{{labels}}} 200" in lines
+    assert f"gitlab_auto_release_request_retries_total{{{labels}}} 2" in lines
+    assert any(line.startswith('gitlab_auto_release_phase_seconds{phase="create_release"}') for line in lines)
+    assert lines[-1] == "# EOF"
+
+
+def test_profile():
+    metrics = Metrics(profile=True)
+    with metrics.phase("changelog"):
+        sorted(range(1000))
+    metrics.stop()
+
+    assert metrics.peak_memory > 0
+    assert "Peak memory" in metrics.profile_summary()
+
+
+def test_metrics_adapter():
+    metrics = Metrics()
+    session = requests.Session()
+    session.mount("https://", MetricsAdapter(RetriedAdapter(), metrics))
+    session.get("https://gitlab.com/api/v4/projects/1")
+
+    request = metrics.requests[0]
+    assert (request["method"], request["endpoint"], request["status"]) == ("GET", "/api/v4/projects/:id", 200)
+    assert request["bytes"] == 2
+    assert request["retries"] == 2
+
+
+def test_plan_summary():
+    metrics = Metrics()
+    with metrics.phase("get_project"):
+        metrics.record_request("GET", "https://gitlab.com/api/v4/projects/1", 200, 51, 0.2)
+    metrics.record_request("GET", "https://gitlab.com/api/v4/projects/1/releases/v1", 404, 10, 0.4)
+    metrics.plan("create_release", 1)
+    metrics.plan("uploads", 6, rounds=2)
+    lines = metrics.plan_summary().splitlines()
+    assert lines[1].split() == ["get_project", "1", lines[1].split()[2], "observed"]
+    assert lines[2].split() == ["other", "1", "0.000", "observed"]
+    assert lines[3].split() == ["create_release", "1", "0.300", "predicted"]
+    assert lines[4].split() == ["uploads", "6", "0.600", "predicted"]
+    assert lines[5].split()[:2] == ["total", "9"]
+    assert [record["phase"] for record in metrics.requests] == ["get_project", None]
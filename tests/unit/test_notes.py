@@ -0,0 +1,134 @@
+import json
+
+import pytest
+
+from gitlab_auto_release.notes import BREAKING_HEADING
+from gitlab_auto_release.notes import OTHER_HEADING
+from gitlab_auto_release.notes import NotesCache
+from gitlab_auto_release.notes import find_tags
+from gitlab_auto_release.notes import generate_notes
+from gitlab_auto_release.notes import get_heading
+from gitlab_auto_release.notes import group_changes
+
+
+def get_tag(name, sha):
+    return {"name": name, "commit": {"id": sha, "committed_date": f"{sha}-date"}}
+
+
+def get_commit(sha, title, parents):
+    return {"id": sha, "short_id": sha[:8], "title": title, "message": title, "parent_ids": parents}
+
+
+class FakeGitlab:
+    """Tags are streamed a page at a time, the compare and merge request endpoints return fixed responses."""
+
+    def __init__(self, tags, commits=(), merge_requests=(), per_page=100):
+        self.tags = tags
+        self.commits = list(commits)
+        self.merge_requests = list(merge_requests)
+        self.per_page = per_page
+        self.requests = []
+
+    def http_stream(self, path, query_data=None):
+        self.requests.append((path, dict(query_data or {})))
+        headers = {"X-Next-Page": ""}
+        if path.endswith("/tags"):
+            start = (query_data["page"] - 1) * self.per_page
+            items = self.tags[start : start + self.per_page]
+            headers = {}
+        elif path.endswith("/merge_requests"):
+            items = self.merge_requests
+        else:
+            items = list(reversed(self.commits))
+        return headers, [json.dumps(items).encode("utf-8")]
+
+    def http_get(self, path, query_data=None):
+        self.requests.append((path, dict(query_data or {})))
+        return {"commits": self.commits}
+
+
+TAGS = [
+    get_tag("release/2.0.0", "c5"),
+    get_tag("release/2.0.0-rc1", "c4"),
+    get_tag("release/1.1.0", "c3"),
+    get_tag("release/1.0.0", "c1"),
+]
+
+
+def test_find_tags_previous():
+    tag, previous = find_tags(FakeGitlab(TAGS), 1, "release/2.0.0")
+    assert tag["name"] == "release/2.0.0"
+    assert previous["name"] == "release/1.1.0"
+
+
+def test_find_tags_previous_tag(monkeypatch):
+    monkeypatch.setattr("gitlab_auto_release.notes.PER_PAGE", 1)
+    gl = FakeGitlab(TAGS, per_page=1)
+    tag, previous = find_tags(gl, 1, "release/2.0.0", previous_tag="release/1.0.0")
+    assert previous["name"] == "release/1.0.0"
+    assert [query["page"] for _, query in gl.requests] == [1, 2, 3, 4]
+
+
+def test_find_tags_first_tag():
+    tag, previous = find_tags(FakeGitlab(TAGS), 1, "release/1.0.0")
+    assert tag["name"] == "release/1.0.0"
+    assert previous is None
+
+
+@pytest.mark.parametrize("previous_tag", [None, "release/0.1.0"])
+def test_find_tags_missing(previous_tag):
+    tag_name = "release/3.0.0" if previous_tag is None else "release/2.0.0"
+    with pytest.raises(ValueError, match=previous_tag or tag_name):
+        find_tags(FakeGitlab(TAGS), 1, tag_name, previous_tag=previous_tag)
+
+
+@pytest.mark.parametrize(
+    "title, message, labels, expected",
+    [
+        ("feat: add notes", "", None, ("Features", "add notes")),
+        ("fix(cli): exit code", "", ["bug"], ("Bug Fixes", "**cli:** exit code")),
+        ("feat!: drop python 3.5", "", None, (BREAKING_HEADING, "drop python 3.5")),
+        ("refactor: args", "BREAKING CHANGE: renamed", None, (BREAKING_HEADING, "args")),
+        ("Add notes", "", ["enhancement", "docs"], ("enhancement", "Add notes")),
+        ("unknown: Add notes", "", None, (OTHER_HEADING, "unknown: Add notes")),
+    ],
+)
+def test_get_heading(title, message, labels, expected):
+    assert get_heading(title, message, labels) == expected
+
+
+def test_group_changes():
+    commits = [
+        get_commit("c5", "Merge branch 'notes'", ["c3", "c4"]),
+        get_commit("c4", "feat: notes", ["c2"]),
+        get_commit("c3", "fix: pushed to master", ["c2"]),
+        get_commit("c2", "Update README", ["c1"]),
+    ]
+    merge_requests = [{"iid": 7, "title": "feat: generate notes", "sha": "c4", "merge_commit_sha": "c5"}]
+    groups = group_changes(commits, merge_requests, "c5")
+    assert groups == {
+        "Features": ["generate notes (!7)"],
+        "Bug Fixes": ["pushed to master (c3)"],
+        OTHER_HEADING: ["Update README (c2)"],
+    }
+    assert list(groups) == ["Features", "Bug Fixes", OTHER_HEADING]
+
+
+def test_generate_notes(tmp_path):
+    commits = [get_commit("c2", "fix: the bug", ["c1"]), get_commit("c3", "feat: the feature", ["c2"])]
+    merge_requests = [
+        {"iid": 2, "title": "feat: the feature", "sha": "c3", "merge_commit_sha": None},
+        {"iid": 1, "title": "feat: an old feature", "sha": "c0", "merge_commit_sha": None},
+    ]
+    gl = FakeGitlab([get_tag("v1.1.0", "c3"), get_tag("v1.0.0", "c1")], commits, merge_requests)
+    cache = NotesCache(str(tmp_path))
+
+    notes = generate_notes(gl, 1, "v1.1.0", cache=cache)
+    assert notes == "### Features\n- the feature (!2)\n\n### Bug Fixes\n- the bug (c2)\n"
+    assert gl.requests[1] == ("/projects/1/repository/compare", {"from": "c1", "to": "c3"})
+    assert gl.requests[2][1]["updated_after"] == "c1-date"
+
+    gl.requests = []
+    assert generate_notes(gl, 1, "v1.1.0", cache=cache) == notes
+    assert [path for path, _ in gl.requests] == ["/projects/1/repository/tags"]
+    cache.close()
@@ -0,0 +1,143 @@
+import json
+import threading
+
+import pytest
+import requests
+
+from gitlab_auto_release.pager import ChunkReader
+from gitlab_auto_release.pager import decode_items
+from gitlab_auto_release.pager import iter_json_array
+from gitlab_auto_release.pager import iter_list
+from gitlab_auto_release.pager import stream_page
+
+ITEMS = [{"id": 1, "name": "ünïcode ] , [", "nested": [1, 2.5, None]}, 12345, "text", [], {"deep": {"a": [True]}}]
+
+
+class FakeGitlab:
+    """Streams `items` a page at a time, a few bytes per chunk so the items are split across chunks."""
+
+    def __init__(self, items, next_page_header=True, chunk_size=7, fail_on_page=None):
+        self.items = items
+        self.next_page_header = next_page_header
+        self.chunk_size = chunk_size
+        self.fail_on_page = fail_on_page
+        self.pages = []
+        self.closed = []
+
+    def http_stream(self, path, query_data=None):
+        page, per_page = query_data["page"], query_data["per_page"]
+        self.pages.append(page)
+        if page == self.fail_on_page:
+            raise RuntimeError("Page failed.")
+
+        headers = {}
+        if self.next_page_header:
+            headers["X-Next-Page"] = str(page + 1) if page * per_page < len(self.items) else ""
+        body = json.dumps(self.items[(page - 1) * per_page : page * per_page]).encode("utf-8")
+        return headers, self._chunks(page, body)
+
+    def _chunks(self, page, body):
+        try:
+            for start in range(0, len(body), self.chunk_size):
+                yield body[start : start + self.chunk_size]
+        finally:
+            self.closed.append(page)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_iter_json_array(chunk_size):
+    body = json.dumps(ITEMS, indent=2).encode("utf-8")
+    chunks = [body[start : start + chunk_size] for start in range(0, len(body), chunk_size)]
+    assert list(iter_json_array(chunks)) == ITEMS
+
+
+def test_iter_json_array_number_at_end_of_chunk():
+    assert list(iter_json_array([b"[12", b"34, 5", b"6]"])) == [1234, 56]
+
+
+def test_iter_json_array_yields_items_as_they_arrive():
+    items = iter_json_array(iter([b'[{"id": 1}, {"id"', b": 2}]"]))
+    assert next(items) == {"id": 1}
+    assert next(items) == {"id": 2}
+
+
+@pytest.mark.parametrize("body", [b"", b'{"message": "Not an array"}', b'[{"id": 1}, {"id"', b"[1, tru]"])
+def test_iter_json_array_invalid(body):
+    with pytest.raises(ValueError):
+        list(iter_json_array([body]))
+
+
+def test_chunk_reader_skips_empty_chunks():
+    reader = ChunkReader([b"[1", b"", b"]"])
+    assert [reader.read(0), reader.read(), reader.read(), reader.read()] == [b"", b"[1", b"]", b""]
+
+
+def test_decode_items_ijson():
+    pytest.importorskip("ijson")
+    body = json.dumps(ITEMS).encode("utf-8")
+    assert list(decode_items(body[start : start + 3] for start in range(0, len(body), 3))) == ITEMS
+
+
+def test_decode_items_without_ijson(monkeypatch):
+    monkeypatch.setattr("gitlab_auto_release.pager.get_ijson", lambda: None)
+    assert list(decode_items([b"[1,", b" 2]"])) == [1, 2]
+
+
+@pytest.mark.parametrize("next_page_header", [True, False])
+@pytest.mark.parametrize("prefetch", [0, 3])
+def test_iter_list(next_page_header, prefetch):
+    items = [{"id": item} for item in range(10)]
+    gl = FakeGitlab(items, next_page_header=next_page_header)
+    assert list(iter_list(gl, "/projects/1/repository/tags", per_page=5, prefetch=prefetch)) == items
+    # Without the header, a full last page is only known to be the last once the next (empty) page is listed.
+    assert gl.pages == ([1, 2] if next_page_header else [1, 2, 3])
+
+
+def test_iter_list_stops_early():
+    gl = FakeGitlab([{"id": item} for item in range(10)])
+    for item in iter_list(gl, "/projects/1/repository/tags", per_page=5, prefetch=0):
+        if item["id"] == 2:
+            break
+    assert gl.pages == [1]
+    assert gl.closed == [1]
+
+
+def test_iter_list_prefetch_overlaps_pages():
+    fetched = threading.Event()
+
+    class SlowConsumerGitlab(FakeGitlab):
+        def http_stream(self, path, query_data=None):
+            if query_data["page"] == 2:
+                fetched.set()
+            return super().http_stream(path, query_data)
+
+    gl = SlowConsumerGitlab([{"id": item} for item in range(4)])
+    items = iter_list(gl, "/projects/1/repository/tags", per_page=2, prefetch=10)
+    assert next(items) == {"id": 0}
+    # The second page is requested while the caller is still working through the first one.
+    assert fetched.wait(timeout=5)
+    assert list(items) == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+
+def test_iter_list_prefetch_error():
+    gl = FakeGitlab([{"id": item} for item in range(4)], fail_on_page=2)
+    items = iter_list(gl, "/projects/1/repository/tags", per_page=2, prefetch=10)
+    assert [next(items), next(items)] == [{"id": 0}, {"id": 1}]
+    with pytest.raises(RuntimeError, match="Page failed."):
+        next(items)
+
+
+def test_stream_page_python_gitlab(mocker):
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["X-Next-Page"] = "2"
+    response.raw = mocker.MagicMock()
+    response.raw.stream.return_value = iter([b'[{"id":', b" 1}]"])
+    gl = mocker.MagicMock(spec=["http_request"])
+    gl.http_request.return_value = response
+
+    headers, chunks = stream_page(gl, "/projects/1/repository/tags", {"page": 1})
+    assert headers["x-next-page"] == "2"
+    assert json.loads(b"".join(chunks)) == [{"id": 1}]
+    gl.http_request.assert_called_once_with("get", "/projects/1/repository/tags", query_data={"page": 1}, streamed=True)
+    response.raw.release_conn.assert_called_once()
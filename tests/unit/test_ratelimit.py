@@ -0,0 +1,11 @@
+import time
+
+from gitlab_auto_release.ratelimit import TokenBucket
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=50, capacity=2)
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert time.monotonic() - start >= 0.035
@@ -0,0 +1,116 @@
+import time
+
+import gitlab
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from gitlab_auto_release.scheduler import RequestScheduler
+from gitlab_auto_release.scheduler import get_retry_after
+from gitlab_auto_release.session import SchedulingAdapter
+from gitlab_auto_release.session import get_gitlab
+
+URL = "https://gitlab.com/api/v4/projects/213145/releases"
+
+
+class ScriptedAdapter(BaseAdapter):
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        item = self.responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+
+        status_code, headers = item
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers.update(headers)
+        response.request = request
+        response._content = b"{}"
+        response._content_consumed = True
+        return response
+
+    def close(self):
+        pass
+
+
+def get_session(responses, **kwargs):
+    adapter = ScriptedAdapter(responses)
+    scheduler = RequestScheduler(backoff=0.001, **kwargs)
+    session = requests.Session()
+    session.mount("https://", SchedulingAdapter(adapter, scheduler))
+    return session, adapter, scheduler
+
+
+def test_retry_server_error():
+    session, adapter, scheduler = get_session([(502, {}), (503, {}), (200, {})])
+    assert session.get(URL).status_code == 200
+    assert adapter.sent == 3
+    assert scheduler.stats()["retries"] == 2
+    assert scheduler.stats()["server_errors"] == 2
+
+
+def test_retry_connection_error():
+    session, adapter, _ = get_session([requests.exceptions.ConnectionError(), (200, {})])
+    assert session.get(URL).status_code == 200
+    assert adapter.sent == 2
+
+
+def test_post_not_retried_on_server_error():
+    session, adapter, _ = get_session([(502, {}), (201, {})])
+    assert session.post(URL, json={}).status_code == 502
+    assert adapter.sent == 1
+
+
+def test_post_retried_when_rate_limited():
+    session, adapter, scheduler = get_session([(429, {"Retry-After": "0"}), (201, {})])
+    assert session.post(URL, json={}).status_code == 201
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_max_retries():
+    session, adapter, _ = get_session([(500, {}), (500, {}), (500, {})], max_retries=2)
+    assert session.get(URL).status_code == 500
+    assert adapter.sent == 3
+
+
+def test_wait_until_reset():
+    reset = time.time() + 0.1
+    session, _, scheduler = get_session([(200, {"RateLimit-Remaining": "0", "RateLimit-Reset": str(reset)}), (200, {})])
+    session.get(URL)
+    session.get(URL)
+    assert time.time() >= reset
+    assert scheduler.stats()["waited"] > 0
+
+
+def test_rate_from_headers():
+    session, _, scheduler = get_session([(200, {"RateLimit-Limit": "600"})])
+    session.get(URL)
+    assert scheduler.bucket.rate == 10
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [({}, None), ({"Retry-After": "3"}, 3), ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0)],
+)
+def test_get_retry_after(headers, expected):
+    response = requests.Response()
+    response.headers.update(headers)
+    assert get_retry_after(response) == expected
+
+
+def test_retries_header():
+    session, _, _ = get_session([(502, {}), (200, {})])
+    assert session.get(URL).headers["X-Gitlab-Auto-Release-Retries"] == "1"
+
+
+def test_gitlab_doesnt_retry_on_top_of_scheduler():
+    session, adapter, scheduler = get_session([(429, {"Retry-After": "0"})] * 5, max_retries=2)
+    gl = get_gitlab("https://gitlab.com", "ATOKEN1234", session=session, scheduler=scheduler)
+    with pytest.raises(gitlab.exceptions.GitlabHttpError):
+        gl.http_get("/projects/213145/releases")
+    assert adapter.sent == 3
@@ -0,0 +1,215 @@
+import asyncio
+import http.client
+import json
+import re
+import threading
+import time
+
+import pytest
+
+from gitlab_auto_release.server import HTTPError
+from gitlab_auto_release.server import ReleaseQueue
+from gitlab_auto_release.server import ReleaseServer
+from gitlab_auto_release.server import get_changelog_entry
+from gitlab_auto_release.server import get_webhook_entry
+from gitlab_auto_release.server import is_loopback
+from gitlab_auto_release.server import serve
+from gitlab_auto_release.server import server
+
+
+def get_event(tag_name="release/1.0.0", after="a" * 40, object_kind="tag_push"):
+    return {"object_kind": object_kind, "project_id": 5, "ref": f"refs/tags/{tag_name}", "after": after}
+
+
+class FakeProcess:
+    """Records the releases as they're created, and how many were created at once."""
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.created = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, entry):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+            self.created.append((entry["project_id"], entry["tag_name"]))
+        if entry["tag_name"] == "broken":
+            raise RuntimeError("boom")
+        return entry, "created", "Created release."
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def app(loop):
+    """Starts the server on a free port in a thread, requests are sent from the test."""
+    process = FakeProcess()
+    queue = ReleaseQueue(process, workers=2)
+    app = ReleaseServer(queue, secret="s3cret", tag_pattern=re.compile("^release/"))
+    app.process = process
+    started = threading.Event()
+    stop = asyncio.Event()
+
+    def on_started(port):
+        app.port = port
+        started.set()
+
+    thread = threading.Thread(target=lambda: run_server(loop, app, stop, on_started))
+    thread.start()
+    started.wait(5)
+    yield app
+    loop.call_soon_threadsafe(stop.set)
+    thread.join(5)
+    queue.close()
+
+
+def run_server(loop, app, stop, started):
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(serve(app, "127.0.0.1", 0, stop, started=started))
+
+
+def request(app, method, path, body=None, token="s3cret"):
+    connection = http.client.HTTPConnection("127.0.0.1", app.port, timeout=5)
+    headers = {"X-Gitlab-Token": token} if token else {}
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+@pytest.mark.parametrize(
+    "event, expected",
+    [
+        (get_event(), {"project_id": 5, "tag_name": "release/1.0.0", "notes": True}),
+        (get_event(after="0" * 40), None),
+        (get_event("v1.0.0"), None),
+        (get_event(object_kind="push"), None),
+        ([], None),
+    ],
+)
+def test_get_webhook_entry(event, expected):
+    assert get_webhook_entry(event, re.compile("^release/"), notes=True) == expected
+
+
+def test_get_changelog_entry(tmp_path):
+    root = tmp_path / "changelogs"
+    root.mkdir()
+    entry = {"project_id": 1, "tag_name": "v1", "changelog": "app/CHANGELOG.md"}
+    assert get_changelog_entry(entry, str(root))["changelog"] == str(root / "app" / "CHANGELOG.md")
+    assert get_changelog_entry({"project_id": 1}, None) == {"project_id": 1}
+
+
+@pytest.mark.parametrize("changelog, root", [("CHANGELOG.md", None), ("../CHANGELOG.md", "."), ("/etc/passwd", ".")])
+def test_get_changelog_entry_rejected(tmp_path, changelog, root):
+    with pytest.raises(HTTPError):
+        get_changelog_entry({"changelog": changelog}, str(tmp_path / root) if root else None)
+
+
+@pytest.mark.parametrize(
+    "host, expected", [("127.0.0.1", True), ("::1", True), ("localhost", True), ("0.0.0.0", False), ("example", False)]
+)
+def test_is_loopback(host, expected):
+    assert is_loopback(host) == expected
+
+
+def test_server_requires_secret(runner):
+    args = ["--private-token", "ATOKEN1234", "--gitlab-url", "https://gitlab.com", "--host", "0.0.0.0"]
+    result = runner.invoke(server, args)
+    assert result.exit_code == 1
+    assert "--webhook-secret is required to listen on 0.0.0.0" in result.output
+
+
+def test_queue_orders_releases_per_project(loop):
+    process = FakeProcess()
+    queue = ReleaseQueue(process, workers=3)
+    entries = [{"project_id": project_id, "tag_name": f"v{n}"} for n in range(4) for project_id in (1, 2, 3)]
+
+    async def run():
+        return await asyncio.gather(*[queue.put(entry) for entry in entries])
+
+    results = loop.run_until_complete(run())
+    queue.close()
+    assert [status for _, status, _ in results] == ["created"] * 12
+    for project_id in (1, 2, 3):
+        assert [tag for project, tag in process.created if project == project_id] == ["v0", "v1", "v2", "v3"]
+    assert process.max_running == 3
+    assert queue.stats() == {"queued": 0, "running": 0, "created": 12, "exists": 0, "failed": 0, "projects": 0}
+
+
+def test_queue_limits_workers(loop):
+    process = FakeProcess()
+    queue = ReleaseQueue(process, workers=2)
+
+    async def run():
+        await asyncio.gather(*[queue.put({"project_id": n, "tag_name": "v1"}) for n in range(6)])
+
+    loop.run_until_complete(run())
+    queue.close()
+    assert process.max_running == 2
+
+
+def test_queue_failed_release(loop):
+    queue = ReleaseQueue(FakeProcess(), workers=1)
+
+    async def run():
+        return await asyncio.gather(
+            queue.put({"project_id": 1, "tag_name": "broken"}), queue.put({"project_id": 1, "tag_name": "v1"})
+        )
+
+    (_, status, message), (_, next_status, _) = loop.run_until_complete(run())
+    queue.close()
+    assert (status, message, next_status) == ("failed", "boom", "created")
+
+
+def test_webhook(app):
+    assert request(app, "POST", "/webhook", get_event()) == (202, {"queued": 1})
+    assert request(app, "POST", "/webhook", get_event("v1.0.0")) == (200, {"queued": 0})
+
+
+def test_releases_wait(app):
+    body = [{"project_id": 1, "tag_name": "v1"}, {"project_id": 1, "tag_name": "v2"}]
+    status, response = request(app, "POST", "/releases?wait=true", body)
+    assert status == 200
+    assert [(release["tag_name"], release["status"]) for release in response["releases"]] == [
+        ("v1", "created"),
+        ("v2", "created"),
+    ]
+    assert request(app, "GET", "/health")[1]["created"] == 2
+
+
+@pytest.mark.parametrize(
+    "method, path, body, token, status",
+    [
+        ("POST", "/webhook", get_event(), "wrong", 401),
+        ("POST", "/releases", {"project_id": 1}, None, 401),
+        ("POST", "/releases", "v1", "s3cret", 400),
+        ("POST", "/releases", {"project_id": 1, "tag_name": "v1", "changelog": "/etc/passwd"}, "s3cret", 400),
+        ("GET", "/webhook", None, "s3cret", 405),
+        ("GET", "/unknown", None, "s3cret", 404),
+    ],
+)
+def test_errors(app, method, path, body, token, status):
+    assert request(app, method, path, body, token)[0] == status
+    assert app.process.created == []
+
+
+def test_keep_alive(app):
+    connection = http.client.HTTPConnection("127.0.0.1", app.port, timeout=5)
+    for _ in range(3):
+        connection.request("GET", "/health")
+        response = connection.getresponse()
+        assert response.status == 200
+        response.read()
+    connection.close()
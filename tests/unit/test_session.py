@@ -0,0 +1,61 @@
+import gzip
+import io
+import json
+
+import gitlab
+import pytest
+import requests
+
+from gitlab_auto_release.session import HTTP2Adapter
+from gitlab_auto_release.session import create_session
+from gitlab_auto_release.transport import Transport
+
+
+def test_create_session():
+    session = create_session(transport=Transport(pool_size=3, keep_alive=False))
+    adapter = session.get_adapter("https://gitlab.com")
+    assert adapter._pool_maxsize == 3
+    assert adapter._pool_block is True
+    assert session.headers["Connection"] == "close"
+    assert session.headers["Accept-Encoding"] == "gzip"
+    assert session.get_adapter("http://gitlab.example.com") is adapter
+
+
+def get_client(requests_made):
+    httpx = pytest.importorskip("httpx")
+
+    def handler(request):
+        requests_made.append(request)
+        if request.url.path.endswith("/releases"):
+            return httpx.Response(201, json={"tag_name": json.loads(request.read())["tag_name"]})
+        body = gzip.compress(json.dumps([{"name": "v1.0.0"}]).encode("utf-8"))
+        return httpx.Response(200, content=body, headers={"Content-Encoding": "gzip", "X-Next-Page": ""})
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_http2_adapter():
+    requests_made = []
+    transport = Transport(http2=True, keep_alive=False)
+    session = create_session(transport=transport)
+    session.mount("https://", HTTP2Adapter(transport, client=get_client(requests_made)))
+    gl = gitlab.Gitlab("https://gitlab.com", private_token="ATOKEN1234", session=session)
+
+    assert gl.http_list("/projects/1/repository/tags", page=1) == [{"name": "v1.0.0"}]
+    assert gl.http_post("/projects/1/releases", post_data={"tag_name": "v1.0.0"}) == {"tag_name": "v1.0.0"}
+    assert requests_made[0].headers["PRIVATE-TOKEN"] == "ATOKEN1234"
+    assert requests_made[0].headers.get("connection") != "close"
+
+
+def test_http2_adapter_stream():
+    requests_made = []
+    adapter = HTTP2Adapter(Transport(http2=True), client=get_client(requests_made))
+    session = requests.Session()
+    session.mount("https://", adapter)
+
+    response = session.get("https://gitlab.com/api/v4/projects/1/repository/tags", stream=True)
+    assert response.headers["X-Next-Page"] == ""
+    assert json.loads(b"".join(response.iter_content(4))) == [{"name": "v1.0.0"}]
+
+    upload = session.put("https://gitlab.com/api/v4/projects/1/releases", data=io.BytesIO(b'{"tag_name": "v2"}'))
+    assert upload.json() == {"tag_name": "v2"}
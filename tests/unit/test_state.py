@@ -0,0 +1,21 @@
+from gitlab_auto_release.state import ReleaseState
+
+
+def test_release_state(tmp_path):
+    state = ReleaseState(str(tmp_path / "state.sqlite"))
+    assert state.get(1, "v1.0.0") is None
+
+    release = {"name": "v1.0.0", "tag_name": "v1.0.0", "description": "Changes", "assets": {"links": []}}
+    state.put(1, "v1.0.0", "pending")
+    state.put(1, "v1.0.0", "resolved", release)
+    state.put("1", "v1.0.0", "failed", message="Token expired")
+    assert state.get(1, "v1.0.0") == ("failed", release)
+    assert not state.is_completed(1, "v1.0.0")
+
+    state.put(1, "v1.0.0", "exists")
+    state.put(2, "v1.0.0", "created")
+    state.close()
+
+    state = ReleaseState(str(tmp_path / "state.sqlite"))
+    assert state.is_completed(1, "v1.0.0")
+    assert state.counts() == {"created": 1, "exists": 1}
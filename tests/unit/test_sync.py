@@ -0,0 +1,133 @@
+import threading
+
+import pytest
+
+from gitlab_auto_release.sync import diff_release
+from gitlab_auto_release.sync import sync_release
+
+
+def get_release(description="Changes", links=()):
+    return {"name": "v1.0.0", "tag_name": "v1.0.0", "description": description, "assets": {"links": list(links)}}
+
+
+EXISTING = get_release(
+    "Changes\n",
+    [
+        {"id": 1, "name": "docs", "url": "https://example.com/docs", "link_type": "other"},
+        {"id": 2, "name": "image", "url": "https://example.com/image"},
+        {"id": 3, "name": "old", "url": "https://example.com/old"},
+    ],
+)
+
+
+def test_diff_release_no_changes():
+    desired = get_release(
+        links=[
+            {"name": "image", "url": "https://example.com/image"},
+            {"name": "docs", "url": "https://example.com/docs"},
+            {"name": "old", "url": "https://example.com/old"},
+        ]
+    )
+    diff = diff_release(EXISTING, desired)
+    assert not diff
+    assert diff.summary() == ""
+
+
+def test_diff_release():
+    desired = get_release(
+        "New changes",
+        [
+            {"name": "docs", "url": "https://example.com/docs/v1"},
+            {"name": "picture", "url": "https://example.com/image"},
+            {"name": "binary", "url": "https://example.com/binary", "link_type": "package"},
+        ],
+    )
+    diff = diff_release(EXISTING, desired)
+    assert diff.fields == {"description": "New changes"}
+    assert diff.updated == [(1, {"url": "https://example.com/docs/v1"}), (2, {"name": "picture"})]
+    assert diff.added == [{"name": "binary", "url": "https://example.com/binary", "link_type": "package"}]
+    assert diff.deleted == [3]
+    assert diff.summary() == "description, 1 link(s) added, 2 link(s) updated, 1 link(s) removed"
+
+
+def test_diff_release_link_takes_url_of_updated_link():
+    desired = get_release(
+        links=[
+            {"name": "docs", "url": "https://example.com/docs/v1"},
+            {"name": "manual", "url": "https://example.com/docs"},
+        ]
+    )
+    diff = diff_release(EXISTING, desired)
+    assert diff.updated == [(1, {"url": "https://example.com/docs/v1"})]
+    assert diff.added == []
+    assert diff.added_last == [{"name": "manual", "url": "https://example.com/docs"}]
+    assert diff.rounds() == 3
+
+
+class FakeGitlab:
+    """Records the requests, in the order they were sent."""
+
+    def __init__(self, fail=None):
+        self.requests = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def _record(self, method, path, post_data=None):
+        with self._lock:
+            self.requests.append((method, path, post_data))
+        if method == self.fail:
+            raise ValueError(f"{method} failed")
+
+    def http_put(self, path, post_data=None):
+        self._record("PUT", path, post_data)
+
+    def http_post(self, path, post_data=None):
+        self._record("POST", path, post_data)
+
+    def http_delete(self, path):
+        self._record("DELETE", path)
+
+
+def test_sync_release():
+    gl = FakeGitlab()
+    desired = get_release(links=[{"name": "new", "url": "https://example.com/old"}])
+    sync_release(gl, 5, EXISTING, desired)
+    path = "/projects/5/releases/v1.0.0"
+    assert sorted(gl.requests[:2]) == [
+        ("DELETE", f"{path}/assets/links/1", None),
+        ("DELETE", f"{path}/assets/links/2", None),
+    ]
+    assert gl.requests[2:] == [("PUT", f"{path}/assets/links/3", {"name": "new"})]
+
+
+def test_sync_release_no_changes():
+    gl = FakeGitlab()
+    assert not sync_release(gl, 5, EXISTING, EXISTING)
+    assert gl.requests == []
+
+
+def test_sync_release_error():
+    with pytest.raises(ValueError, match="POST failed"):
+        sync_release(FakeGitlab(fail="POST"), 5, EXISTING, get_release(links=[{"name": "a", "url": "https://a"}]))
+
+
+def test_sync_release_swapped_urls():
+    gl = FakeGitlab()
+    desired = get_release(
+        "Changes",
+        [
+            {"name": "docs", "url": "https://example.com/image"},
+            {"name": "image", "url": "https://example.com/docs"},
+            {"name": "old", "url": "https://example.com/old"},
+            {"name": "new", "url": "https://example.com/new"},
+        ],
+    )
+    diff = sync_release(gl, 5, EXISTING, desired)
+    assert diff.rounds() == 3
+    path = "/projects/5/releases/v1.0.0"
+    assert gl.requests[0] == ("DELETE", f"{path}/assets/links/1", None)
+    assert sorted(gl.requests[1:3]) == [
+        ("POST", f"{path}/assets/links", {"name": "new", "url": "https://example.com/new"}),
+        ("PUT", f"{path}/assets/links/2", {"url": "https://example.com/docs"}),
+    ]
+    assert gl.requests[3:] == [("POST", f"{path}/assets/links", {"name": "docs", "url": "https://example.com/image"})]
@@ -0,0 +1,90 @@
+import socket
+
+import pytest
+
+from gitlab_auto_release.transport import DNSCache
+from gitlab_auto_release.transport import Transport
+from gitlab_auto_release.transport import get_transport
+from gitlab_auto_release.transport import install_dns_cache
+
+ADDRESSES = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("172.65.251.78", 443))]
+
+
+class FakeResolver:
+    def __init__(self):
+        self.lookups = []
+        self.fail = False
+
+    def __call__(self, host, port, *args, **kwargs):
+        self.lookups.append(host)
+        if self.fail:
+            raise socket.gaierror("Name or service not known")
+        return list(ADDRESSES)
+
+
+def test_dns_cache():
+    resolver = FakeResolver()
+    now = [0]
+    cache = DNSCache(300, resolve=resolver, clock=lambda: now[0])
+
+    assert cache.getaddrinfo("gitlab.com", 443) == ADDRESSES
+    now[0] = 299
+    assert cache.getaddrinfo("gitlab.com", 443, 0, socket.SOCK_STREAM) == ADDRESSES
+    assert cache.getaddrinfo("gitlab.com", 443, type=socket.SOCK_STREAM) == ADDRESSES
+    assert cache.getaddrinfo("gitlab.com", 443) == ADDRESSES
+    assert resolver.lookups == ["gitlab.com", "gitlab.com", "gitlab.com"]
+
+    now[0] = 300
+    cache.getaddrinfo("gitlab.com", 443)
+    assert len(resolver.lookups) == 4
+
+
+def test_dns_cache_failures_not_cached():
+    resolver = FakeResolver()
+    cache = DNSCache(300, resolve=resolver)
+    resolver.fail = True
+    with pytest.raises(socket.gaierror):
+        cache.getaddrinfo("gitlab.example.com", 443)
+    resolver.fail = False
+    assert cache.getaddrinfo("gitlab.example.com", 443) == ADDRESSES
+    assert len(resolver.lookups) == 2
+
+
+def test_install_dns_cache():
+    original = socket.getaddrinfo
+    assert install_dns_cache(0) is None
+    assert socket.getaddrinfo is original
+
+    try:
+        cache = install_dns_cache(300)
+        assert socket.getaddrinfo == cache.getaddrinfo
+        assert cache.resolve is original
+        assert install_dns_cache(60) is cache
+        assert cache.ttl == 60
+    finally:
+        assert install_dns_cache(0) is None
+    assert socket.getaddrinfo is original
+
+
+@pytest.mark.parametrize(
+    "transport, expected",
+    [
+        (Transport(), {"Accept-Encoding": "gzip"}),
+        (Transport(keep_alive=False, gzip=False), {"Accept-Encoding": "identity", "Connection": "close"}),
+    ],
+)
+def test_headers(transport, expected):
+    assert transport.headers() == expected
+
+
+def test_get_transport():
+    transport = get_transport(None, True, False, True, 0, workers=4)
+    assert transport.pool_size == 4
+    assert get_transport(2, True, False, True, 0, workers=4).pool_size == 2
+
+
+def test_get_transport_http2_missing(monkeypatch, capsys):
+    monkeypatch.setattr("gitlab_auto_release.transport.get_httpx", lambda: None)
+    with pytest.raises(SystemExit):
+        get_transport(None, True, True, True, 0)
+    assert "pip install gitlab-auto-release[http2]" in capsys.readouterr().out
@@ -0,0 +1,233 @@
+import hashlib
+import json
+from collections import namedtuple
+
+import gitlab
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from gitlab_auto_release.uploads import ChecksumError
+from gitlab_auto_release.uploads import HashingReader
+from gitlab_auto_release.uploads import UploadIndex
+from gitlab_auto_release.uploads import get_package_version
+from gitlab_auto_release.uploads import parse_upload
+from gitlab_auto_release.uploads import put_file
+from gitlab_auto_release.uploads import upload_assets
+
+Project = namedtuple("Project", "id")
+CONTENT = b"installer" * 100000
+
+
+class FakeGitlab:
+    """Reads the uploaded file a chunk at a time, like a HTTP client would."""
+
+    def __init__(self, corrupt=False, published=None, files=None):
+        self.corrupt = corrupt
+        self.published = published or {}
+        self.files = {} if files is None else files
+        self.uploaded = {}
+        self.listed = []
+        self.queries = []
+
+    def http_list(self, path, query_data=None, **kwargs):
+        self.listed.append(path)
+        self.queries.append(query_data)
+        if path.endswith("/packages"):
+            return [
+                {"id": 1, "name": "release-assets", "version": "v1.0.0"},
+                {"id": 2, "name": "release-assets", "version": "v0.9.0"},
+                {"id": 3, "name": "other", "version": "v1.0.0"},
+            ]
+        return [
+            {"file_name": name, "file_sha256": sha256, "size": len(CONTENT)} for sha256, name in self.published.items()
+        ]
+
+    def http_request(self, method, path, **kwargs):
+        if path not in self.files:
+            raise gitlab.exceptions.GitlabHttpError(response_code=404)
+
+    def http_get(self, path, **kwargs):
+        self.http_request("GET", path)
+        return json.loads(self.files[path])
+
+    def http_put_file(self, path, reader, query_data=None):
+        body = b"".join(iter(lambda: reader.read(8192), b""))
+        self.files[path] = body
+        if "-index/" not in path:
+            self.uploaded[path] = len(reader)
+        return {"file_sha256": "0" * 64 if self.corrupt else hashlib.sha256(body).hexdigest()}
+
+
+class PackageAdapter(BaseAdapter):
+    def __init__(self, status_code):
+        super().__init__()
+        self.status_code = status_code
+
+    def send(self, request, **kwargs):
+        self.body = b"".join(iter(lambda: request.body.read(8192), b""))
+        self.request = request
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = b'{"file_sha256": "abc"}'
+        return response
+
+
+@pytest.fixture
+def installer(tmpdir):
+    path = tmpdir.join("installer.exe")
+    path.write_binary(CONTENT)
+    return str(path)
+
+
+def test_hashing_reader(installer):
+    with open(installer, "rb") as f:
+        reader = HashingReader(f)
+        reader.read(100)
+        reader.seek(0)
+        assert b"".join(reader) == CONTENT
+        assert len(reader) == len(CONTENT)
+        assert reader.hexdigest() == hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.mark.parametrize(
+    "upload, expected",
+    [("dist/app.zip", ("app.zip", "dist/app.zip")), ("App=dist/app.zip", ("App", "dist/app.zip"))],
+)
+def test_parse_upload(upload, expected):
+    assert parse_upload(upload) == expected
+
+
+def test_parse_upload_invalid():
+    with pytest.raises(ValueError):
+        parse_upload("name=")
+
+
+def test_get_package_version():
+    assert get_package_version("release/0.5.0") == "release-0.5.0"
+
+
+def test_upload_assets(installer, tmpdir):
+    other = tmpdir.join("notes.txt")
+    other.write_binary(b"notes")
+    gl = FakeGitlab()
+    uploaded = upload_assets(gl, Project(id=5), [f"Installer={installer}", str(other)], "https://gitlab.com/", "v1.0.0")
+
+    assert [link["name"] for link, _, _ in uploaded] == ["Installer", "notes.txt"]
+    assert [status for _, _, status in uploaded] == ["uploaded", "uploaded"]
+    assert uploaded[0][0]["url"] == (
+        "https://gitlab.com/api/v4/projects/5/packages/generic/release-assets/v1.0.0/installer.exe"
+    )
+    assert uploaded[0][1] == hashlib.sha256(CONTENT).hexdigest()
+    assert gl.uploaded["/projects/5/packages/generic/release-assets/v1.0.0/installer.exe"] == len(CONTENT)
+
+
+def test_upload_assets_checksum_mismatch(installer):
+    with pytest.raises(ChecksumError):
+        upload_assets(FakeGitlab(corrupt=True), Project(id=5), [installer], "https://gitlab.com", "v1.0.0")
+
+
+def test_upload_assets_reuses_published_file(installer):
+    gl = FakeGitlab(published={hashlib.sha256(CONTENT).hexdigest(): "setup.exe"})
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.0")
+
+    link, _, status = uploaded[0]
+    assert status == "reused"
+    assert link["url"] == "https://gitlab.com/api/v4/projects/5/packages/generic/release-assets/v1.0.0/setup.exe"
+    assert gl.listed == ["/projects/5/packages", "/projects/5/packages/1/package_files"]
+    assert gl.queries[0]["package_version"] == "v1.0.0"
+    assert gl.uploaded == {}
+
+
+def test_upload_assets_reuses_file_from_earlier_release(installer):
+    gl = FakeGitlab()
+    upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.0")
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    assert f"/projects/5/packages/generic/release-assets-index/sha256/{sha256}" in gl.files
+    assert f"/projects/5/packages/generic/release-assets-index/size/{len(CONTENT)}" in gl.files
+
+    gl.uploaded.clear()
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.1")
+    assert uploaded[0][0]["url"].endswith("/v1.0.0/installer.exe")
+    assert uploaded[0][2] == "reused"
+    assert gl.uploaded == {}
+
+
+def test_upload_assets_hashes_once(installer, tmpdir, mocker):
+    get_digest = mocker.patch("gitlab_auto_release.uploads.get_digest")
+    index = UploadIndex(str(tmpdir.join("cache")))
+    uploaded = upload_assets(FakeGitlab(), Project(id=5), [installer], "https://gitlab.com", "v1.0.0", index=index)
+
+    assert uploaded[0][1:] == (hashlib.sha256(CONTENT).hexdigest(), "uploaded")
+    get_digest.assert_not_called()
+    assert index.get_digest(installer) == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_upload_assets_no_dedup(installer):
+    gl = FakeGitlab(published={hashlib.sha256(CONTENT).hexdigest(): "setup.exe"})
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.0", dedup=False)
+    assert uploaded[0][2] == "uploaded"
+    assert gl.listed == []
+
+
+def test_upload_assets_dry_run(installer):
+    gl = FakeGitlab()
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.0", dry_run=True)
+    link, sha256, status = uploaded[0]
+    assert status == "planned"
+    assert sha256 == hashlib.sha256(CONTENT).hexdigest()
+    assert link["url"] == "https://gitlab.com/api/v4/projects/5/packages/generic/release-assets/v1.0.0/installer.exe"
+    assert gl.uploaded == {}
+
+
+def test_upload_assets_index(installer, tmpdir):
+    index = UploadIndex(str(tmpdir.join("cache")))
+    files = {}
+    upload_assets(FakeGitlab(files=files), Project(id=5), [installer], "https://gitlab.com", "v1.0.0", index=index)
+
+    gl = FakeGitlab(files=files)
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.1", index=index)
+    assert uploaded[0][0]["url"].endswith("/v1.0.0/installer.exe")
+    assert uploaded[0][2] == "reused"
+    assert gl.listed == []
+
+
+def test_upload_assets_index_deleted_file(installer, tmpdir):
+    index = UploadIndex(str(tmpdir.join("cache")))
+    files = {}
+    upload_assets(FakeGitlab(files=files), Project(id=5), [installer], "https://gitlab.com", "v1.0.0", index=index)
+
+    del files["/projects/5/packages/generic/release-assets/v1.0.0/installer.exe"]
+    gl = FakeGitlab(files=files)
+    uploaded = upload_assets(gl, Project(id=5), [installer], "https://gitlab.com", "v1.0.1", index=index)
+    assert uploaded[0][2] == "uploaded"
+    assert index.get(hashlib.sha256(CONTENT).hexdigest(), 5).endswith("/v1.0.1/installer.exe")
+
+
+def test_upload_index_digest(installer, tmpdir, mocker):
+    index = UploadIndex(str(tmpdir.join("cache")))
+    assert index.get_digest(installer) == hashlib.sha256(CONTENT).hexdigest()
+    get_digest = mocker.patch("gitlab_auto_release.uploads.get_digest")
+    assert index.get_digest(installer) == hashlib.sha256(CONTENT).hexdigest()
+    get_digest.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "status_code, exception", [(201, None), (400, "GitlabUploadError"), (401, "GitlabAuthenticationError")]
+)
+def test_put_file(installer, status_code, exception):
+    adapter = PackageAdapter(status_code)
+    gl = gitlab.Gitlab("https://gitlab.com", private_token="ATOKEN1234")
+    gl.session.mount("https://", adapter)
+
+    with open(installer, "rb") as f:
+        if exception:
+            with pytest.raises(getattr(gitlab.exceptions, exception)):
+                put_file(gl, "/projects/5/packages/generic/assets/1.0.0/installer.exe", HashingReader(f))
+            return
+        response = put_file(gl, "/projects/5/packages/generic/assets/1.0.0/installer.exe", HashingReader(f))
+
+    assert response == {"file_sha256": "abc"}
+    assert adapter.body == CONTENT
+    assert adapter.request.headers["Content-Length"] == str(len(CONTENT))
+    assert adapter.request.headers["PRIVATE-TOKEN"] == "ATOKEN1234"
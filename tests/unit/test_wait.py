@@ -0,0 +1,112 @@
+from collections import namedtuple
+
+import pytest
+
+from gitlab_auto_release.wait import JobFailedError
+from gitlab_auto_release.wait import WaitTimeoutError
+from gitlab_auto_release.wait import wait_for_jobs
+
+Job = namedtuple("Job", "id status")
+
+
+class FakeGitlab:
+    """Each job's statuses are returned in order, the last one is repeated (as a 304) once they run out."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.polled = []
+
+    def http_get_conditional(self, path, etag=None):
+        job_id = int(path.rsplit("/", 1)[-1])
+        self.polled.append((job_id, etag))
+        statuses = self.statuses[job_id]
+        if len(statuses) > 1:
+            statuses.pop(0)
+            return {"id": job_id, "status": statuses[0]}, f"etag-{len(statuses)}"
+        return None, etag
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def get_resolve(pipelines):
+    """Each call to resolve lists the next version of the pipeline's jobs, the last is repeated."""
+    resolved = []
+
+    def resolve(names):
+        jobs = pipelines[min(len(resolved), len(pipelines) - 1)]
+        resolved.append(list(names))
+        return {job_name: (job, 1) for job_name, job in jobs.items() if job_name in names}
+
+    resolve.calls = resolved
+    return resolve
+
+
+def wait(gl, resolve, names, clock, timeout=60):
+    return wait_for_jobs(
+        gl, resolve, names, timeout=timeout, min_interval=1, max_interval=4, sleep=clock.sleep, clock=clock
+    )
+
+
+def test_wait_for_jobs_already_succeeded():
+    clock = FakeClock()
+    gl = FakeGitlab({})
+    jobs = wait(gl, get_resolve([{"build": Job(1, "success")}]), ["build"], clock)
+    assert jobs == {"build": (Job(1, "success"), 1)}
+    assert gl.polled == []
+    assert clock.sleeps == []
+
+
+def test_wait_for_jobs_polls_running_jobs():
+    clock = FakeClock()
+    gl = FakeGitlab({1: ["running", "running", "success"], 2: ["pending", "running", "running", "success"]})
+    resolve = get_resolve([{"build": Job(1, "running"), "docs": Job(2, "pending")}])
+    jobs = wait(gl, resolve, ["build", "docs"], clock)
+    assert jobs == {"build": (Job(1, "running"), 1), "docs": (Job(2, "pending"), 1)}
+    assert resolve.calls == [["build", "docs"]]
+    assert gl.polled[:2] == [(1, None), (2, None)]
+    assert (1, "etag-2") in gl.polled
+
+
+def test_wait_for_jobs_backs_off():
+    clock = FakeClock()
+    gl = FakeGitlab({1: ["running", "running"]})
+    with pytest.raises(WaitTimeoutError):
+        wait(gl, get_resolve([{"build": Job(1, "running")}]), ["build"], clock, timeout=20)
+    assert clock.sleeps[:5] == [1, 1.5, 2.25, 3.375, 4]
+    assert max(clock.sleeps) == 4
+    assert sum(clock.sleeps) == 20
+
+
+def test_wait_for_jobs_not_created_yet():
+    clock = FakeClock()
+    gl = FakeGitlab({})
+    resolve = get_resolve([{}, {}, {"child-build": Job(3, "success")}])
+    jobs = wait(gl, resolve, ["child-build"], clock)
+    assert jobs == {"child-build": (Job(3, "success"), 1)}
+    assert len(resolve.calls) == 3
+
+
+def test_wait_for_jobs_retried():
+    clock = FakeClock()
+    gl = FakeGitlab({1: ["running", "failed"]})
+    resolve = get_resolve([{"build": Job(1, "running")}, {"build": Job(2, "success")}])
+    jobs = wait(gl, resolve, ["build"], clock)
+    assert jobs == {"build": (Job(2, "success"), 1)}
+
+
+def test_wait_for_jobs_failed():
+    clock = FakeClock()
+    gl = FakeGitlab({1: ["running", "failed"]})
+    with pytest.raises(JobFailedError, match="build"):
+        wait(gl, get_resolve([{"build": Job(1, "running")}, {"build": Job(1, "failed")}]), ["build"], clock)